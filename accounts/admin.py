@@ -1,26 +1,40 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import Account, UserProfile
+from django.db.models import Q
 from django.utils.html import format_html
+from store.admin_helpers import ScalableAdmin, prefix_range
 
 
-class AccountAdmin(UserAdmin):
+class AccountAdmin(ScalableAdmin, UserAdmin):
     list_display = ('email', 'first_name', 'last_name',
                     'username', 'last_login', 'date_joined', 'is_active')
     list_display_links = ('email', 'first_name', 'last_name')
     readonly_fields = ('last_login', 'date_joined')
     ordering = ('-date_joined',)
+    # Also used by the user search boxes of the other admin pages
+    search_fields = ('email', 'username')
+    search_help_text = 'Beginning of the email address or username'
 
     filter_horizontal = ()
     list_filter = ()
     fieldsets = ()
 
+    def get_search_results(self, request, queryset, search_term):
+        # Both columns are unique, so indexed; icontains on four columns reads every account
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(Q(**prefix_range('email', term)) | Q(**prefix_range('username', term))), False
 
-class UserProfileAdmin(admin.ModelAdmin):
+
+class UserProfileAdmin(ScalableAdmin):
     def thumbnail(self, object):
         return format_html('<img src="{}" width="30" style="border-radius:50%;">'.format(object.profile_picture.url))
     thumbnail.short_description = 'Profile Picture'
     list_display = ('thumbnail', 'user', 'city', 'state', 'country')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
 
 
 admin.site.register(Account, AccountAdmin)
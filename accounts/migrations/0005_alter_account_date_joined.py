@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_userprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='date_joined',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -61,7 +61,7 @@ class Account(AbstractBaseUser):
 
     # Required fields for user model
     date_joined = models.DateTimeField(
-        auto_now_add=True)  # Timestamp when user joined
+        auto_now_add=True, db_index=True)  # Timestamp when user joined, indexed for the admin list order
     last_login = models.DateTimeField(
         auto_now_add=True)  # Timestamp of last login
     is_admin = models.BooleanField(default=False)  # Admin status
@@ -19,6 +19,6 @@ urlpatterns = [
     path('my_orders/', views.my_orders, name='my_orders'),
     path('edit_profile/', views.edit_profile, name='edit_profile'),
     path('change_password/', views.change_password, name='change_password'),
-    path('order_detail/<int:order_id>/',
+    path('order_detail/<str:order_id>/',
          views.order_detail, name='order_detail'),
 ]
@@ -9,16 +9,20 @@ from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMessage
 
 from accounts.forms import RegistrationForm, UserForm, UserProfileForm
 from accounts.models import Account, UserProfile
-from carts.models import Cart, CartItem
-from carts.views import _cart_id
+from carts.merge import merge_anonymous_cart
+from carts.summary import cart_changed
+from taskqueue.tasks import send_email
 
 import requests
 
-from orders.models import Order, OrderProduct
+from orders.models import Order, OrderProduct, OrderSummary
+from store.pagination import CursorPaginator, page_url, queryset_fetcher
+
+# Orders shown on each page of the order history
+ORDERS_PER_PAGE = 10
 
 
 def register(request):
@@ -65,8 +69,8 @@ def register(request):
                     'token': default_token_generator.make_token(user)
                 })
             to_email = email
-            send_email = EmailMessage(mail_subject, message, to=[to_email])
-            send_email.send()
+            # Sent by the background worker (manage.py run_worker), the request does not wait for SMTP
+            send_email.delay(subject=mail_subject, body=message, to=[to_email])
             # messages.success(
             #     request, "Thank you for registering with us. we have sent you a verfication email to your email address. Please verify it.")
             return redirect('/accounts/login?command=verification&email='+email)
@@ -90,59 +94,15 @@ def login(request):
 
         # if we having user with such credential
         if user is not None:
-            # Here we check if there any cartitem
-            try:
-                cart = Cart.objects.get(cart_id=_cart_id(request))
-                # Check if a cart item already exists
-                is_cart_item_exist = CartItem.objects.filter(
-                    cart=cart).exists()
-                if is_cart_item_exist:
-                    # Getting the cartitem by cart ID
-                    cart_item = CartItem.objects.filter(cart=cart)
-
-                    # Getting the product variation by cart ID
-                    product_variation = []
-                    for item in cart_item:
-                        variation = item.variations.all()
-                        # By Default its query set so we need to covert it list
-                        product_variation.append(list(variation))
-
-                    # Get the cart items from the user to access his product variations
-                    # Retrieve all cart items for the product in the current cart
-                    cart_item = CartItem.objects.filter(user=user)
-
-                    # Lists to hold existing variations and item IDs from the database
-                    ex_var_list = []
-                    id_list = []
-
-                    # Loop through the cart items and gather variations and IDs
-                    for item in cart_item:
-                        existing_variation = item.variations.all()  # Get variations for each cart item
-                        # Convert to list and add to ex_var_list
-                        ex_var_list.append(list(existing_variation))
-                        id_list.append(item.id)  # Store the item ID
-
-                    # Here check that the product variations available in existing product_variation
-                    for pr in product_variation:
-                        if pr in ex_var_list:
-                            index = ex_var_list.index(pr)
-                            item_id = id_list[index]
-                            item = CartItem.objects.get(id=item_id)
-                            item.quantity += 1
-                            item.user = user
-                            item.save()
-                        else:
-                            cart_item = CartItem.objects.filter(cart=cart)
-                            # loop through each cartitem
-                            # assign the user of cartItem is current user
-                            for item in cart_item:
-                                item.user = user
-                                item.save()
-
-            except:
-                pass
+            # Here we move the cart items of the anonymous cart to the user,
+            # a visitor without a session has no cart to merge
+            session_key = request.session.session_key
+            if session_key:
+                merge_anonymous_cart(session_key, user)
 
             auth.login(request, user)
+            # The anonymous cart may have been moved to the user, recount the badge
+            cart_changed(request)
             messages.success(request, "You are now logged in")
             # this HTTP_REFERER PICK THE URL WHERE WE COME JUST BEFORE
             url = request.META.get('HTTP_REFERER')
@@ -196,12 +156,12 @@ def activate(request, uidb64, token):
 
 @login_required(login_url='login')
 def dashboard(request):
-    orders = Order.objects.order_by(
-        '-created_at').filter(user_id=request.user.id, is_ordered=True)
-    orders_count = orders.count()
+    # One row with the user's order totals instead of counting the orders, see orders.finalize.record_order
+    summary = OrderSummary.objects.filter(user=request.user).select_related('last_order').first()
     userprofile = UserProfile.objects.get(user_id=request.user.id)
     context = {
-        "orders_count": orders_count,
+        "orders_count": summary.order_count if summary else 0,
+        "order_summary": summary,
         "userprofile": userprofile,
     }
     return render(request, 'accounts/dashboard.html', context)
@@ -225,8 +185,8 @@ def forgotPassword(request):
                     'token': default_token_generator.make_token(user)
                 })
             to_email = email
-            send_email = EmailMessage(mail_subject, message, to=[to_email])
-            send_email.send()
+            # Sent by the background worker (manage.py run_worker), the request does not wait for SMTP
+            send_email.delay(subject=mail_subject, body=message, to=[to_email])
 
             messages.success(
                 request, 'Password reset email has been sent to your email address.')
@@ -282,10 +242,17 @@ def resetPassword(request):
 
 @login_required(login_url='login')
 def my_orders(request):
-    orders = Order.objects.filter(
-        user=request.user, is_ordered=True).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user, is_ordered=True)
+    summary = OrderSummary.objects.filter(user=request.user).first()
+    # Keyset pagination on (created_at, id), every page is one indexed range query
+    paginator = CursorPaginator(
+        queryset_fetcher(orders, ['-created_at', '-id']), ORDERS_PER_PAGE,
+        count=summary.order_count if summary else 0)
+    paged_orders = paginator.page(request.GET.get('cursor'))
     context = {
-        'orders': orders,
+        'orders': paged_orders,
+        'next_url': page_url(request, paged_orders.next_cursor),
+        'previous_url': page_url(request, paged_orders.previous_cursor),
     }
     return render(request, 'accounts/my_orders.html', context)
 
@@ -353,8 +320,10 @@ def change_password(request):
 
 @login_required(login_url='login')
 def order_detail(request, order_id):
-    order_detail = OrderProduct.objects.filter(order__order_number=order_id)
-    order = Order.objects.get(order_number=order_id)
+    # order_number is unique, both lookups use its index; only the user's own orders are shown
+    order = get_object_or_404(Order.objects.select_related('payment'), order_number=order_id, user=request.user)
+    # The products and their variations are loaded with two queries, not two per line
+    order_detail = OrderProduct.objects.filter(order=order).select_related('product').prefetch_related('variations')
     subtotal = 0
     for i in order_detail:
         subtotal += i.product_price * i.quantity
@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import SalesRollup
+
+
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('start', 'period', 'dimension', 'key', 'revenue', 'units', 'orders')
+    list_filter = ('period', 'dimension')
+    date_hierarchy = 'start'
+    # Written by build_sales_rollups only
+    readonly_fields = ('start', 'period', 'dimension', 'key', 'revenue', 'units', 'orders')
+
+
+admin.site.register(SalesRollup, SalesRollupAdmin)
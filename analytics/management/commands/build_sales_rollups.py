@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import build
+
+
+class Command(BaseCommand):
+    help = 'Add the new paid order lines to the hourly and daily sales rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Drop the rollups and read every order again')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        hours, days = build(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            'Rolled up %d hours and %d days in %.1fs' % (hours, days, time.monotonic() - started)))
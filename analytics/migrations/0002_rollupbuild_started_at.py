@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupbuild',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import models
+
+
+class SalesRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIODS = (
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    )
+    TOTAL = 'total'
+    CATEGORY = 'category'
+    PRODUCT = 'product'
+    DIMENSIONS = (
+        (TOTAL, 'Store total'),
+        (CATEGORY, 'Category'),
+        (PRODUCT, 'Product'),
+    )
+
+    period = models.CharField(max_length=5, choices=PERIODS)
+    # First instant of the hour or day
+    start = models.DateTimeField()
+    dimension = models.CharField(max_length=10, choices=DIMENSIONS)
+    # Id of the product or category, 0 for the store total
+    key = models.PositiveIntegerField(default=0)
+    # Sum of price x quantity of the order lines, without tax
+    revenue = models.FloatField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'dimension', 'key', 'start'],
+                                    name='unique_sales_rollup'),
+        ]
+        indexes = [models.Index(fields=['period', 'dimension', 'start'])]
+
+    def average_order_value(self):
+        return self.revenue / self.orders if self.orders else 0
+
+    def __str__(self):
+        return '%s %s %s:%d' % (self.period, self.start, self.dimension, self.key)
+
+
+class RollupBuild(models.Model):
+    # Highest OrderProduct id already rolled up, the next build reads newer order lines
+    # and the ones sold shortly before it started, see analytics.rollups.SAFETY_WINDOW
+    last_order_product_id = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    built_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,139 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.utils import timezone
+
+from analytics.models import RollupBuild, SalesRollup
+from orders.models import OrderProduct
+
+# Hours or days rebuilt per round of queries, and rows per INSERT
+PERIOD_BATCH = 168
+ID_BATCH = 500
+
+# Column of the order line each dimension is grouped by
+DIMENSION_FIELDS = {
+    SalesRollup.TOTAL: None,
+    SalesRollup.CATEGORY: 'product__category_id',
+    SalesRollup.PRODUCT: 'product_id',
+}
+
+ONE_HOUR = datetime.timedelta(hours=1)
+ONE_DAY = datetime.timedelta(days=1)
+
+# Order line ids are handed out before commit: a checkout still open when a build read
+# a higher id commits lines below the watermark. Its lines are sold at most this long
+# before it commits, so the hours sold from this long before the last build are rolled
+# up again whatever their ids.
+SAFETY_WINDOW = datetime.timedelta(minutes=15)
+
+
+def _batches(items, size=PERIOD_BATCH):
+    items = sorted(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _sold_lines():
+    # A line is sold when its order is paid, so every line of an order falls in the same hour
+    return OrderProduct.objects.filter(ordered=True).annotate(
+        sold_at=Coalesce('payment__created_at', 'created_at'))
+
+
+def start_of_day(moment):
+    # Same day boundaries as TruncDay: midnight in the current time zone
+    return timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def touched_hours(after_id=0, sold_since=None):
+    """Hours holding order lines newer than after_id or sold from sold_since on.
+
+    Returns (set of hours, highest OrderProduct id seen).
+    """
+    lines = _sold_lines()
+    last_id = lines.filter(id__gt=after_id).aggregate(last_id=Max('id'))['last_id'] or after_id
+    touched = Q(id__gt=after_id, id__lte=last_id)
+    if sold_since is not None:
+        touched |= Q(sold_at__gte=sold_since)
+    hours = set(lines.filter(touched).annotate(hour=TruncHour('sold_at'))
+                .values_list('hour', flat=True).distinct())
+    return hours, last_id
+
+
+def _replace(period, starts, rows):
+    with transaction.atomic():
+        SalesRollup.objects.filter(period=period, start__in=starts).delete()
+        SalesRollup.objects.bulk_create(rows, batch_size=ID_BATCH)
+    return len(rows)
+
+
+def rollup_hours(hours):
+    """Recompute the hourly rollups of `hours` from the order lines, returns the rows written.
+
+    The database does the aggregation: one GROUP BY query per dimension and
+    batch of hours, only the result rows come back to Python.
+    """
+    written = 0
+    for batch in _batches(hours):
+        lines = (_sold_lines().filter(sold_at__gte=batch[0], sold_at__lt=batch[-1] + ONE_HOUR)
+                 .annotate(hour=TruncHour('sold_at')).filter(hour__in=batch))
+        rows = []
+        for dimension, field in DIMENSION_FIELDS.items():
+            columns = ['hour'] + ([field] if field else [])
+            for row in lines.values(*columns).annotate(
+                    revenue=Sum(F('product_price') * F('quantity')), units=Sum('quantity'),
+                    orders=Count('order_id', distinct=True)).order_by():
+                rows.append(SalesRollup(
+                    period=SalesRollup.HOUR, start=row['hour'], dimension=dimension,
+                    key=row[field] if field else 0, revenue=row['revenue'] or 0,
+                    units=row['units'] or 0, orders=row['orders']))
+        written += _replace(SalesRollup.HOUR, batch, rows)
+    return written
+
+
+def rollup_days(days):
+    """Recompute the daily rollups of `days` by adding up their hourly rollups, returns the rows written.
+
+    An order is counted in a single hour, so the order counts of the hours
+    add up to the order count of the day.
+    """
+    written = 0
+    for batch in _batches(days):
+        hours = (SalesRollup.objects.filter(period=SalesRollup.HOUR, start__gte=batch[0],
+                                            start__lt=batch[-1] + ONE_DAY)
+                 .annotate(day=TruncDay('start')).filter(day__in=batch))
+        rows = [
+            SalesRollup(period=SalesRollup.DAY, start=row['day'], dimension=row['dimension'],
+                        key=row['key'], revenue=row['revenue'], units=row['units'], orders=row['orders'])
+            for row in hours.values('day', 'dimension', 'key').annotate(
+                revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders')).order_by()
+        ]
+        written += _replace(SalesRollup.DAY, batch, rows)
+    return written
+
+
+def build(full=False):
+    """Roll up the order lines added since the last build.
+
+    Only the hours and days those lines fall in are recomputed, from scratch,
+    so running a build twice gives the same rows. The hours of SAFETY_WINDOW
+    before the last build are recomputed too, for the lines that committed
+    under the watermark. With full=True every rollup is dropped and all
+    orders are read again. Returns (hours, days) recomputed.
+    """
+    started = timezone.now()
+    state = RollupBuild.objects.order_by('-id').first() or RollupBuild()
+    if full:
+        SalesRollup.objects.all().delete()
+        state.last_order_product_id = 0
+        state.started_at = None
+    sold_since = state.started_at - SAFETY_WINDOW if state.started_at else None
+    hours, last_id = touched_hours(state.last_order_product_id, sold_since)
+    days = {start_of_day(hour) for hour in hours}
+    rollup_hours(hours)
+    rollup_days(days)
+    state.last_order_product_id = last_id
+    state.started_at = started
+    state.save()
+    return len(hours), len(days)
@@ -0,0 +1,87 @@
+from django.db.models import F
+from django.test import TestCase
+from django.utils import timezone
+
+from analytics.models import SalesRollup
+from analytics.rollups import ONE_DAY, ONE_HOUR, build, start_of_day
+from category.models import Category
+from orders.models import OrderProduct
+from store.tests import isolate_change_logs, make_order, make_product, make_user
+
+
+class RollupTestCase(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = make_product(self.category, 'shirt', price=100)
+        self.hat = make_product(self.category, 'hat', price=40)
+        self.user = make_user('buyer@example.com')
+
+    def order(self, products, sold_at=None):
+        order = make_order(self.user, products)
+        if sold_at is not None:
+            OrderProduct.objects.filter(order=order).update(created_at=sold_at)
+        return order
+
+    def rollup(self, period, start, dimension=SalesRollup.TOTAL, key=0):
+        row = SalesRollup.objects.get(period=period, start=start, dimension=dimension, key=key)
+        return row.revenue, row.units, row.orders
+
+
+class RollupTests(RollupTestCase):
+    def test_hours_and_days(self):
+        day = start_of_day(timezone.now() - ONE_DAY * 3)
+        self.order([self.shirt, self.hat], day + ONE_HOUR * 2)
+        self.order([self.shirt], day + ONE_HOUR * 5 + ONE_HOUR / 2)
+        self.assertEqual(build(), (2, 1))
+        self.assertEqual(self.rollup(SalesRollup.HOUR, day + ONE_HOUR * 2), (140, 2, 1))
+        self.assertEqual(self.rollup(SalesRollup.HOUR, day + ONE_HOUR * 5), (100, 1, 1))
+        self.assertEqual(self.rollup(SalesRollup.DAY, day), (240, 3, 2))
+        self.assertEqual(self.rollup(SalesRollup.DAY, day, SalesRollup.PRODUCT, self.shirt.id), (200, 2, 2))
+        self.assertEqual(self.rollup(SalesRollup.DAY, day, SalesRollup.CATEGORY, self.category.id), (240, 3, 2))
+        # Nothing new and nothing sold in the safety window: nothing recomputed
+        rows = list(SalesRollup.objects.values_list('id', flat=True))
+        self.assertEqual(build(), (0, 0))
+        self.assertEqual(list(SalesRollup.objects.values_list('id', flat=True)), rows)
+
+    def test_lines_committed_under_the_watermark(self):
+        self.order([self.shirt])
+        build()
+        # A checkout that got its ids before the build read higher ones, and committed after it
+        late = self.order([self.hat])
+        OrderProduct.objects.filter(order=late).update(id=-F('id'))
+        build()
+        self.assertEqual(self.rollup(SalesRollup.DAY, start_of_day(timezone.now())), (140, 2, 2))
+
+    def test_full_build(self):
+        self.order([self.shirt])
+        build()
+        SalesRollup.objects.update(revenue=0)
+        build(full=True)
+        self.assertEqual(self.rollup(SalesRollup.DAY, start_of_day(timezone.now())), (100, 1, 1))
+
+
+class SalesDashboardTests(RollupTestCase):
+    url = '/admin/analytics/sales/'
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_totals_of_the_range(self):
+        self.order([self.shirt, self.hat])
+        self.order([self.shirt], timezone.now() - ONE_DAY * 10)
+        build()
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        context = response.context
+        self.assertEqual((context['days'], context['revenue'], context['units'], context['orders']), (30, 240, 3, 2))
+        self.assertEqual(len(context['daily']), 30)
+        self.assertEqual(context['best_products'][0]['name'], 'shirt')
+        response = self.client.get(self.url, {'days': 7})
+        self.assertEqual((response.context['revenue'], response.context['average_order_value']), (140, 140))
+        # An unknown range falls back to the default one
+        self.assertEqual(self.client.get(self.url, {'days': 'x'}).context['days'], 30)
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('sales/', views.sales_dashboard, name='sales_dashboard'),
+]
@@ -0,0 +1,84 @@
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Sum
+from django.shortcuts import render
+from django.utils import timezone
+
+from analytics.models import SalesRollup
+from analytics.rollups import ONE_DAY, ONE_HOUR, start_of_day
+from category.models import Category
+from store.models import Product
+
+# Days the dashboard can show, the first one is the default
+RANGES = (30, 7, 90)
+
+# Rows of the best products and categories tables
+TOP_SIZE = 10
+
+
+def _with_bars(rows, field):
+    # Width of each row's bar in percent of the largest value, for the CSS charts
+    largest = max((getattr(row, field) for row in rows), default=0) or 1
+    for row in rows:
+        row.bar = round(100 * getattr(row, field) / largest, 1)
+    return rows
+
+
+def _series(rollups, starts, local_key):
+    # One rollup per period of `starts`, empty ones where nothing was sold
+    by_start = {local_key(row.start): row for row in rollups}
+    return [by_start.get(local_key(start)) or SalesRollup(start=start) for start in starts]
+
+
+def _best(dimension, since, names):
+    rows = list(SalesRollup.objects.filter(period=SalesRollup.DAY, dimension=dimension, start__gte=since)
+                .values('key').annotate(revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders'))
+                .order_by('-revenue')[:TOP_SIZE])
+    labels = names.in_bulk([row['key'] for row in rows])
+    return [dict(row, name=str(labels.get(row['key'], '#%d' % row['key']))) for row in rows]
+
+
+@staff_member_required
+def sales_dashboard(request):
+    """Revenue, units, orders and average order value read from the sales rollups.
+
+    A handful of small indexed queries on SalesRollup whatever the number of
+    orders, the rollups are built by `python manage.py build_sales_rollups`.
+    """
+    try:
+        days = int(request.GET.get('days', RANGES[0]))
+    except ValueError:
+        days = RANGES[0]
+    if days not in RANGES:
+        days = RANGES[0]
+
+    now = timezone.now()
+    since = start_of_day(now - ONE_DAY * (days - 1))
+    daily = _series(
+        SalesRollup.objects.filter(period=SalesRollup.DAY, dimension=SalesRollup.TOTAL, start__gte=since),
+        [start_of_day(since + ONE_DAY * index + ONE_HOUR * 12) for index in range(days)],
+        lambda start: timezone.localtime(start).date())
+    last_hour = now.replace(minute=0, second=0, microsecond=0)
+    hourly = _series(
+        SalesRollup.objects.filter(period=SalesRollup.HOUR, dimension=SalesRollup.TOTAL,
+                                   start__gt=last_hour - ONE_DAY),
+        [last_hour - ONE_HOUR * index for index in range(23, -1, -1)],
+        lambda start: start)
+
+    revenue = sum(row.revenue for row in daily)
+    orders = sum(row.orders for row in daily)
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Sales',
+        'days': days,
+        'ranges': RANGES,
+        'revenue': revenue,
+        'units': sum(row.units for row in daily),
+        'orders': orders,
+        'average_order_value': revenue / orders if orders else 0,
+        'daily': _with_bars(daily, 'revenue'),
+        'hourly': _with_bars(hourly, 'revenue'),
+        'best_products': _best(SalesRollup.PRODUCT, since, Product.objects.only('product_name')),
+        'best_categories': _best(SalesRollup.CATEGORY, since, Category.objects.only('category_name')),
+    }
+    return render(request, 'analytics/sales_dashboard.html', context)
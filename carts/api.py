@@ -0,0 +1,193 @@
+import json
+
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from carts.models import Cart, CartItem
+from carts.pricing import price_cart
+from carts.summary import cart_changed
+from carts.views import _add_line, _cart_id
+from store.models import Product
+from store.variations import resolve_variations, variation_signature
+
+# Operations accepted in one request
+MAX_OPERATIONS = 50
+
+# Largest quantity one line can be set to
+MAX_QUANTITY = 999
+
+
+class CartError(ValueError):
+    pass
+
+
+def _line_json(line):
+    return {
+        'id': line.id,
+        'product_id': line.product_id,
+        'product_name': line.product.product_name,
+        'url': line.product.get_url(),
+        'variations': [
+            {'category': variation.variation_category, 'value': variation.variation_value}
+            for variation in line.variations.all()
+        ],
+        'quantity': line.quantity,
+        'price': line.product.price,
+        'sub_total': line.sub_total(),
+    }
+
+
+def _totals_json(pricing):
+    return {
+        'quantity': pricing.quantity,
+        'total': pricing.total,
+        'tax': pricing.tax,
+        'grand_total': pricing.grand_total,
+    }
+
+
+def _quantity(operation, default=None):
+    value = operation.get('quantity', default)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= MAX_QUANTITY:
+        raise CartError('quantity must be an integer between 0 and %d' % MAX_QUANTITY)
+    return value
+
+
+def _id(operation, name):
+    value = operation.get(name)
+    # Bounded to a 64-bit column, larger numbers overflow the database driver
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value < 2 ** 63:
+        raise CartError('%s must be a positive integer' % name)
+    return value
+
+
+def _check(operation):
+    # Types of every field, checked before anything is written or looked up
+    kind = operation.get('op')
+    if kind == 'add':
+        _id(operation, 'product_id')
+        _quantity(operation, default=1)
+        if not isinstance(operation.get('variations') or {}, dict):
+            raise CartError('variations must be an object')
+    elif kind in ('set', 'remove'):
+        _id(operation, 'item_id')
+        if kind == 'set':
+            _quantity(operation)
+    else:
+        raise CartError('op must be add, set or remove')
+
+
+def _owned_lines(request):
+    # Lines of the request's cart; none for a visitor without a session
+    if request.user.is_authenticated:
+        return CartItem.objects.filter(user=request.user)
+    if request.session.session_key:
+        return CartItem.objects.filter(cart__cart_id=request.session.session_key, user=None)
+    return CartItem.objects.none()
+
+
+def _owner(request):
+    # Owner of new lines, the anonymous cart (and its session) is only created when something is added
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    cart, _ = Cart.objects.get_or_create(cart_id=_cart_id(request))
+    return {'cart': cart}
+
+
+def apply_operations(request, operations):
+    """Apply a list of cart operations, returns (ids of the lines touched, keys of the lines added to).
+
+    {"op": "add", "product_id": 3, "variations": {"color": "red"}, "quantity": 2}
+    {"op": "set", "item_id": 7, "quantity": 10}   (0 removes the line)
+    {"op": "remove", "item_id": 7}
+
+    Raises CartError on the first invalid operation, field types are checked
+    for the whole batch before anything runs; the caller runs this in a
+    transaction so nothing of the batch is kept.
+    """
+    for index, operation in enumerate(operations):
+        try:
+            _check(operation)
+        except CartError as e:
+            raise CartError('operation %d: %s' % (index, e))
+    products = Product.objects.filter(is_available=True).in_bulk(
+        {op['product_id'] for op in operations if op['op'] == 'add'})
+    touched_ids, added_keys = set(), set()
+    owner = None
+    for index, operation in enumerate(operations):
+        kind = operation['op']
+        try:
+            if kind == 'add':
+                product = products.get(operation['product_id'])
+                if product is None:
+                    raise CartError('unknown product')
+                quantity = _quantity(operation, default=1)
+                if quantity == 0:
+                    continue
+                # Same matching as the product page form, values are case-insensitive
+                variation_ids = resolve_variations(product.id, operation.get('variations') or {})
+                if owner is None:
+                    owner = _owner(request)
+                _add_line(product, variation_ids, quantity, **owner)
+                added_keys.add((product.id, variation_signature(variation_ids)))
+            elif kind in ('set', 'remove'):
+                line = _owned_lines(request).filter(id=operation['item_id'])
+                quantity = 0 if kind == 'remove' else _quantity(operation)
+                if quantity:
+                    changed = line.update(quantity=quantity)
+                else:
+                    changed, _ = line.delete()
+                if not changed:
+                    raise CartError('unknown cart item')
+                touched_ids.add(operation['item_id'])
+        except CartError as e:
+            raise CartError('operation %d: %s' % (index, e))
+    return touched_ids, added_keys
+
+
+@require_http_methods(['GET', 'POST'])
+def cart_api(request):
+    """JSON cart endpoint.
+
+    GET returns every line and the totals. POST takes one operation or
+    {"operations": [...]} and returns only the lines it changed, the ids of
+    the lines it removed and the new totals.
+    """
+    if request.method == 'GET':
+        pricing = price_cart(request)
+        return JsonResponse({
+            'lines': [_line_json(line) for line in pricing.lines],
+            'totals': _totals_json(pricing),
+        })
+
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'invalid JSON'}, status=400)
+    operations = body.get('operations', [body]) if isinstance(body, dict) else None
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return JsonResponse({'error': 'expected an operation or {"operations": [...]}'}, status=400)
+    if len(operations) > MAX_OPERATIONS:
+        return JsonResponse({'error': 'at most %d operations per request' % MAX_OPERATIONS}, status=400)
+
+    try:
+        # All or nothing: a bad operation rolls back the ones before it
+        with transaction.atomic():
+            touched_ids, added_keys = apply_operations(request, operations)
+            cart_changed(request)
+    except CartError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # The version bump ran on commit, so these totals belong to the new version of the cart
+    pricing = price_cart(request)
+    changed = [
+        line for line in pricing.lines
+        if line.id in touched_ids or (line.product_id, line.variation_signature) in added_keys
+    ]
+    remaining = {line.id for line in pricing.lines}
+    return JsonResponse({
+        'lines': [_line_json(line) for line in changed],
+        'removed': sorted(item_id for item_id in touched_ids if item_id not in remaining),
+        'totals': _totals_json(pricing),
+    })
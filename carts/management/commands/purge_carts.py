@@ -0,0 +1,108 @@
+import datetime
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from carts.models import Cart, CartItem
+
+# Approximate size of the fixed-width columns of a row (ids, quantity, flags, dates)
+CART_ROW_BYTES = 16
+CART_ITEM_ROW_BYTES = 72
+VARIATION_ROW_BYTES = 24
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned anonymous carts and expired sessions in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Carts created more than this many days ago whose session is gone are abandoned')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Cart ids scanned, or sessions deleted, per transaction')
+        parser.add_argument('--pause', type=float, default=0.2,
+                            help='Seconds to sleep between batches so a live database keeps up')
+        parser.add_argument('--from-id', type=int, default=0,
+                            help='Resume the cart scan at this id (printed after every batch)')
+        parser.add_argument('--skip-sessions', action='store_true',
+                            help='Only purge carts')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        self.now = timezone.now()
+        self.stats = {'carts': 0, 'cart items': 0, 'cart item variations': 0, 'sessions': 0}
+        self.bytes = 0
+
+        started = time.monotonic()
+        self.purge_carts(self.now.date() - datetime.timedelta(days=options['days']), options['from_id'])
+        if not options['skip_sessions']:
+            self.purge_sessions()
+
+        self.stdout.write(self.style.SUCCESS('Purged %s, about %d bytes (%.1f MB) of row data, in %.1fs' % (
+            ', '.join('%d %s' % (count, name) for name, count in self.stats.items()),
+            self.bytes, self.bytes / (1024 * 1024), time.monotonic() - started)))
+
+    def purge_carts(self, cutoff, from_id):
+        # Walk the carts by id range so every batch is a short transaction on an index range,
+        # a stopped run continues with --from-id
+        bounds = Cart.objects.filter(id__gte=from_id).aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return
+        low = bounds['low']
+        while low <= bounds['high']:
+            high = low + self.batch_size
+            with transaction.atomic():
+                self.purge_cart_range(low, high, cutoff)
+            self.stdout.write('Carts scanned up to id %d (resume with --from-id %d)' % (high - 1, high))
+            low = high
+            time.sleep(self.pause)
+
+    def purge_cart_range(self, low, high, cutoff):
+        carts = dict(Cart.objects.filter(id__gte=low, id__lt=high, date_added__lt=cutoff).values_list(
+            'id', 'cart_id'))
+        if not carts:
+            return
+        # A cart whose session is still alive is in use, however old it is
+        alive = set(Session.objects.filter(
+            session_key__in=list(carts.values()), expire_date__gt=self.now).values_list('session_key', flat=True))
+        abandoned = [cart_id for cart_id, key in carts.items() if key not in alive]
+        if not abandoned:
+            return
+        # Lines moved to a user at login keep their cart, detach them instead of losing them with it
+        CartItem.objects.filter(cart_id__in=abandoned, user__isnull=False).update(cart=None)
+
+        items = CartItem.objects.filter(cart_id__in=abandoned)
+        cart_ids_bytes = Cart.objects.filter(id__in=abandoned).aggregate(
+            size=Sum(Length('cart_id')))['size'] or 0
+        _, deleted = items.delete()
+        item_count = deleted.get(CartItem._meta.label, 0)
+        variation_count = deleted.get(CartItem.variations.through._meta.label, 0)
+        cart_count = Cart.objects.filter(id__in=abandoned).delete()[0]
+
+        self.stats['carts'] += cart_count
+        self.stats['cart items'] += item_count
+        self.stats['cart item variations'] += variation_count
+        self.bytes += (cart_ids_bytes + cart_count * CART_ROW_BYTES + item_count * CART_ITEM_ROW_BYTES
+                       + variation_count * VARIATION_ROW_BYTES)
+
+    def purge_sessions(self):
+        # Keyset over the expired sessions; deleting is idempotent so a stopped run just starts again
+        last_key = ''
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=self.now, session_key__gt=last_key)
+                        .order_by('session_key').values_list('session_key', flat=True)[:self.batch_size])
+            if not keys:
+                break
+            with transaction.atomic():
+                expired = Session.objects.filter(session_key__in=keys)
+                size = expired.aggregate(size=Sum(Length('session_data')))['size'] or 0
+                count, _ = expired.delete()
+            self.stats['sessions'] += count
+            self.bytes += size + sum(len(key) for key in keys)
+            last_key = keys[-1]
+            time.sleep(self.pause)
@@ -0,0 +1,39 @@
+from django.db import transaction
+
+from .models import CartItem
+
+
+def merge_anonymous_cart(cart_id, user):
+    """Move the lines of the anonymous cart `cart_id` to `user`, returns the number of lines merged.
+
+    A line the user already has (same product and variation signature) gets
+    the anonymous quantity added and the anonymous line is deleted, every
+    other line is handed over to the user. Runs in one transaction with the
+    same handful of queries whatever the size of both carts.
+    """
+    with transaction.atomic():
+        anonymous = list(CartItem.objects.select_for_update().filter(
+            cart__cart_id=cart_id, user=None).only('id', 'product_id', 'variation_signature', 'quantity'))
+        if not anonymous:
+            return 0
+        user_lines = {
+            (item.product_id, item.variation_signature): item
+            for item in CartItem.objects.select_for_update().filter(
+                user=user, product_id__in={item.product_id for item in anonymous}).only(
+                'id', 'product_id', 'variation_signature', 'quantity')
+        }
+        merged, moved, updated = [], [], {}
+        for item in anonymous:
+            existing = user_lines.get((item.product_id, item.variation_signature))
+            if existing is None:
+                moved.append(item.id)
+                # A second anonymous line with the same key (duplicate Cart rows) folds into this one
+                user_lines[item.product_id, item.variation_signature] = item
+            else:
+                existing.quantity += item.quantity
+                updated[existing.id] = existing
+                merged.append(item.id)
+        CartItem.objects.bulk_update(updated.values(), ['quantity'])
+        CartItem.objects.filter(id__in=merged).delete()
+        CartItem.objects.filter(id__in=moved).update(user=user)
+    return len(anonymous)
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:53
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_signatures(apps, schema_editor):
+    # Sign the existing lines and fold the duplicates (same owner, product and
+    # variations) into the first one, so the unique constraint can be created
+    Line = apps.get_model('carts', 'CartItem')
+    Through = Line.variations.through
+    fk = Line._meta.model_name + '_id'
+    variations = {}
+    for line_id, variation_id in Through.objects.values_list(fk, 'variation_id'):
+        variations.setdefault(line_id, []).append(variation_id)
+    kept = {}
+    for line in Line.objects.order_by('id'):
+        canonical = ','.join(str(pk) for pk in sorted(set(variations.get(line.id, []))))
+        line.variation_signature = hashlib.sha1(canonical.encode()).hexdigest()
+        # One key per owner column that is set, a line matching any of them is a duplicate
+        keys = [(owner, getattr(line, owner), line.product_id, line.variation_signature)
+                for owner in ('user_id', 'cart_id') if getattr(line, owner) is not None]
+        first = next((kept[key] for key in keys if key in kept), None)
+        if first is None:
+            kept.update((key, line) for key in keys)
+            line.save(update_fields=['variation_signature'])
+        else:
+            first.quantity += line.quantity
+            first.save(update_fields=['quantity'])
+            line.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0004_alter_cart_id_alter_cartitem_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variation_signature',
+            field=models.CharField(default='', max_length=40),
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product', 'variation_signature'), name='unique_user_cart_line'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'variation_signature'), name='unique_cart_line'),
+        ),
+    ]
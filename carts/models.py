@@ -26,6 +26,10 @@ class CartItem(models.Model):
     # many products has same variation so thats why we use Many to Many Field
     variations = models.ManyToManyField(Variation, blank=True)
 
+    # Hash of the sorted variation ids (store.variations.variation_signature), the same
+    # product with the same variations is one line per owner
+    variation_signature = models.CharField(max_length=40, default='')
+
     # ForeignKey relationship to the Cart model. This links each CartItem to a specific Cart.
     # 'on_delete=models.CASCADE' means if the Cart is deleted, the CartItems associated with
     # that Cart will also be deleted.
@@ -39,6 +43,15 @@ class CartItem(models.Model):
     # Default is set to True, meaning the CartItem is considered active when created.
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        # NULL owners never collide, so an anonymous line (user NULL) only conflicts inside its cart
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product', 'variation_signature'],
+                                    name='unique_user_cart_line'),
+            models.UniqueConstraint(fields=['cart', 'product', 'variation_signature'],
+                                    name='unique_cart_line'),
+        ]
+
     def sub_total(self):
         return self.product.price * self.quantity
 
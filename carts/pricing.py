@@ -0,0 +1,58 @@
+from .models import CartItem
+from .summary import cart_version, remember_summary
+
+# Tax added on top of the cart total, in percent
+TAX_PERCENT = 2
+
+
+class CartPricing:
+    # The lines of a cart with their products and variations loaded, and the totals computed from them
+    def __init__(self, lines):
+        self.lines = lines
+        self.total = 0
+        self.quantity = 0
+        # One pass over the loaded lines, product.price comes from the same query
+        for line in lines:
+            self.total += line.product.price * line.quantity
+            self.quantity += line.quantity
+        self.tax = (TAX_PERCENT * self.total) / 100
+        self.grand_total = self.total + self.tax
+
+    def context(self):
+        # The variables the cart, checkout and payment templates expect
+        return {
+            'cart_items': self.lines,
+            'total': self.total,
+            'quantity': self.quantity,
+            'tax': self.tax,
+            'grand_total': self.grand_total,
+        }
+
+
+def cart_lines(request):
+    # Active lines of the request's cart: one query for the lines, products and
+    # categories, one for all their variations. No session is created for visitors.
+    lines = CartItem.objects.filter(is_active=True)
+    if request.user.is_authenticated:
+        lines = lines.filter(user=request.user)
+    elif request.session.session_key:
+        lines = lines.filter(cart__cart_id=request.session.session_key)
+    else:
+        return []
+    return list(lines.select_related('product__category').prefetch_related('variations').order_by('id'))
+
+
+def price_cart(request):
+    """Return the CartPricing of the request's cart.
+
+    Computed once per request and shared by whoever asks for it; the totals
+    are also stored as the summary of the current cart version so the navbar
+    badge does not count the lines again until the cart changes.
+    """
+    pricing = getattr(request, '_cart_pricing', None)
+    if pricing is None:
+        # The version is read first, a change committed while the lines load gets a new one
+        version = cart_version(request)
+        pricing = request._cart_pricing = CartPricing(cart_lines(request))
+        remember_summary(request, version, pricing.quantity, pricing.total)
+    return pricing
@@ -0,0 +1,92 @@
+from django.core.cache import cache
+from django.db.models import F, Sum
+
+from store.versions import get_version, versions_changed
+from .models import CartItem
+
+# Every cart change moves the cart to a new version, the timeout only bounds how
+# long the subtotal can lag behind a product price change
+SUMMARY_TIMEOUT = 60 * 15
+
+EMPTY_SUMMARY = {'count': 0, 'subtotal': 0}
+
+
+def _owner(request):
+    # Who owns the cart of this request, without creating a session for visitors that never added anything
+    if request.user.is_authenticated:
+        return {'user_id': request.user.id}
+    session_key = request.session.session_key
+    if session_key:
+        return {'cart_id': session_key}
+    return None
+
+
+def _owner_key(user_id=None, cart_id=None):
+    if user_id is not None:
+        return 'user:%d' % user_id
+    return 'cart:%s' % cart_id
+
+
+def _version_key(owner):
+    return 'carts:version:%s' % _owner_key(**owner)
+
+
+def cart_version(request):
+    """Version of the request's cart, None when the visitor has no cart.
+
+    Read it before loading the lines: totals stored under that version can
+    never be mistaken for the ones of a later change.
+    """
+    owner = _owner(request)
+    if owner is None:
+        return None
+    return get_version(_version_key(owner))
+
+
+def _summary_key(owner, version):
+    return 'carts:summary:%s:%s' % (_owner_key(**owner), version)
+
+
+def _compute(user_id=None, cart_id=None):
+    items = CartItem.objects.filter(is_active=True)
+    if user_id is not None:
+        items = items.filter(user_id=user_id)
+    else:
+        items = items.filter(cart__cart_id=cart_id)
+    totals = items.aggregate(count=Sum('quantity'), subtotal=Sum(F('product__price') * F('quantity')))
+    return {'count': totals['count'] or 0, 'subtotal': totals['subtotal'] or 0}
+
+
+def cart_summary(request):
+    """Return {'count': items in the cart, 'subtotal': their price} for the navbar badge.
+
+    Two cache reads (the version, then the summary stored under it), a miss
+    costs one aggregate query on the cart lines. Visitors without a session
+    have no cart, they get an empty summary without touching the cache or
+    the database.
+    """
+    owner = _owner(request)
+    if owner is None:
+        return EMPTY_SUMMARY
+    key = _summary_key(owner, cart_version(request))
+    summary = cache.get(key)
+    if summary is None:
+        summary = _compute(**owner)
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def remember_summary(request, version, count, subtotal):
+    # Store totals computed elsewhere (carts/pricing.py) so the badge does not count again
+    owner = _owner(request)
+    if owner is not None and version is not None:
+        cache.set(_summary_key(owner, version), {'count': count, 'subtotal': subtotal}, SUMMARY_TIMEOUT)
+
+
+def cart_changed(request=None, user_id=None, cart_id=None):
+    # Call after every cart write, the cart moves to a new version once the write is committed.
+    # Pass the request, or the owner when the cart is not the request's one.
+    owner = _owner(request) if request is not None else {'user_id': user_id, 'cart_id': cart_id}
+    if owner is None:
+        return
+    versions_changed(_version_key(owner))
@@ -1,3 +1,181 @@
+import datetime
+import io
+import json
+
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from carts.merge import merge_anonymous_cart
+from carts.models import Cart, CartItem
+from category.models import Category
+from store.models import Variation
+from store.tests import make_product, make_user
+from store.variations import variation_signature
+
+
+class CartTestCase(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = make_product(category, 'shirt')
+        self.hat = make_product(category, 'hat')
+        self.red, self.blue, self.medium = [
+            Variation.objects.create(product=self.shirt, variation_category=category_name, variation_value=value)
+            for category_name, value in [('color', 'Red'), ('color', 'Blue'), ('size', 'M')]]
+        self.user = make_user('buyer@example.com')
+
+    def add_line(self, product, quantity, variations=(), cart=None, user=None):
+        item = CartItem.objects.create(
+            product=product, quantity=quantity, cart=cart, user=user,
+            variation_signature=variation_signature([variation.id for variation in variations]))
+        item.variations.set(variations)
+        return item
+
+    def user_lines(self):
+        return {
+            (item.product_id, tuple(sorted(item.variations.values_list('id', flat=True)))): item.quantity
+            for item in CartItem.objects.filter(user=self.user)
+        }
+
+
+class MergeAnonymousCartTests(CartTestCase):
+    def test_matching_lines_are_merged_and_the_others_moved(self):
+        cart = Cart.objects.create(cart_id='anonymous')
+        self.add_line(self.shirt, 1, [self.red, self.medium], user=self.user)
+        self.add_line(self.hat, 1, user=self.user)
+        self.add_line(self.shirt, 2, [self.medium, self.red], cart=cart)
+        self.add_line(self.shirt, 4, [self.blue, self.medium], cart=cart)
+        self.add_line(self.hat, 3, cart=cart)
+
+        self.assertEqual(merge_anonymous_cart('anonymous', self.user), 3)
+        self.assertEqual(self.user_lines(), {
+            (self.shirt.id, tuple(sorted([self.red.id, self.medium.id]))): 3,
+            (self.shirt.id, tuple(sorted([self.blue.id, self.medium.id]))): 4,
+            (self.hat.id, ()): 4,
+        })
+        self.assertFalse(CartItem.objects.filter(user=None).exists())
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        def fill(cart_id, count):
+            cart = Cart.objects.create(cart_id=cart_id)
+            # count lines merged into the user's lines
+            for number in range(count):
+                product = make_product(self.shirt.category, '%s-%d' % (cart_id, number))
+                self.add_line(product, 1, cart=cart)
+                self.add_line(product, 2, user=self.user)
+            # and one line the user does not have yet
+            self.add_line(make_product(self.shirt.category, '%s-new' % cart_id), 1, cart=cart)
+
+        fill('small', 1)
+        fill('large', 20)
+        # savepoint, anonymous lines, user lines, quantities, the delete (collect, variation rows, lines),
+        # moved lines, release
+        with self.assertNumQueries(9):
+            self.assertEqual(merge_anonymous_cart('small', self.user), 2)
+        with self.assertNumQueries(9):
+            self.assertEqual(merge_anonymous_cart('large', self.user), 21)
+
+    def test_login_merges_the_session_cart(self):
+        session = self.client.session
+        session.save()
+        cart = Cart.objects.create(cart_id=session.session_key)
+        self.add_line(self.shirt, 1, [self.red], user=self.user)
+        self.add_line(self.shirt, 2, [self.red], cart=cart)
+
+        response = self.client.post('/accounts/login/', {'email': 'buyer@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.user_lines(), {(self.shirt.id, (self.red.id,)): 3})
+
+
+class CartApiTests(CartTestCase):
+    def post(self, body):
+        return self.client.post('/cart/api/', json.dumps(body), content_type='application/json')
+
+    def test_malformed_operations_are_rejected(self):
+        self.client.force_login(self.user)
+        line = self.add_line(self.shirt, 1, user=self.user)
+        for operation in [
+            {'op': 'set', 'item_id': 'abc', 'quantity': 1},
+            {'op': 'remove', 'item_id': None},
+            {'op': 'set', 'item_id': line.id, 'quantity': '2'},
+            {'op': 'add', 'product_id': [1]},
+            {'op': 'add', 'product_id': '1'},
+            {'op': 'add', 'product_id': 2 ** 70},
+            {'op': 'add', 'product_id': self.shirt.id, 'variations': ['red']},
+            {'op': 'add', 'product_id': self.shirt.id, 'quantity': 1.5},
+            {'op': 'buy'},
+        ]:
+            response = self.post({'operations': [{'op': 'add', 'product_id': self.hat.id}, operation]})
+            self.assertEqual(response.status_code, 400, operation)
+            self.assertTrue(response.json()['error'].startswith('operation 1: '), operation)
+        # Nothing of a rejected batch is kept
+        self.assertEqual(self.user_lines(), {(self.shirt.id, ()): 1})
+
+    def test_valid_batch(self):
+        self.client.force_login(self.user)
+        line = self.add_line(self.hat, 1, user=self.user)
+        response = self.post({'operations': [
+            {'op': 'add', 'product_id': self.shirt.id, 'variations': {'color': 'RED'}, 'quantity': 2},
+            {'op': 'set', 'item_id': line.id, 'quantity': 5},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user_lines(), {(self.shirt.id, (self.red.id,)): 2, (self.hat.id, ()): 5})
+        self.assertEqual(response.json()['totals']['quantity'], 7)
+
+
+class PurgeCartsTests(CartTestCase):
+    def purge(self, *args):
+        out = io.StringIO()
+        call_command('purge_carts', '--pause', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def cart(self, key, days_old=60):
+        cart = Cart.objects.create(cart_id=key)
+        Cart.objects.filter(pk=cart.pk).update(date_added=timezone.localdate() - datetime.timedelta(days=days_old))
+        return cart
+
+    def session(self, key, alive):
+        return Session.objects.create(session_key=key, session_data='',
+                                      expire_date=timezone.now() + datetime.timedelta(days=1 if alive else -1))
+
+    def test_abandoned_carts_are_deleted_and_user_lines_detached(self):
+        abandoned = self.cart('gone')
+        anonymous_line = self.add_line(self.shirt, 1, [self.red, self.medium], cart=abandoned)
+        user_line = self.add_line(self.hat, 2, cart=abandoned, user=self.user)
+        self.session('alive', alive=True)
+        in_use = self.cart('alive')
+        recent = self.cart('recent', days_old=1)
+
+        out = self.purge('--skip-sessions')
+        self.assertIn('1 carts, 1 cart items, 2 cart item variations', out)
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {in_use.id, recent.id})
+        self.assertFalse(CartItem.objects.filter(pk=anonymous_line.pk).exists())
+        # The user's line stays in their cart
+        user_line.refresh_from_db()
+        self.assertEqual((user_line.cart_id, user_line.quantity), (None, 2))
+        self.assertEqual(self.user_lines(), {(self.hat.id, ()): 2})
+
+    def test_batches_cover_every_id_once(self):
+        carts = [self.cart('old-%d' % number) for number in range(5)]
+        kept = self.cart('kept', days_old=1)
+        out = self.purge('--skip-sessions', '--batch-size', '2')
+        self.assertIn('5 carts', out)
+        self.assertEqual(list(Cart.objects.values_list('id', flat=True)), [kept.id])
+        # Three batches of two ids from the first cart, each says where to resume
+        first = carts[0].id
+        self.assertEqual(out.count('resume with --from-id'), 3)
+        self.assertIn('Carts scanned up to id %d (resume with --from-id %d)' % (first + 5, first + 6), out)
+
+    def test_resume_from_id(self):
+        carts = [self.cart('old-%d' % number) for number in range(4)]
+        self.purge('--skip-sessions', '--batch-size', '2', '--from-id', str(carts[2].id))
+        self.assertEqual(list(Cart.objects.order_by('id').values_list('id', flat=True)), [carts[0].id, carts[1].id])
 
-# Create your tests here.
+    def test_expired_sessions_are_deleted_in_key_order(self):
+        for number in range(5):
+            self.session('expired-%d' % number, alive=False)
+        self.session('alive', alive=True)
+        out = self.purge('--batch-size', '2')
+        self.assertIn('5 sessions', out)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['alive'])
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 
 urlpatterns = [
@@ -9,5 +9,6 @@ urlpatterns = [
          views.remove_cart, name="remove_cart"),
     path('remove_cart_item/<int:product_id>/<int:cart_item_id>/',
          views.remove_cart_item, name="remove_cart_item"),
-    path('checkout/', views.checkout, name="checkout")
+    path('checkout/', views.checkout, name="checkout"),
+    path('api/', api.cart_api, name="cart_api"),
 ]
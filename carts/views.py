@@ -2,9 +2,15 @@
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from carts.models import Cart, CartItem  # Import Cart and CartItem models
-# Import Product and Variation models
-from store.models import Product, Variation
-from django.core.exceptions import ObjectDoesNotExist
+from carts.pricing import price_cart
+from carts.summary import cart_changed
+# Import the Product model
+from store.cards import render_product_cards
+from store.models import Product
+from store.recommendations import related_products
+from store.variations import resolve_variations, variation_signature
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.contrib.auth.decorators import login_required
 
 
@@ -14,176 +20,59 @@ def _cart_id(request):
     cart = request.session.session_key
     # If no session exists, create one (session key is generated)
     if not cart:
-        cart = request.session.create()
+        # create() returns None, the new key is read back from the session
+        request.session.create()
+        cart = request.session.session_key
     return cart  # Return the session key as the cart ID
 
 
+def _add_line(product, variation_ids, quantity=1, **owner):
+    # Add `quantity` units of the product with these variations to the owner's cart (user= or cart=).
+    # The line is found by its variation signature, so this is one UPDATE when it exists
+    # and one INSERT (plus the variations) when it does not.
+    signature = variation_signature(variation_ids)
+    line = CartItem.objects.filter(product=product, variation_signature=signature, **owner)
+    with transaction.atomic():
+        # F() increments in the database, two quick clicks can not overwrite each other
+        if line.update(quantity=F('quantity') + quantity):
+            return
+        try:
+            with transaction.atomic():
+                cart_item = CartItem.objects.create(
+                    product=product, quantity=quantity, variation_signature=signature, **owner)
+        except IntegrityError:
+            # A concurrent request created the same line first, the unique constraint caught it
+            line.update(quantity=F('quantity') + quantity)
+            return
+        if variation_ids:
+            cart_item.variations.add(*variation_ids)
+
+
 # Function to add a product to the cart
 def add_cart(request, product_id):
     current_user = request.user
     # Retrieve the product based on its ID
     product = Product.objects.get(id=product_id)
 
-    # if the user is authenticated
-    if current_user.is_authenticated:
-        product_variation = []
-
-        # Check if the request method is POST to capture form data
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item  # Form field name (like 'color' or 'size')
-                # Form field value (e.g., 'Red', 'Medium')
-                value = request.POST[key]
-
-                # Try to match a variation in the database for the product
-                try:
-                    variation = Variation.objects.get(
-                        product=product,
-                        variation_category__iexact=key,  # Case-insensitive match for the category
-                        variation_value__iexact=value  # Case-insensitive match for the value
-                    )
-                    # Add the found variation to the list
-                    product_variation.append(variation)
-                except:
-                    pass  # Ignore any variation that doesn't match
-
-        # check the current user having cartitems
-        is_cart_item_exist = CartItem.objects.filter(
-            product=product, user=current_user).exists()
-        if is_cart_item_exist:
-            # Retrieve all cart items for the product in the current cart
-            cart_items = CartItem.objects.filter(
-                product=product, user=current_user)
-
-            # Lists to hold existing variations and item IDs from the database
-            ex_var_list = []
-            id_list = []
-
-            # Loop through the cart items and gather variations and IDs
-            for item in cart_items:
-                existing_variation = item.variations.all()  # Get variations for each cart item
-                # Convert to list and add to ex_var_list
-                ex_var_list.append(list(existing_variation))
-                id_list.append(item.id)  # Store the item ID
-
-            # Check if the current product variations already exist in the cart
-            if product_variation in ex_var_list:
-                # If found, get the corresponding cart item and increase its quantity
-                index = ex_var_list.index(product_variation)
-                # Get the ID of the matching cart item
-                item_id = id_list[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1  # Increment the quantity
-                item.save()
-            else:
-                # If no matching variation, create a new cart item with the current variations
-                item = CartItem.objects.create(
-                    product=product, quantity=1, user=current_user)  # Here created cartitem
-                if product_variation:
-                    item.variations.clear()  # Clear existing variations
-                    # Add the new variations
-                    # Here we adding variations to the created item
-                    item.variations.add(*product_variation)
-                item.save()  # then save
-        else:
-            # If the product is not already in the cart, create a new CartItem
-            cart_item = CartItem.objects.create(
-                product=product,  # Link the product to the cart item
-                quantity=1,  # Set initial quantity to 1
-                user=current_user,  # Link the cart to the cart item
-            )
-            if product_variation:
-                cart_item.variations.clear()  # Clear existing variations
-                # Add the current variations
-                cart_item.variations.add(*product_variation)
-            cart_item.save()  # Save the new cart item
+    product_variation = []
+    # Check if the request method is POST to capture form data
+    if request.method == 'POST':
+        # Match the form fields (like 'color' or 'size') against the cached variations of the product
+        product_variation = resolve_variations(product.id, request.POST)
 
-        # Redirect the user to the cart page after adding the item
-        return redirect('cart')
-    # if the user is not authenticated this else block will run
+    # if the user is authenticated the cart items belong to the user
+    if current_user.is_authenticated:
+        _add_line(product, product_variation, user=current_user)
+    # if the user is not authenticated they belong to the cart of the session
     else:
-        product_variation = []
-
-        # Check if the request method is POST to capture form data
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item  # Form field name (like 'color' or 'size')
-                # Form field value (e.g., 'Red', 'Medium')
-                value = request.POST[key]
-
-                # Try to match a variation in the database for the product
-                try:
-                    variation = Variation.objects.get(
-                        product=product,
-                        variation_category__iexact=key,  # Case-insensitive match for the category
-                        variation_value__iexact=value  # Case-insensitive match for the value
-                    )
-                    # Add the found variation to the list
-                    product_variation.append(variation)
-                except:
-                    pass  # Ignore any variation that doesn't match
-
-        # Try to get the Cart object associated with the current session
-        try:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-        except Cart.DoesNotExist:
-            # If the cart doesn't exist, create a new one with the current session ID
-            cart = Cart.objects.create(cart_id=_cart_id(request))
-        cart.save()  # Save the cart instance
-
-        # Check if a cart item for the specific product already exists
-        is_cart_item_exist = CartItem.objects.filter(
-            product=product, cart=cart).exists()
-
-        if is_cart_item_exist:
-            # Retrieve all cart items for the product in the current cart
-            cart_items = CartItem.objects.filter(product=product, cart=cart)
-
-            # Lists to hold existing variations and item IDs from the database
-            ex_var_list = []
-            id_list = []
-
-            # Loop through the cart items and gather variations and IDs
-            for item in cart_items:
-                existing_variation = item.variations.all()  # Get variations for each cart item
-                # Convert to list and add to ex_var_list
-                ex_var_list.append(list(existing_variation))
-                id_list.append(item.id)  # Store the item ID
+        # Get the Cart object associated with the current session, or create it
+        cart, _ = Cart.objects.get_or_create(cart_id=_cart_id(request))
+        _add_line(product, product_variation, cart=cart)
 
-            # Check if the current product variations already exist in the cart
-            if product_variation in ex_var_list:
-                # If found, get the corresponding cart item and increase its quantity
-                index = ex_var_list.index(product_variation)
-                # Get the ID of the matching cart item
-                item_id = id_list[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1  # Increment the quantity
-                item.save()
-            else:
-                # If no matching variation, create a new cart item with the current variations
-                item = CartItem.objects.create(
-                    product=product, quantity=1, cart=cart)  # Here created cartitem
-                if product_variation:
-                    item.variations.clear()  # Clear existing variations
-                    # Add the new variations
-                    # Here we adding variations to the created item
-                    item.variations.add(*product_variation)
-                item.save()  # then save
-        else:
-            # If the product is not already in the cart, create a new CartItem
-            cart_item = CartItem.objects.create(
-                product=product,  # Link the product to the cart item
-                quantity=1,  # Set initial quantity to 1
-                cart=cart  # Link the cart to the cart item
-            )
-            if product_variation:
-                cart_item.variations.clear()  # Clear existing variations
-                # Add the current variations
-                cart_item.variations.add(*product_variation)
-            cart_item.save()  # Save the new cart item
-
-        # Redirect the user to the cart page after adding the item
-        return redirect('cart')
+    # Expire the cached navbar count of this cart
+    cart_changed(request)
+    # Redirect the user to the cart page after adding the item
+    return redirect('cart')
 
 
 # Function to decrease the quantity of a cart item or remove it if quantity is 1
@@ -208,6 +97,7 @@ def remove_cart(request, product_id, cart_item_id):
         else:
             # If quantity is 1, delete the cart item
             cart_item.delete()
+        cart_changed(request)
     except:
         pass  # Handle cases where the cart item doesn't exist
 
@@ -228,86 +118,29 @@ def remove_cart_item(request, product_id, cart_item_id):
         cart_item = CartItem.objects.get(
             product=product, cart=cart, id=cart_item_id)
     cart_item.delete()
+    cart_changed(request)
     return redirect('cart')
 
 
 # Function to display the cart page with total price and quantity
-def cart(request, total=0, quantity=0, cart_items=None):
-    try:
-        tax = 0
-        grand_total = 0
-        if request.user.is_authenticated:
-            # Get all active cart items associated with the user
-            cart_items = CartItem.objects.filter(
-                user=request.user, is_active=True)
-        else:
-            # Get the cart object based on the session's cart ID
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-
-            # Get all active cart items associated with the cart
-            cart_items = CartItem.objects.filter(cart=cart, is_active=True)
-
-        # Loop through each cart item to calculate total price and quantity
-        for cart_item in cart_items:
-            # Calculate total price
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity  # Calculate total quantity
-
-        tax = (2 * total) / 100  # Calculate 2% tax on the total
-        grand_total = total + tax  # Calculate the grand total including tax
-
-    except ObjectDoesNotExist:
-        # If no cart exists, pass (an empty cart page will be rendered)
-        pass
-
-    # Create a context to pass the cart information to the template
-    context = {
-        'total': total,  # Total price of all items in the cart
-        'quantity': quantity,  # Total quantity of all items in the cart
-        'cart_items': cart_items,  # List of active cart items
-        'tax': tax,  # Calculated tax
-        'grand_total': grand_total,  # Grand total including tax
-    }
+def cart(request):
+    # Lines, products and variations are loaded once and the totals computed from them, see carts/pricing.py
+    pricing = price_cart(request)
+
+    # Create a context to pass the cart information to the template:
+    # cart_items, total, quantity, tax and grand_total
+    context = pricing.context()
+    # Products often bought with the ones in the cart, precomputed by build_recommendations
+    context['related_cards'] = render_product_cards(
+        related_products({cart_item.product_id for cart_item in pricing.lines}),
+        'includes/product_card.html')
 
     # Render the 'cart.html' template with the context
     return render(request, 'store/cart.html', context)
 
 
 @login_required(login_url='login')
-def checkout(request, total=0, quantity=0, cart_items=None):
-    try:
-        tax = 0
-        grand_total = 0
-        if request.user.is_authenticated:
-            # Get all active cart items associated with the user
-            cart_items = CartItem.objects.filter(
-                user=request.user, is_active=True)
-        else:
-            # Get the cart object based on the session's cart ID
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-
-            # Get all active cart items associated with the cart
-            cart_items = CartItem.objects.filter(cart=cart, is_active=True)
-
-        # Loop through each cart item to calculate total price and quantity
-        for cart_item in cart_items:
-            # Calculate total price
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity  # Calculate total quantity
-
-        tax = (2 * total) / 100  # Calculate 2% tax on the total
-        grand_total = total + tax  # Calculate the grand total including tax
-
-    except ObjectDoesNotExist:
-        # If no cart exists, pass (an empty cart page will be rendered)
-        pass
-
-    # Create a context to pass the cart information to the template
-    context = {
-        'total': total,  # Total price of all items in the cart
-        'quantity': quantity,  # Total quantity of all items in the cart
-        'cart_items': cart_items,  # List of active cart items
-        'tax': tax,  # Calculated tax
-        'grand_total': grand_total,  # Grand total including tax
-    }
+def checkout(request):
+    # Same pricing as the cart page
+    context = price_cart(request).context()
     return render(request, 'store/checkout.html', context)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CategoryConfig(AppConfig):
     name = 'category'
+
+    def ready(self):
+        # Connect the model signals of the category app
+        from category import signals  # noqa: F401
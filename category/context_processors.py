@@ -1,6 +1,7 @@
-from .models import Category
+from .menu import category_menu
 
 
 def menu_links(request):
-    links = Category.objects.all()
+    # Cached per process, see category/menu.py
+    links = category_menu()
     return dict(links=links)
@@ -0,0 +1,31 @@
+import threading
+
+from store.versions import ChangeLog
+from .models import Category
+
+# Appended to by every worker when a category changes
+MENU_LOG = ChangeLog('menu')
+
+# The categories loaded by this process and the position of the change log they were loaded at
+_menu = {'position': None, 'categories': ()}
+_lock = threading.Lock()
+
+
+def category_menu():
+    """Return every Category, loaded once per process.
+
+    Each call costs a stat() of the menu change log, no query; the
+    categories are only queried again after menu_changed() was called in
+    any worker. The returned tuple is shared between requests, do not
+    modify its items.
+    """
+    with _lock:
+        position, changes = MENU_LOG.read(_menu['position'])
+        if changes is None or changes:
+            _menu['categories'] = tuple(Category.objects.order_by('id'))
+        _menu['position'] = position
+        return _menu['categories']
+
+
+def menu_changed():
+    MENU_LOG.changed(ChangeLog.RESET)
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from category.menu import menu_changed
+from category.models import Category
+
+
+# Every worker reloads its copy of the menu after a category write
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    menu_changed()
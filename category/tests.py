@@ -1,3 +1,35 @@
 from django.test import TestCase
 
-# Create your tests here.
+from category.menu import MENU_LOG, category_menu
+from category.models import Category
+from store.tests import isolate_change_logs
+
+
+class CategoryMenuTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+
+    def slugs(self):
+        return [category.slug for category in category_menu()]
+
+    def test_menu_is_reloaded_after_a_change_in_any_worker(self):
+        self.assertEqual(self.slugs(), ['shirts'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.slug = 'tops'
+            self.category.save()
+        self.assertEqual(self.slugs(), ['tops'])
+        # Another worker's write only shows in the log, written without our signals
+        Category.objects.filter(pk=self.category.pk).update(slug='tees')
+        self.assertEqual(self.slugs(), ['tops'])
+        MENU_LOG.append(MENU_LOG.RESET)
+        self.assertEqual(self.slugs(), ['tees'])
+
+    def test_unchanged_menu_costs_no_query(self):
+        category_menu()
+        with self.assertNumQueries(0):
+            category_menu()
+        # Nor does a page with the menu and an empty cart for a visitor without a session
+        self.client.get('/cart/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/cart/').status_code, 200)
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
     'store',
     'carts',
     'orders',
+    'taskqueue',
+    'analytics',
 ]
 
 MIDDLEWARE = [
@@ -90,6 +92,27 @@ DATABASES = {
     }
 }
 
+# Cache
+# The product card, cart summary and home block versions are read from the cache by
+# every worker, so it has to be shared between processes: a per-process cache would
+# only see the bumps of the worker that saved the row. Create the table once with
+# `python manage.py createcachetable`; Redis or Memcached can replace it without code changes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mercatokart_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+# The category menu and the facet index are kept in the memory of every worker and
+# checked against append-only change logs in this directory, a stat() per request
+# instead of a query. All the workers of the site must share it.
+CHANGE_LOG_DIR = BASE_DIR / 'var' / 'changes'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
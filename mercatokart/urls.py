@@ -20,6 +20,8 @@ from django.conf.urls.static import static
 from django.conf import settings
 
 urlpatterns = [
+    # Staff pages next to the admin, before it so the admin catch-all does not take them
+    path('admin/analytics/', include('analytics.urls')),
     path('admin/', admin.site.urls),
     path('', views.home, name='home'),
     path('store/', include('store.urls')),
@@ -1,25 +1,76 @@
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from store.admin_helpers import AutocompleteFilter, ScalableAdmin, prefix_range
 from .models import Payment, Order, OrderProduct
 
 
+class UserFilter(AutocompleteFilter):
+    title = 'user'
+    field_name = 'user'
+
+
+class ProductFilter(AutocompleteFilter):
+    title = 'product'
+    field_name = 'product'
+
+
 class OrderProductInline(admin.TabularInline):
     model = OrderProduct
-    readonly_fields = ('payment', 'user', 'product',
+    readonly_fields = ('payment', 'user', 'product', 'variations',
                        'quantity', 'product_price', 'ordered')
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'payment', 'user', 'product').prefetch_related('variations')
+
 
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdmin):
     list_display = ['order_number', 'full_name',
                     'phone', 'email', 'city', 'order_total', 'tax', 'status', 'is_ordered', 'created_at']
 
-    list_filter = ['status', 'is_ordered']
-    search_fields = ['order_number', 'first_name',
-                     'last_name', 'phone', 'email']
+    list_filter = ['status', 'is_ordered', UserFilter]
+    search_fields = ['order_number', 'email']
+    search_help_text = 'Exact order number (R123 for the legacy ones), or the beginning of the email address'
     list_per_page = 20
+    autocomplete_fields = ['user']
+    raw_id_fields = ['payment']
     inlines = [OrderProductInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Indexed lookups only: icontains on several columns reads every order
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(order_number=term), False
+        # The email prefix in any case, a range on UPPER(email) that order_email_upper_idx answers
+        matches = Q(**prefix_range('email_upper', term.upper()))
+        if term[0] in 'Rr' and term[1:].isdigit():
+            # Legacy number given by orders/migrations/0006 to orders without a distinct one
+            matches |= Q(order_number='R' + term[1:])
+        return queryset.annotate(email_upper=Upper('email')).filter(matches), False
+
+
+class PaymentAdmin(ScalableAdmin):
+    list_display = ['payment_id', 'user', 'payment_method', 'amount_paid', 'status', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['status', UserFilter]
+    search_fields = ['=payment_id']
+    autocomplete_fields = ['user']
+
+
+class OrderProductAdmin(ScalableAdmin):
+    list_display = ['__str__', 'order', 'user', 'quantity', 'product_price', 'ordered', 'created_at']
+    # __str__ shows the product name
+    list_select_related = ['product', 'order', 'user']
+    list_filter = ['ordered', ProductFilter]
+    autocomplete_fields = ['order', 'product', 'user']
+    raw_id_fields = ['payment']
+
 
-admin.site.register(Payment)
+admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Order, OrderAdmin)
-admin.site.register(OrderProduct)
+admin.site.register(OrderProduct, OrderProductAdmin)
@@ -0,0 +1,106 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from carts.models import CartItem
+from orders.models import Order, OrderProduct, OrderSummary, Payment
+from store.facets import product_changed
+from store.models import Product
+
+
+def record_order(order):
+    # Add a paid order to the user's OrderSummary, the dashboard reads this one row
+    changes = {
+        'order_count': F('order_count') + 1,
+        'lifetime_spend': F('lifetime_spend') + order.order_total,
+        'last_order': order,
+        'last_order_at': order.created_at,
+    }
+    if OrderSummary.objects.filter(user_id=order.user_id).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            OrderSummary.objects.create(
+                user_id=order.user_id, order_count=1, lifetime_spend=order.order_total,
+                last_order=order, last_order_at=order.created_at)
+    except IntegrityError:
+        # The first order of this user was recorded by a concurrent request
+        OrderSummary.objects.filter(user_id=order.user_id).update(**changes)
+
+
+def finalize_order(user, order_number, payment_id, payment_method, status):
+    """Record the payment of an order and turn the active lines of the user's cart into its order lines.
+
+    Runs in one transaction with the same number of queries whatever the size
+    of the cart: the order lines and their variations are bulk inserted, the
+    stock of every product is decremented by a single UPDATE ... CASE with
+    F() expressions so concurrent orders can not overwrite each other, and
+    the cart is emptied. The user's OrderSummary is updated in the same
+    transaction. Raises Order.DoesNotExist when the order is unknown
+    or already paid. Returns (order, payment).
+    """
+    with transaction.atomic():
+        # The row lock makes a second submission of the same payment wait, then fail the lookup
+        order = Order.objects.select_for_update().get(
+            user=user, is_ordered=False, order_number=order_number)
+
+        # Store transaction details inside Payment model
+        payment = Payment.objects.create(
+            user=user,
+            payment_id=payment_id,
+            payment_method=payment_method,
+            amount_paid=order.order_total,
+            status=status,
+        )
+        order.payment = payment
+        order.is_ordered = True
+        order.save(update_fields=['payment', 'is_ordered', 'updated_at'])
+        record_order(order)
+
+        # Move the cart items to Order Product Table, only the active lines that
+        # place_order priced (carts.pricing.cart_lines)
+        cart_items = list(CartItem.objects.filter(user=user, is_active=True).select_related('product'))
+        variations = CartItem.variations.through.objects.filter(
+            cartitem__user=user, cartitem__is_active=True).values_list('cartitem_id', 'variation_id')
+        OrderProduct.objects.bulk_create([
+            OrderProduct(
+                order=order,
+                payment=payment,
+                user=user,
+                product_id=item.product_id,
+                variation_signature=item.variation_signature,
+                quantity=item.quantity,
+                product_price=item.product.price,
+                ordered=True,
+            )
+            for item in cart_items
+        ])
+        # Not every backend returns the ids from bulk_create, read them back by line key
+        line_ids = {
+            (product_id, signature): line_id
+            for product_id, signature, line_id in OrderProduct.objects.filter(order=order).values_list(
+                'product_id', 'variation_signature', 'id')
+        }
+        item_lines = {item.id: line_ids[item.product_id, item.variation_signature] for item in cart_items}
+        OrderProduct.variations.through.objects.bulk_create([
+            OrderProduct.variations.through(orderproduct_id=item_lines[item_id], variation_id=variation_id)
+            for item_id, variation_id in variations if item_id in item_lines
+        ])
+
+        # Reduce the quantity of the sold products
+        sold = {}
+        for item in cart_items:
+            sold[item.product_id] = sold.get(item.product_id, 0) + item.quantity
+        if sold:
+            # update() skips auto_now and the model signals, set the date and log the change for
+            # the feed here; the facet index and the cards do not show the stock
+            Product.objects.filter(id__in=sold).update(stock=Case(
+                *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in sold.items()],
+                default=F('stock'),
+            ), modified_date=timezone.localdate())
+            for product_id in sold:
+                product_changed(product_id, facets=False)
+
+        # clear cart
+        CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
+    return order, payment
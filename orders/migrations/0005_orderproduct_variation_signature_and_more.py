@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:53
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_signatures(apps, schema_editor):
+    # Sign the existing order lines from their variations. Past orders are left as
+    # they were placed: lines repeated within an order are not merged.
+    OrderProduct = apps.get_model('orders', 'OrderProduct')
+    Through = OrderProduct.variations.through
+    variations = {}
+    for line_id, variation_id in Through.objects.values_list('orderproduct_id', 'variation_id'):
+        variations.setdefault(line_id, []).append(variation_id)
+    lines = []
+    for line in OrderProduct.objects.only('id').iterator():
+        canonical = ','.join(str(pk) for pk in sorted(set(variations.get(line.id, []))))
+        line.variation_signature = hashlib.sha1(canonical.encode()).hexdigest()
+        lines.append(line)
+    OrderProduct.objects.bulk_update(lines, ['variation_signature'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_remove_orderproduct_variation_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='variation_signature',
+            field=models.CharField(default='', max_length=40),
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='orderproduct',
+            index=models.Index(fields=['product', 'variation_signature'], name='orders_orde_product_737fcb_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+def dedupe_order_numbers(apps, schema_editor):
+    # Orders saved without a number (the old second save never ran) or sharing one
+    # get a distinct legacy number, so the unique index can be created
+    Order = apps.get_model('orders', 'Order')
+    seen = set()
+    for order_id, number in Order.objects.order_by('id').values_list('id', 'order_number'):
+        if number and number not in seen:
+            seen.add(number)
+            continue
+        Order.objects.filter(id=order_id).update(order_number='R%d' % order_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_orderproduct_variation_signature_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(dedupe_order_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
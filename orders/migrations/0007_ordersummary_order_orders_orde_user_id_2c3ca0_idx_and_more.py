@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderSummary = apps.get_model('orders', 'OrderSummary')
+    paid = Order.objects.filter(is_ordered=True, user__isnull=False)
+    last_orders = {}
+    for order_id, user_id in paid.order_by('user_id', '-created_at', '-id').values_list('id', 'user_id'):
+        last_orders.setdefault(user_id, order_id)
+    rows = paid.values('user_id').annotate(count=Count('id'), spend=Sum('order_total'), last=Max('created_at')).order_by()
+    OrderSummary.objects.bulk_create([
+        OrderSummary(user_id=row['user_id'], order_count=row['count'], lifetime_spend=row['spend'] or 0,
+                     last_order_id=last_orders[row['user_id']], last_order_at=row['last'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_userprofile'),
+        ('orders', '0006_ordernumbersequence_alter_order_order_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('lifetime_spend', models.FloatField(default=0)),
+                ('last_order_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'is_ordered', '-created_at', '-id'], name='orders_orde_user_id_2c3ca0_idx'),
+        ),
+        migrations.AddField(
+            model_name='ordersummary',
+            name='last_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.order'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
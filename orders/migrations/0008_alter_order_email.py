@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_ordersummary_order_orders_orde_user_id_2c3ca0_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='email',
+            field=models.EmailField(db_index=True, max_length=50),
+        ),
+    ]
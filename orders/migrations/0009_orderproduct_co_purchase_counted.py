@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_alter_order_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='co_purchase_counted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='orderproduct',
+            index=models.Index(condition=models.Q(('co_purchase_counted', False)), fields=['order', 'product'], name='orderproduct_uncounted_idx'),
+        ),
+    ]
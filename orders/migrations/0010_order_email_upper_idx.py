@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:41
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_orderproduct_co_purchase_counted'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='email',
+            field=models.EmailField(max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='order_email_upper_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 
 from accounts.models import Account
 from store.models import Product, Variation
@@ -27,7 +28,8 @@ class Order(models.Model):
     user = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True)
     payment = models.ForeignKey(
         Payment, on_delete=models.SET_NULL, blank=True, null=True)
-    order_number = models.CharField(max_length=20)
+    # Allocated before the insert by orders.numbers.allocate_order_number()
+    order_number = models.CharField(max_length=20, unique=True)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     phone = models.CharField(max_length=15)
@@ -46,6 +48,14 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Order history of a user, newest first, see accounts.views.my_orders
+            models.Index(fields=['user', 'is_ordered', '-created_at', '-id']),
+            # The admin search by email prefix, whatever the case, see orders.admin.OrderAdmin
+            models.Index(Upper('email'), name='order_email_upper_idx'),
+        ]
+
     def full_name(self):
         return f'{self.first_name} {self.last_name}'
 
@@ -56,6 +66,27 @@ class Order(models.Model):
         return self.first_name
 
 
+class OrderSummary(models.Model):
+    # Totals of a user's paid orders, kept up to date by orders.finalize.finalize_order
+    user = models.OneToOneField(Account, on_delete=models.CASCADE, primary_key=True, related_name='order_summary')
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_spend = models.FloatField(default=0)
+    last_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_order_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.user)
+
+
+class OrderNumberSequence(models.Model):
+    # Last order number handed out for a day, see orders/numbers.py
+    day = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '%s: %d' % (self.day, self.last_value)
+
+
 class OrderProduct(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     payment = models.ForeignKey(
@@ -63,11 +94,25 @@ class OrderProduct(models.Model):
     user = models.ForeignKey(Account, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variations = models.ManyToManyField(Variation, blank=True)
+    # Copied from the cart line, see store.variations.variation_signature
+    variation_signature = models.CharField(max_length=40, default='')
     quantity = models.IntegerField()
     product_price = models.FloatField()
     ordered = models.BooleanField(default=True)
+    # Set once store.recommendations has added the line to the pair counts
+    co_purchase_counted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # No unique (order, product, variation_signature): orders placed before the
+        # signature may repeat a line. New orders are copied from cart lines, which are unique.
+        indexes = [
+            models.Index(fields=['product', 'variation_signature']),
+            # Only the lines still to be counted, a handful between two builds
+            models.Index(fields=['order', 'product'], condition=models.Q(co_purchase_counted=False),
+                         name='orderproduct_uncounted_idx'),
+        ]
+
     def __str__(self):
         return self.product.product_name
@@ -0,0 +1,30 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orders.models import OrderNumberSequence
+
+# Digits of the daily counter, 20210305 + 000042 -> 20210305000042
+COUNTER_DIGITS = 6
+
+
+def allocate_order_number():
+    """Return a new order number: today's date followed by a per-day counter.
+
+    The counter lives in one OrderNumberSequence row per day and is moved
+    with an UPDATE ... SET last_value = last_value + 1, so concurrent
+    checkouts queue on that row instead of colliding. The number is known
+    before the Order is inserted.
+    """
+    today = timezone.localdate()
+    with transaction.atomic():
+        if not OrderNumberSequence.objects.filter(day=today).update(last_value=F('last_value') + 1):
+            try:
+                # First order of the day
+                with transaction.atomic():
+                    OrderNumberSequence.objects.create(day=today, last_value=1)
+            except IntegrityError:
+                # Another checkout created the row first
+                OrderNumberSequence.objects.filter(day=today).update(last_value=F('last_value') + 1)
+        value = OrderNumberSequence.objects.filter(day=today).values_list('last_value', flat=True).get()
+    return '%s%0*d' % (today.strftime('%Y%m%d'), COUNTER_DIGITS, value)
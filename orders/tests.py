@@ -1,3 +1,249 @@
-from django.test import TestCase
+import datetime
+import json
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from accounts.models import Account
+from carts.models import CartItem
+from carts.tests import CartTestCase
+from category.models import Category
+from orders.finalize import finalize_order
+from orders.models import Order, OrderNumberSequence, OrderProduct, Payment
+from orders.numbers import allocate_order_number
+from taskqueue.models import Task
+from store.models import Product
+from store.tests import isolate_change_logs, make_order, make_product, make_user
+from store.variations import variation_signature
+
+BILLING = {
+    'first_name': 'Test', 'last_name': 'User', 'phone': '555', 'email': 'buyer@example.com',
+    'address_line_1': 'Street 1', 'address_line_2': '', 'country': 'IN', 'state': 'KA', 'city': 'Bengaluru',
+    'order_note': '',
+}
+
+
+class PlaceOrderTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        isolate_change_logs(self)
+        self.hat.price = 50
+        self.hat.save()
+        # A saved-for-later line is neither priced nor sold
+        self.scarf = make_product(self.shirt.category, 'scarf', price=30)
+        self.add_line(self.shirt, 2, [self.red], user=self.user)
+        self.add_line(self.hat, 1, user=self.user)
+        CartItem.objects.create(product=self.scarf, quantity=5, user=self.user, is_active=False)
+        Product.objects.update(modified_date=datetime.date(2020, 1, 1))
+        self.client.force_login(self.user)
+
+    def test_order_totals_and_stock(self):
+        response = self.client.post('/orders/place_order/', BILLING)
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual((order.order_total, order.tax), (255, 5))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_order(self.user, order.order_number, 'PAY-1', 'PayPal', 'COMPLETED')
+
+        lines = OrderProduct.objects.filter(order=order)
+        self.assertEqual(sum(line.product_price * line.quantity for line in lines), 250)
+        self.assertEqual(
+            list(lines.get(product=self.shirt).variations.values_list('id', flat=True)), [self.red.id])
+        stock = dict(Product.objects.values_list('slug', 'stock'))
+        self.assertEqual((stock['shirt'], stock['hat'], stock['scarf']), (8, 9, 10))
+        self.assertEqual(Product.objects.get(slug='shirt').modified_date, timezone.localdate())
+        self.assertEqual(Product.objects.get(slug='scarf').modified_date, datetime.date(2020, 1, 1))
+        # Only the inactive line is left in the cart
+        self.assertEqual(list(CartItem.objects.filter(user=self.user).values_list('product__slug', flat=True)),
+                         ['scarf'])
+
+    def pay(self, order_number, payment_id='PAY-1'):
+        return self.client.post('/orders/payments/', json.dumps({
+            'orderID': order_number, 'transID': payment_id, 'payment_method': 'PayPal', 'status': 'COMPLETED',
+        }), content_type='application/json')
+
+    def test_double_submit(self):
+        self.client.post('/orders/place_order/', BILLING)
+        order = Order.objects.get(user=self.user)
+        first = self.pay(order.order_number)
+        self.assertEqual(first.status_code, 200)
+        # The second click gets the same answer, nothing is written or sent twice
+        second = self.pay(order.order_number)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(OrderProduct.objects.filter(order=order).count(), 2)
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(Product.objects.get(slug='shirt').stock, 8)
+        # Another payment for a paid order, or an order that does not exist
+        self.assertEqual(self.pay(order.order_number, 'PAY-2').status_code, 409)
+        self.assertEqual(self.pay('20990101000001').status_code, 404)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrate the orders app back to migrate_from, let the test add rows with the
+    historical models, then run the migration under test with migrate_to()."""
+
+    migrate_from = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.addCleanup(self.migrate_latest)
+        self.apps = self.migrate_to(self.migrate_from)
+
+    def migrate_to(self, name):
+        # Migrations of the other apps that depend on a later orders migration are unapplied too,
+        # the models are those of every migration still applied
+        self.executor.loader.build_graph()
+        self.executor.migrate([('orders', name)])
+        self.executor.loader.build_graph()
+        return self.executor.loader.project_state(list(self.executor.loader.applied_migrations)).apps
+
+    def migrate_latest(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+
+class SignatureBackfillTests(MigrationTestCase):
+    migrate_from = '0004_remove_orderproduct_variation_and_more'
+
+    def test_lines_are_signed_and_history_is_kept(self):
+        Category = self.apps.get_model('category', 'Category')
+        Product = self.apps.get_model('store', 'Product')
+        Variation = self.apps.get_model('store', 'Variation')
+        Account = self.apps.get_model('accounts', 'Account')
+        Order = self.apps.get_model('orders', 'Order')
+        OrderProduct = self.apps.get_model('orders', 'OrderProduct')
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        shirt = Product.objects.create(product_name='shirt', slug='shirt', price=100, stock=1, category=category)
+        red = Variation.objects.create(product=shirt, variation_category='color', variation_value='Red')
+        user = Account.objects.create(email='buyer@example.com', username='buyer', first_name='Test',
+                                      last_name='User')
+        order = Order.objects.create(user=user, order_number='1', order_total=200, tax=0, **{
+            name: value for name, value in BILLING.items() if name != 'order_note'})
+        # An old order with the same line twice
+        lines = [OrderProduct.objects.create(order=order, user=user, product=shirt, quantity=quantity,
+                                             product_price=100) for quantity in (1, 2)]
+        for line in lines:
+            line.variations.add(red)
+        plain = OrderProduct.objects.create(order=order, user=user, product=shirt, quantity=1, product_price=100)
+
+        apps = self.migrate_to('0005_orderproduct_variation_signature_and_more')
+        rows = apps.get_model('orders', 'OrderProduct').objects.order_by('id').values_list(
+            'id', 'quantity', 'variation_signature')
+        self.assertEqual(list(rows), [
+            (lines[0].id, 1, variation_signature([red.id])),
+            (lines[1].id, 2, variation_signature([red.id])),
+            (plain.id, 1, variation_signature([])),
+        ])
+
+
+class OrderAdminTests(TestCase):
+    url = '/admin/orders/order/'
+
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = make_product(category, 'shirt')
+        buyer = make_user('Buyer@Example.com')
+        self.orders = [make_order(buyer, [self.shirt]) for _ in range(3)]
+        self.orders[0].order_number = 'R%d' % self.orders[0].id
+        self.orders[0].save()
+        admin = Account.objects.create_superuser('Admin', 'User', 'admin@example.com', 'admin', 'secret')
+        self.client.force_login(admin)
+
+    def search(self, term):
+        response = self.client.get(self.url, {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return {order.id for order in response.context['cl'].result_list}
+
+    def test_search(self):
+        first, second, _ = self.orders
+        self.assertEqual(self.search(second.order_number), {second.id})
+        self.assertEqual(self.search('r%d' % first.id), {first.id})
+        self.assertEqual(self.search('buyer@ex'), {order.id for order in self.orders})
+        self.assertEqual(self.search('BUYER'), {order.id for order in self.orders})
+        self.assertEqual(self.search('someone'), set())
+
+    def test_capped_count_is_not_shown_as_exact(self):
+        self.assertContains(self.client.get(self.url), '3 orders')
+        with mock.patch('store.admin_helpers.COUNT_LIMIT', 2):
+            response = self.client.get(self.url)
+            self.assertContains(response, '2+ orders')
+            self.assertContains(self.client.get(self.url, {'q': 'buyer'}), '2+ results')
+
+
+class OrderNumberTests(TestCase):
+    def test_per_day_sequence(self):
+        day = datetime.date(2026, 3, 5)
+        with mock.patch('django.utils.timezone.localdate', return_value=day):
+            self.assertEqual([allocate_order_number() for _ in range(2)], ['20260305000001', '20260305000002'])
+        with mock.patch('django.utils.timezone.localdate', return_value=day + datetime.timedelta(days=1)):
+            self.assertEqual(allocate_order_number(), '20260306000001')
+        self.assertEqual(OrderNumberSequence.objects.get(day=day).last_value, 2)
+
+
+    def test_first_order_of_the_day_created_by_another_checkout(self):
+        # The row did not exist yet at our UPDATE, but another checkout inserted it before our INSERT
+        day = datetime.date(2026, 3, 5)
+        OrderNumberSequence.objects.create(day=day, last_value=1)
+        update = QuerySet.update
+        calls = []
+
+        def update_once_too_early(queryset, **values):
+            calls.append(values)
+            return 0 if len(calls) == 1 else update(queryset, **values)
+
+        with mock.patch('django.utils.timezone.localdate', return_value=day), \
+                mock.patch.object(QuerySet, 'update', update_once_too_early):
+            self.assertEqual(allocate_order_number(), '20260305000002')
+        self.assertEqual(len(calls), 2)
+
+
+class ConcurrentOrderNumberTests(TransactionTestCase):
+    def test_concurrent_checkouts_get_distinct_numbers(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('the in-memory SQLite test database fails concurrent writers instead of making them wait')
+        numbers, errors = [], []
+
+        def checkout():
+            try:
+                for _ in range(5):
+                    numbers.append(allocate_order_number())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(numbers)), 20)
+        self.assertEqual(max(numbers)[-6:], '000020')
+
+
+class OrderNumberMigrationTests(MigrationTestCase):
+    migrate_from = '0005_orderproduct_variation_signature_and_more'
+
+    def test_missing_and_repeated_numbers_are_renamed(self):
+        Account = self.apps.get_model('accounts', 'Account')
+        Order = self.apps.get_model('orders', 'Order')
+        user = Account.objects.create(email='buyer@example.com', username='buyer', first_name='Test',
+                                      last_name='User')
+        fields = {name: value for name, value in BILLING.items() if name != 'order_note'}
+        orders = [Order.objects.create(user=user, order_number=number, order_total=10, tax=0, **fields)
+                  for number in ['2021030501', '', '2021030501', '2021030502']]
+
+        apps = self.migrate_to('0006_ordernumbersequence_alter_order_order_number')
+        numbers = dict(apps.get_model('orders', 'Order').objects.values_list('id', 'order_number'))
+        self.assertEqual([numbers[order.id] for order in orders], [
+            '2021030501', 'R%d' % orders[1].id, 'R%d' % orders[2].id, '2021030502'])
@@ -1,69 +1,40 @@
-import datetime
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
-from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 
-from carts.models import CartItem
+from carts.pricing import price_cart
+from carts.summary import cart_changed
+from orders.finalize import finalize_order
 from orders.forms import OrderForm
+from orders.numbers import allocate_order_number
 from orders.models import Order, OrderProduct, Payment
+from taskqueue.tasks import send_email
 import json
 
-from store.models import Product
 
 
 def payments(request):
     body = json.loads(request.body)
-    print(body)
-    order = Order.objects.get(
-        user=request.user, is_ordered=False, order_number=body['orderID'])
-
-    # Store transaction details inside Payment model
-    payment = Payment(
-        user=request.user,
-        payment_id=body['transID'],
-        payment_method=body['payment_method'],
-        amount_paid=order.order_total,
-        status=body['status'],
-    )
-    payment.save()
-
-    order.payment = payment
-    order.is_ordered = True
-    order.save()
-
-    # Move the cart items to Order Product Table
-    cart_items = CartItem.objects.filter(user=request.user)
-
-    for item in cart_items:
-        orderproduct = OrderProduct()
-        orderproduct.order_id = order.id
-        orderproduct.payment = payment
-        orderproduct.user_id = request.user.id
-        orderproduct.product_id = item.product_id
-        orderproduct.quantity = item.quantity
-        orderproduct.product_price = item.product.price
-        orderproduct.ordered = True
-        orderproduct.save()
-
-        cart_item = CartItem.objects.get(id=item.id)
-        # Here we get the product variation
-        product_variation = cart_item.variations.all()
-        # The above save() order product generated a id, that id we accessing here
-        # using that id we get order product
-        orderproduct = OrderProduct.objects.get(id=orderproduct.id)
-        # Then now we have product variation & order poduct
-        # Then next we need to add this product variations to the order prodcut
-        orderproduct.variations.set(product_variation)
-        orderproduct.save()
-
-        # Reduce the quantity of the sold products
-        product = Product.objects.get(id=item.product_id)
-        product.stock -= item.quantity
-        product.save()
-
-    # clear cart
-    CartItem.objects.filter(user=request.user).delete()
+    # Payment, order lines, stock and cart are written in one transaction, see orders/finalize.py
+    try:
+        order, payment = finalize_order(
+            request.user,
+            order_number=body['orderID'],
+            payment_id=body['transID'],
+            payment_method=body['payment_method'],
+            status=body['status'],
+        )
+    except Order.DoesNotExist:
+        # A second submission of the same payment (double click, retried request) finds the
+        # order already paid: answer like the first one did, without a second email
+        order = Order.objects.filter(
+            user=request.user, order_number=body['orderID'], is_ordered=True).select_related('payment').first()
+        if order is None:
+            return JsonResponse({'error': 'unknown order'}, status=404)
+        if order.payment is None or order.payment.payment_id != body['transID']:
+            return JsonResponse({'error': 'order already paid'}, status=409)
+        return JsonResponse({'order_number': order.order_number, 'transID': order.payment.payment_id})
+    cart_changed(request)
 
     # Send order recieved email to customer
     mail_subject = "Thank You for Your order"
@@ -73,8 +44,8 @@ def payments(request):
             'order': order,
         })
     to_email = request.user.email
-    send_email = EmailMessage(mail_subject, message, to=[to_email])
-    send_email.send()
+    # Sent by the background worker (manage.py run_worker), the request does not wait for SMTP
+    send_email.delay(subject=mail_subject, body=message, to=[to_email])
 
     # Send order number and transaction id back to sendData method via JsonResponse
     data = {
@@ -88,22 +59,19 @@ def payments(request):
     return JsonResponse(data)
 
 
-def place_order(request, total=0, quantity=0,):
+def place_order(request):
     current_user = request.user
 
+    # Lines and totals come from the same pricing as the cart and checkout pages
+    pricing = price_cart(request)
     # if the cart item count is less than or equal to 0, then redirect to shop
-    cart_items = CartItem.objects.filter(user=current_user)
-    cart_count = cart_items.count()
-    if cart_count <= 0:
+    if not pricing.lines:
         return redirect('store')
 
-    grand_total = 0
-    tax = 0
-    for cart_item in cart_items:
-        total += (cart_item.product.price * cart_item.quantity)
-        quantity = cart_item.quantity
-    tax = (2 * total)/100
-    grand_total = total + tax
+    cart_items = pricing.lines
+    total = pricing.total
+    tax = pricing.tax
+    grand_total = pricing.grand_total
 
     if request.method == 'POST':
         form = OrderForm(request.POST)
@@ -125,20 +93,11 @@ def place_order(request, total=0, quantity=0,):
             data.order_total = grand_total
             data.tax = tax
             data.ip = request.META.get('REMOTE_ADDR')
+            # The order number (20210305000042) is allocated before the insert, one save is enough
+            data.order_number = allocate_order_number()
             data.save()
+            order = data
 
-            # Generate order number
-            yr = int(datetime.date.today().strftime('%Y'))
-            dt = int(datetime.date.today().strftime('%d'))
-            mt = int(datetime.date.today().strftime('%m'))
-            d = datetime.date(yr, mt, dt)
-            current_date = d.strftime("%Y%m%d")  # 20210305
-            order_number = current_date + str(data.id)
-            data.order_number = order_number
-            data.save()
-
-            order = Order.objects.get(
-                user=current_user, is_ordered=False, order_number=order_number)
             context = {
                 'order': order,
                 'cart_items': cart_items,
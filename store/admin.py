@@ -1,41 +1,136 @@
 # Importing the admin module to customize how the models are displayed in the Django admin site.
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 # Importing the Product model from the current app’s models file.
 from store.models import Product, ProductGallery, Variation, ReviewRating
+from store.admin_helpers import AutocompleteFilter, ScalableAdmin
+from store.bulk import ProductUpdateError, change_prices, set_available, set_stock
 import admin_thumbnails
 
 
-@admin_thumbnails.thumbnail('image')
+# Product filter with a search box, the sidebar does not list every product
+class ProductFilter(AutocompleteFilter):
+    title = 'product'
+    field_name = 'product'
+
+
+# The preview reads the cached 160px rendition instead of the full-size upload
+@admin_thumbnails.thumbnail('thumbnail', 'Preview')
 class ProductGalleryInline(admin.TabularInline):
     model = ProductGallery
     extra = 1
 
 
+# Extra inputs next to the actions dropdown, read by the bulk price and stock actions.
+# The ranges are checked by the actions, a form error would only say "No action selected".
+class ProductActionForm(ActionForm):
+    percent = forms.IntegerField(required=False, label='Percent',
+                                 widget=forms.NumberInput(attrs={'style': 'width: 5em'}))
+    stock = forms.IntegerField(required=False, label='Stock',
+                               widget=forms.NumberInput(attrs={'style': 'width: 5em'}))
+
+
+def _action_value(modeladmin, request, name):
+    try:
+        value = ProductActionForm.base_fields[name].clean(request.POST.get(name))
+    except forms.ValidationError:
+        value = None
+    if value is None:
+        modeladmin.message_user(request, 'Enter a %s next to the action.' % name, messages.ERROR)
+    return value
+
+
+# Each bulk action is a single UPDATE over the selected products
+@admin.action(description='Change the price of the selected products by Percent')
+def change_price_action(modeladmin, request, queryset):
+    percent = _action_value(modeladmin, request, 'percent')
+    if percent is None:
+        return
+    try:
+        changed = change_prices(queryset, percent)
+    except ProductUpdateError as e:
+        modeladmin.message_user(request, str(e), messages.ERROR)
+        return
+    modeladmin.message_user(request, 'Changed the price of %d products by %d%%.' % (changed, percent))
+
+
+@admin.action(description='Set the stock of the selected products to Stock')
+def set_stock_action(modeladmin, request, queryset):
+    stock = _action_value(modeladmin, request, 'stock')
+    if stock is None:
+        return
+    try:
+        changed = set_stock(queryset, stock)
+    except ProductUpdateError as e:
+        modeladmin.message_user(request, str(e), messages.ERROR)
+        return
+    modeladmin.message_user(request, 'Set the stock of %d products to %d.' % (changed, stock))
+
+
+@admin.action(description='Make the selected products available')
+def make_available_action(modeladmin, request, queryset):
+    changed = set_available(queryset, True)
+    modeladmin.message_user(request, '%d products are now available.' % changed)
+
+
+@admin.action(description='Make the selected products unavailable')
+def make_unavailable_action(modeladmin, request, queryset):
+    changed = set_available(queryset, False)
+    modeladmin.message_user(request, '%d products are now unavailable.' % changed)
+
+
 # Creating a custom admin class to define how the Product model appears in the admin site.
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdmin):
 
     # Specifies the fields to display in the list view of the Product model in the Django admin.
     # Each of these fields will be displayed as a column.
     list_display = ('product_name', 'price', 'stock',
                     'category', 'modified_date', 'is_available', 'featured')
+    # The category column is read from the same query instead of one query per row
+    list_select_related = ('category',)
+    list_filter = ('is_available', 'featured', 'category')
+    # Also used by the product search boxes of the other admin pages
+    search_fields = ('product_name',)
+    # Newest first; the autocomplete boxes page through this order too
+    ordering = ('-id',)
 
     # Automatically populates the slug field based on the product_name field.
     # This helps in generating a URL-friendly slug without manually entering it.
     prepopulated_fields = {'slug': ('product_name',)}
     inlines = [ProductGalleryInline]
+    action_form = ProductActionForm
+    actions = [change_price_action, set_stock_action, make_available_action, make_unavailable_action]
 
 
-class VariationAdmin(admin.ModelAdmin):
+class VariationAdmin(ScalableAdmin):
     list_display = ('product', 'variation_category',
                     'variation_value', 'is_active')
     list_editable = ('is_active',)  # now this is active is editable
-    list_filter = ('product', 'variation_category',
-                   'variation_value', 'is_active')  # we can get a filter in right side admin panel
+    list_select_related = ('product',)
+    list_filter = (ProductFilter, 'variation_category',
+                   'is_active')  # we can get a filter in right side admin panel
+    autocomplete_fields = ('product',)
+
+
+class ReviewRatingAdmin(ScalableAdmin):
+    list_display = ('subject', 'product', 'user', 'rating', 'status', 'created_date')
+    list_select_related = ('product', 'user')
+    list_filter = (ProductFilter, 'status', 'rating')
+    autocomplete_fields = ('product', 'user')
+
+
+class ProductGalleryAdmin(ScalableAdmin):
+    list_display = ('__str__', 'image')
+    # __str__ shows the product name
+    list_select_related = ('product',)
+    list_filter = (ProductFilter,)
+    autocomplete_fields = ('product',)
 
 
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Variation, VariationAdmin)
-admin.site.register(ReviewRating)
-admin.site.register(ProductGallery)
+admin.site.register(ReviewRating, ReviewRatingAdmin)
+admin.site.register(ProductGallery, ProductGalleryAdmin)
@@ -0,0 +1,107 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Changelists never count more rows than this, the page links stop there
+COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for changelists over large tables.
+
+    An unfiltered list on PostgreSQL uses the planner's row estimate of the
+    table, anything else counts at most COUNT_LIMIT rows. Use it with
+    show_full_result_count = False so the admin does not count the whole
+    table a second time.
+
+    count_label is what the changelist shows instead of an inexact count,
+    "about 1,234,567" or "10,000+" (see templates/admin/pagination.html).
+    """
+    count_label = ''
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            # -1 (never analyzed) or a small table: counting is cheap enough
+            if row and row[0] > COUNT_LIMIT:
+                self.count_label = 'about {:,}'.format(row[0])
+                return row[0]
+        # One row past the limit tells a capped count from an exact one
+        count = queryset[:COUNT_LIMIT + 1].count()
+        if count > COUNT_LIMIT:
+            self.count_label = '{:,}+'.format(COUNT_LIMIT)
+            return COUNT_LIMIT
+        return count
+
+
+def prefix_range(field, term):
+    # Lookups for "field starts with term" written as a range, which a plain index on the column answers
+    return {field + '__gte': term, field + '__lt': term + '\uffff'}
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    # Base of the changelists over tables that can grow to millions of rows
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        # select2 and the admin autocomplete script, used by AutocompleteFilter
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """Sidebar filter on a foreign key with a search box instead of one link per related row.
+
+    The choices come from the admin autocomplete view, so the ModelAdmin of
+    the related model needs search_fields; only the selected row is loaded.
+    Subclasses set title and field_name, the ModelAdmin extends ScalableAdmin
+    for the scripts.
+    """
+    template = 'admin/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = '%s__id__exact' % self.field_name
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(), required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site))
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**{self.parameter_name: self.value()})
+        except (ValueError, ValidationError) as e:
+            # Same as the built-in filters: the changelist shows its "invalid lookup" page
+            raise IncorrectLookupParameters(e)
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'All',
+        }
+
+    def widget(self):
+        return self.form_field.widget.render(
+            self.parameter_name, self.value(), attrs={'id': 'filter_%s' % self.parameter_name})
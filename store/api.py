@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+
+from django.contrib import auth
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from store.bulk import ProductUpdateError, apply_product_updates
+
+# Rows accepted in one request, larger syncs are sent in several requests
+MAX_ROWS = 5000
+
+
+def _basic_auth_user(request):
+    # Scripts such as the ERP sync send an email and password with HTTP Basic authentication
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, credentials = header.partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        email, _, password = base64.b64decode(credentials).decode('utf-8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return auth.authenticate(email=email, password=password)
+
+
+# Only HTTP Basic credentials are accepted, which a browser never sends on its own
+# since this view does not ask for them, so the CSRF check is not needed
+@csrf_exempt
+@require_POST
+def product_updates(request):
+    """Batch price and stock update for the ERP.
+
+    POST {"products": [{"sku": "blue-shirt", "price": 120, "stock": 8}, ...]},
+    the sku is the product slug. price and stock are new values; send
+    {"sku": ..., "stock_delta": -2} to add to the stock instead, see
+    store.bulk.apply_product_updates. Returns the number of products
+    updated and unchanged and the skus not found; a 400 with the first
+    invalid row writes nothing.
+    """
+    user = _basic_auth_user(request)
+    if user is None:
+        return JsonResponse({'error': 'authentication required'}, status=401)
+    if not user.has_perm('store.change_product'):
+        return JsonResponse({'error': 'permission denied'}, status=403)
+
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'invalid JSON'}, status=400)
+    rows = body.get('products') if isinstance(body, dict) else None
+    if not isinstance(rows, list):
+        return JsonResponse({'error': 'expected {"products": [...]}'}, status=400)
+    if len(rows) > MAX_ROWS:
+        return JsonResponse({'error': 'at most %d products per request' % MAX_ROWS}, status=400)
+
+    try:
+        result = apply_product_updates(rows)
+    except ProductUpdateError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(result)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        # Connect the model signals of the store app and register its system checks
+        from store import checks, signals  # noqa: F401
@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from store.cards import category_cards_changed
+from store.facets import catalog_changed
+from store.models import Product
+
+# Rows read or written per query by apply_product_updates
+BATCH_SIZE = 500
+
+# Smallest percentage a price change can take, -100 would make everything free
+MIN_PERCENT = -99
+
+
+class ProductUpdateError(ValueError):
+    pass
+
+
+def products_changed(category_ids, stock_only=False):
+    # Bulk writes skip the model signals, expire the derived caches once for the whole batch:
+    # the facet index is rebuilt and every card of the touched categories is rendered again.
+    # Neither shows the stock, a stock-only write only moves the catalog log of the feed.
+    catalog_changed(facets=not stock_only)
+    if stock_only:
+        return
+    for category_id in category_ids:
+        category_cards_changed(category_id)
+
+
+def _update(queryset, **values):
+    # One UPDATE for every selected product, returns the number of products changed
+    with transaction.atomic():
+        category_ids = set(queryset.order_by().values_list('category_id', flat=True).distinct())
+        changed = queryset.update(modified_date=timezone.localdate(), **values)
+        if changed:
+            products_changed(category_ids, stock_only=set(values) == {'stock'})
+    return changed
+
+
+def change_prices(queryset, percent):
+    """Raise (or lower, with a negative percent) the price of the products by percent, rounded."""
+    if percent < MIN_PERCENT:
+        raise ProductUpdateError('percent must be at least %d' % MIN_PERCENT)
+    factor = (100 + percent) / 100
+    return _update(queryset, price=Cast(
+        Round(Cast(F('price'), FloatField()) * factor), IntegerField()))
+
+
+def set_stock(queryset, stock):
+    if stock < 0:
+        raise ProductUpdateError('stock can not be negative')
+    return _update(queryset, stock=stock)
+
+
+def set_available(queryset, is_available):
+    return _update(queryset, is_available=is_available)
+
+
+def _value(row, name):
+    value = row.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ProductUpdateError('%s must be an integer of 0 or more' % name)
+    return value
+
+
+def _delta(row, name):
+    value = row.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ProductUpdateError('%s must be an integer' % name)
+    return value
+
+
+def apply_product_updates(rows):
+    """Set the price and/or stock of products identified by slug, or move their stock by a delta.
+
+    rows is a list of {"sku": slug, "price": 120, "stock": 8} or
+    {"sku": slug, "stock_delta": -2}. price and stock are the new values,
+    stock_delta is added to the stock in the database with F() so the orders
+    placed since the ERP read it are not overwritten; all three are optional
+    and a repeated sku keeps its last row. Products whose values do not
+    change are not written, the new values are saved with bulk_update and
+    the deltas with one UPDATE ... CASE, in one transaction. Raises
+    ProductUpdateError on the first invalid row, or a delta that would take
+    the stock below 0, before anything is written. Returns
+    {'updated': n, 'unchanged': n, 'unknown': [skus not in the catalog]}.
+    """
+    changes, deltas = {}, {}
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict) or not isinstance(row.get('sku'), str):
+                raise ProductUpdateError('sku must be a string')
+            values = {name: _value(row, name) for name in ('price', 'stock')}
+            delta = _delta(row, 'stock_delta')
+            if delta is not None and values['stock'] is not None:
+                raise ProductUpdateError('give either stock or stock_delta')
+        except ProductUpdateError as e:
+            raise ProductUpdateError('row %d: %s' % (index, e))
+        changes[row['sku']] = {name: value for name, value in values.items() if value is not None}
+        deltas[row['sku']] = delta or 0
+
+    today = timezone.localdate()
+    with transaction.atomic():
+        # The row locks keep an order placed meanwhile from being overwritten by an older stock
+        products = (Product.objects.select_for_update().only('id', 'slug', 'price', 'stock', 'category_id')
+                    .in_bulk(list(changes), field_name='slug'))
+        to_update, increments, changed = [], {}, []
+        for slug, values in changes.items():
+            product = products.get(slug)
+            if product is None:
+                continue
+            if product.stock + deltas[slug] < 0:
+                raise ProductUpdateError('%s: stock_delta %d would leave a stock of %d' % (
+                    slug, deltas[slug], product.stock + deltas[slug]))
+            written = any(getattr(product, name) != value for name, value in values.items())
+            if written:
+                for name, value in values.items():
+                    setattr(product, name, value)
+                product.modified_date = today
+                to_update.append(product)
+            if deltas[slug]:
+                increments[product.id] = deltas[slug]
+            if written or deltas[slug]:
+                changed.append(product)
+        Product.objects.bulk_update(to_update, ['price', 'stock', 'modified_date'], batch_size=BATCH_SIZE)
+        if increments:
+            Product.objects.filter(id__in=increments).update(stock=Case(
+                *[When(id=product_id, then=F('stock') + delta) for product_id, delta in increments.items()],
+                default=F('stock'),
+            ), modified_date=today)
+        if changed:
+            products_changed({product.category_id for product in changed},
+                             stock_only=all('price' not in changes[product.slug] for product in changed))
+    return {
+        'updated': len(changed),
+        'unchanged': len(products) - len(changed),
+        'unknown': sorted(slug for slug in changes if slug not in products),
+    }
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from store.versions import get_versions, versions_changed
+
+# Rendered cards live for a day at most, a version bump makes them unreachable before that
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def _product_version_key(product_id):
+    return 'store:card_version:product:%d' % product_id
+
+
+def _category_version_key(category_id):
+    return 'store:card_version:category:%d' % category_id
+
+
+def product_card_changed(product_id):
+    versions_changed(_product_version_key(product_id))
+
+
+def category_cards_changed(category_id):
+    # Cards show the category slug in their links, renaming a category expires all of its cards
+    versions_changed(_category_version_key(category_id))
+
+
+def render_product_cards(products, template_name):
+    """Return the rendered card of every product, reusing the cached HTML.
+
+    A card is cached under the product id plus the versions of the product
+    and of its category, so any write to the Product, its Category
+    or its reviews switches to a fresh key. A listing costs two cache reads
+    and only the cards that changed since the last request are rendered.
+    """
+    products = list(products)
+    if not products:
+        return []
+    version_keys = set()
+    for product in products:
+        version_keys.add(_product_version_key(product.id))
+        version_keys.add(_category_version_key(product.category_id))
+    versions = get_versions(list(version_keys))
+
+    card_keys = [
+        'store:card:%s:%d:%s:%s' % (
+            template_name, product.id,
+            versions[_product_version_key(product.id)],
+            versions[_category_version_key(product.category_id)])
+        for product in products
+    ]
+    cached = cache.get_many(card_keys)
+
+    cards = []
+    rendered = {}
+    for product, key in zip(products, card_keys):
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = render_to_string(template_name, {'product': product})
+        cards.append(mark_safe(html))
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    return cards
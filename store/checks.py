@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Cache backends whose data lives in one process only
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    # The card, cart and home block versions are bumped by the worker that saved the row and
+    # read by all the others; with a per-process cache the others keep serving stale data
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            'The default cache is local to each process.',
+            hint='Product cards and cart badges cached by other workers will never be '
+                 'invalidated. Use a shared backend (database, Redis, Memcached).',
+            id='store.W001',
+        )]
+    return []
@@ -0,0 +1,290 @@
+import threading
+from bisect import bisect_left, insort
+
+from store.models import Product, Variation
+from store.versions import ChangeLog
+
+# Price buckets shown in the sidebar, the upper bound is exclusive and None means no limit
+PRICE_BUCKETS = [(0, 50), (50, 100), (100, 200), (200, 500),
+                 (500, 1000), (1000, 1500), (1500, 2000), (2000, None)]
+
+# Product ids whose indexed columns changed, appended by the worker that wrote them
+FACET_LOG = ChangeLog('facets')
+
+# Every product write, including the columns the index does not hold (the feed ETag)
+CATALOG_LOG = ChangeLog('catalog')
+
+# Past this many changed products since the last request, rebuilding is cheaper than patching
+REFRESH_LIMIT = 500
+
+
+def _bit(product_id):
+    return 1 << product_id
+
+
+def _popcount(bits):
+    return bits.bit_count()
+
+
+def bits_from_ids(ids):
+    # Build a bitset in one pass over a byte buffer: OR-ing 1 << id for every id
+    # copies the whole integer each time, quadratic on a large catalog
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for product_id in ids:
+        buffer[product_id >> 3] |= 1 << (product_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bits_to_ids(bits):
+    # Positions of the set bits, lowest product id first
+    digits = bin(bits)[:1:-1]
+    ids = []
+    position = digits.find('1')
+    while position != -1:
+        ids.append(position)
+        position = digits.find('1', position + 1)
+    return ids
+
+
+def _price_bucket(price):
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        if price >= low and (high is None or price < high):
+            return index
+    return None
+
+
+class FacetResult:
+    def __init__(self, ids, category_counts, size_counts, price_counts):
+        # Matching product ids in ascending order
+        self.ids = ids
+        # {category slug: count}, {size value: count}, [(low, high, count)]
+        self.category_counts = category_counts
+        self.size_counts = size_counts
+        self.price_counts = price_counts
+
+
+class FacetIndex:
+    """In-memory bitmap index of the available catalog.
+
+    Every attribute value (category slug, size) owns a Python int used as a
+    bitset where bit N is set when product N has that value. Filtering is a
+    few AND/OR operations and each facet count is a popcount, so the store
+    sidebar never has to join through the variations table.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Position of FACET_LOG the index is up to date with
+        self.position = None
+        self.clear()
+
+    def clear(self):
+        self.available = 0
+        self.categories = {}
+        self.sizes = {}
+        # product id -> (category slug, sizes, price, created date ordinal) of every indexed product
+        self.products = {}
+        # sorted (price, product id) pairs for range filters
+        self.price_index = []
+        # one bitset per PRICE_BUCKETS entry, for the sidebar counts and whole-bucket filters
+        self.price_buckets = [0] * len(PRICE_BUCKETS)
+
+    def rebuild(self):
+        with self.lock:
+            self.clear()
+            sizes = {}
+            for product_id, value in Variation.objects.filter(
+                    variation_category='size', is_active=True).order_by('id').values_list('product_id', 'variation_value'):
+                sizes.setdefault(product_id, []).append(value)
+                # register the value even when its product is not available, so the sidebar order stays stable
+                self.sizes.setdefault(value, 0)
+            rows = Product.objects.filter(is_available=True).values_list(
+                'id', 'category__slug', 'price', 'created_date')
+            # Group the ids first and turn every group into a bitset once
+            category_ids, size_ids, bucket_ids = {}, {}, [[] for _ in PRICE_BUCKETS]
+            for product_id, category_slug, price, created_date in rows:
+                product_sizes = sizes.get(product_id, ())
+                self.products[product_id] = (category_slug, frozenset(product_sizes), price,
+                                             created_date.toordinal())
+                self.price_index.append((price, product_id))
+                category_ids.setdefault(category_slug, []).append(product_id)
+                for value in product_sizes:
+                    size_ids.setdefault(value, []).append(product_id)
+                bucket = _price_bucket(price)
+                if bucket is not None:
+                    bucket_ids[bucket].append(product_id)
+            self.price_index.sort()
+            self.available = bits_from_ids(self.products)
+            self.categories = {slug: bits_from_ids(ids) for slug, ids in category_ids.items()}
+            for value, ids in size_ids.items():
+                self.sizes[value] = bits_from_ids(ids)
+            self.price_buckets = [bits_from_ids(ids) for ids in bucket_ids]
+
+    def refresh_product(self, product_id):
+        self.refresh_products([product_id])
+
+    def refresh_products(self, product_ids):
+        # Re-read the products after a write, two queries whatever their number
+        with self.lock:
+            for product_id in product_ids:
+                self._remove(product_id)
+            rows = Product.objects.filter(id__in=product_ids, is_available=True).values_list(
+                'id', 'category__slug', 'price', 'created_date')
+            sizes = {}
+            for product_id, value in Variation.objects.filter(
+                    product_id__in=product_ids, variation_category='size', is_active=True).order_by('id').values_list(
+                    'product_id', 'variation_value'):
+                sizes.setdefault(product_id, []).append(value)
+            for product_id, category_slug, price, created_date in rows:
+                self._add(product_id, category_slug, sizes.get(product_id, []), price, created_date)
+
+    def _add(self, product_id, category_slug, sizes, price, created_date):
+        bit = _bit(product_id)
+        self.available |= bit
+        self.categories[category_slug] = self.categories.get(category_slug, 0) | bit
+        for value in sizes:
+            self.sizes[value] = self.sizes.get(value, 0) | bit
+        self.products[product_id] = (category_slug, frozenset(sizes), price, created_date.toordinal())
+        insort(self.price_index, (price, product_id))
+        bucket = _price_bucket(price)
+        if bucket is not None:
+            self.price_buckets[bucket] |= bit
+
+    def _remove(self, product_id):
+        record = self.products.pop(product_id, None)
+        if record is None:
+            return
+        category_slug, sizes, price, _ = record
+        mask = ~_bit(product_id)
+        self.available &= mask
+        self.categories[category_slug] &= mask
+        if not self.categories[category_slug]:
+            del self.categories[category_slug]
+        for value in sizes:
+            self.sizes[value] &= mask
+        self.price_index.remove((price, product_id))
+        bucket = _price_bucket(price)
+        if bucket is not None:
+            self.price_buckets[bucket] &= mask
+
+    def _prices_between(self, low, stop):
+        # Ids of the products with low <= price < stop
+        start = bisect_left(self.price_index, (low, -1))
+        end = bisect_left(self.price_index, (stop, -1))
+        return [product_id for _, product_id in self.price_index[start:end]]
+
+    def _price_range(self, low, high):
+        # Products with low <= price <= high: the precomputed bitsets of the buckets
+        # inside the range, the ids are only looked up for the partly covered buckets
+        stop = high + 1
+        bits, edges = 0, []
+        if low < PRICE_BUCKETS[0][0]:
+            # prices below the first bucket are in no bucket bitset
+            edges += self._prices_between(low, min(stop, PRICE_BUCKETS[0][0]))
+        for (bucket_low, bucket_high), bucket_bits in zip(PRICE_BUCKETS, self.price_buckets):
+            start = max(low, bucket_low)
+            end = stop if bucket_high is None else min(stop, bucket_high)
+            if start >= end:
+                continue
+            if start == bucket_low and end == bucket_high:
+                bits |= bucket_bits
+            else:
+                edges += self._prices_between(start, end)
+        return bits | bits_from_ids(edges)
+
+    def query(self, category_slug=None, categories=(), sizes=(), price_range=None):
+        with self.lock:
+            base = self.available
+            if category_slug:
+                base &= self.categories.get(category_slug, 0)
+
+            # One bitset per active filter, a facet is counted against all the other filters
+            filters = {}
+            if categories:
+                bits = 0
+                for slug in categories:
+                    bits |= self.categories.get(slug, 0)
+                filters['categories'] = bits
+            if sizes:
+                bits = 0
+                for value in sizes:
+                    bits |= self.sizes.get(value, 0)
+                filters['sizes'] = bits
+            if price_range is not None:
+                filters['price'] = self._price_range(*price_range)
+
+            def matching(exclude=None):
+                bits = base
+                for name, filter_bits in filters.items():
+                    if name != exclude:
+                        bits &= filter_bits
+                return bits
+
+            without_categories = matching('categories')
+            category_counts = {slug: _popcount(bits & without_categories)
+                               for slug, bits in self.categories.items()}
+            without_sizes = matching('sizes')
+            size_counts = {value: _popcount(bits & without_sizes)
+                           for value, bits in self.sizes.items()}
+            without_price = matching('price')
+            price_counts = [(low, high, _popcount(bits & without_price))
+                            for (low, high), bits in zip(PRICE_BUCKETS, self.price_buckets)]
+
+            return FacetResult(bits_to_ids(matching()), category_counts, size_counts, price_counts)
+
+    def sort_keys(self, ids, sort):
+        # (key, product id) pairs for the keyset paginator, the id makes every key unique
+        with self.lock:
+            products = self.products
+            # a concurrent write may have dropped a product since the query
+            ids = [pk for pk in ids if pk in products]
+            if sort == 'price':
+                return [((products[pk][2], pk), pk) for pk in ids]
+            if sort == 'price_desc':
+                return [((-products[pk][2], -pk), pk) for pk in ids]
+            # newest first
+            return [((-products[pk][3], -pk), pk) for pk in ids]
+
+
+_index = FacetIndex()
+
+
+def facet_index():
+    """Return the process-wide index, patched with the changes other workers logged.
+
+    Checking costs a stat() of the facet change log. The products written
+    since are re-read with two queries; a reset line, too many changes, a rotated
+    log or the first call rebuild the whole index.
+    """
+    with _index.lock:
+        position, changes = FACET_LOG.read(_index.position)
+        product_ids = set(changes or ())
+        if changes is None or len(product_ids) > REFRESH_LIMIT:
+            _index.rebuild()
+        elif product_ids:
+            _index.refresh_products([int(product_id) for product_id in product_ids])
+        _index.position = position
+    return _index
+
+
+def catalog_position():
+    """Position of the catalog change log, it moves after every committed product write."""
+    return CATALOG_LOG.position()
+
+
+def product_changed(product_id, facets=True):
+    # Appended after commit so a worker that reads the line also reads the new row.
+    # Writes to columns the index does not hold (stock) pass facets=False.
+    CATALOG_LOG.changed(product_id)
+    if facets:
+        FACET_LOG.changed(product_id)
+
+
+def catalog_changed(facets=True):
+    # Changes that touch many products (category renames, bulk writes) rebuild the whole index
+    CATALOG_LOG.changed(ChangeLog.RESET)
+    if facets:
+        FACET_LOG.changed(ChangeLog.RESET)
@@ -0,0 +1,91 @@
+import csv
+import hashlib
+import json
+from xml.sax.saxutils import escape
+
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from store.facets import catalog_position
+from store.models import Product
+
+FEED_FIELDS = ['id', 'slug', 'title', 'category', 'price', 'stock', 'availability', 'link']
+
+FEED_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xml': 'application/xml; charset=utf-8',
+}
+
+# Rows fetched per round trip by the server-side cursor
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    # File-like object for csv.writer that hands back the line instead of storing it
+    def write(self, value):
+        return value
+
+
+def feed_rows(base_url):
+    """Yield one dict per product, read through a server-side cursor.
+
+    Only the columns of the feed are selected and the product links are
+    built from a URL pattern resolved once, so memory use stays flat
+    whatever the size of the catalog.
+    """
+    # product_detail URL with placeholders, filled in for every row
+    pattern = base_url.rstrip('/') + reverse('product_detail', args=['CATEGORY', 'PRODUCT'])
+    rows = Product.objects.order_by('id').values_list(
+        'id', 'slug', 'product_name', 'category__slug', 'price', 'stock', 'is_available')
+    for product_id, slug, name, category_slug, price, stock, is_available in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'id': product_id,
+            'slug': slug,
+            'title': name,
+            'category': category_slug,
+            'price': price,
+            'stock': stock,
+            'availability': 'in stock' if is_available and stock > 0 else 'out of stock',
+            'link': pattern.replace('CATEGORY', category_slug, 1).replace('PRODUCT', slug, 1),
+        }
+
+
+def csv_feed(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FEED_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[name] for name in FEED_FIELDS])
+
+
+def jsonl_feed(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def xml_feed(rows):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<products>\n'
+    for row in rows:
+        yield '  <product>%s</product>\n' % ''.join(
+            '<%s>%s</%s>' % (name, escape(str(row[name])), name) for name in FEED_FIELDS)
+    yield '</products>\n'
+
+
+FEED_WRITERS = {
+    'csv': csv_feed,
+    'jsonl': jsonl_feed,
+    'xml': xml_feed,
+}
+
+
+def feed_etag():
+    """ETag of the feed, changed by any write to the catalog.
+
+    The catalog change log moves after every product save and delete and
+    after the bulk paths that skip the signals, stock updates included; the
+    product count and the newest modified_date are hashed with it so the tag
+    also moves for writes that bypass all of those.
+    """
+    stats = Product.objects.aggregate(count=Count('id'), newest=Max('modified_date'))
+    state = '%s:%s:%s' % (catalog_position(), stats['count'], stats['newest'])
+    return hashlib.md5(state.encode()).hexdigest()
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from category.menu import category_menu
+from store.models import Product
+
+HOME_BLOCKS_KEY = 'store:home_blocks'
+
+# Blocks are rebuilt by `python manage.py refresh_home_blocks`, run it more often than this
+HOME_BLOCKS_TIMEOUT = 60 * 60 * 24
+
+# Products shown in each product block of the home page
+BLOCK_SIZE = 4
+
+
+def build_home_blocks():
+    """Compute the home page blocks and store them in the cache.
+
+    Only ids and the few category columns of the tiles are stored, the
+    product cards themselves come from the card cache so a product edit
+    shows up on the home page without waiting for the next refresh.
+    """
+    available = Product.objects.filter(is_available=True)
+    blocks = {
+        # rating_average is kept up to date on the product row by the ReviewRating signals
+        'top_rated': list(available.order_by('-rating_average', '-review_count', '-id')
+                          .values_list('id', flat=True)[:BLOCK_SIZE]),
+        'featured': list(available.filter(featured=True).order_by('-id')
+                         .values_list('id', flat=True)[:BLOCK_SIZE]),
+        'category_tiles': [
+            {
+                'category_name': category.category_name,
+                'url': category.get_url(),
+                'image_url': category.cat_image.url if category.cat_image else '',
+            }
+            for category in category_menu()
+        ],
+    }
+    cache.set(HOME_BLOCKS_KEY, blocks, HOME_BLOCKS_TIMEOUT)
+    return blocks
+
+
+def home_blocks():
+    # One cache read, the blocks are only computed here when the cache was never filled or was evicted
+    blocks = cache.get(HOME_BLOCKS_KEY)
+    if blocks is None:
+        blocks = build_home_blocks()
+    return blocks
+
+
+def home_blocks_changed():
+    # The category tiles hold names and links, drop the blocks so the next request rebuilds them
+    transaction.on_commit(lambda: cache.delete(HOME_BLOCKS_KEY))
+
+
+def block_products(blocks, *names):
+    """Load the products of the named blocks with one primary-key query.
+
+    Returns one list per name, in block order; products removed or made
+    unavailable since the last refresh are skipped.
+    """
+    ids = {product_id for name in names for product_id in blocks[name]}
+    products = Product.objects.filter(is_available=True).select_related('category').in_bulk(ids)
+    return [[products[product_id] for product_id in blocks[name] if product_id in products]
+            for name in names]
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import MIN_ORDERS, SCORERS, TOP_K, build
+
+
+class Command(BaseCommand):
+    help = 'Count the products bought together and store the top neighbours of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Drop the stored counts and read every order again')
+        parser.add_argument('--scorer', choices=SCORERS, default='cosine',
+                            help='How a pair count is normalized')
+        parser.add_argument('--top-k', type=int, default=TOP_K,
+                            help='Neighbours kept per product')
+        parser.add_argument('--min-orders', type=int, default=MIN_ORDERS,
+                            help='Orders a pair needs before it is recommended')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        products, related = build(
+            full=options['full'], scorer=options['scorer'],
+            top_k=options['top_k'], min_orders=options['min_orders'])
+        self.stdout.write(self.style.SUCCESS(
+            'Ranked %d products, %d neighbours stored in %.1fs' % (
+                products, related, time.monotonic() - started)))
@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from store.feeds import FEED_WRITERS, feed_rows
+
+
+class Command(BaseCommand):
+    help = 'Write the product feed as CSV, JSONL or XML without loading the catalog in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FEED_WRITERS), default='csv')
+        parser.add_argument('--output', help='File to write, standard output by default')
+        parser.add_argument('--base-url', required=True,
+                            help='Site address used for the product links, e.g. https://example.com')
+
+    def handle(self, *args, **options):
+        rows = feed_rows(options['base_url'])
+        chunks = FEED_WRITERS[options['format']](rows)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
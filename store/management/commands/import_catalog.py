@@ -0,0 +1,333 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from category.models import Category
+from store.cards import category_cards_changed
+from store.facets import catalog_changed
+from store.models import Product, ProductGallery, Variation, variation_category_choice
+from store.search import index_products
+from store.variations import variations_changed
+
+# Product columns an import row may set, besides slug and category
+PRODUCT_FIELDS = ['product_name', 'description', 'price', 'images', 'stock', 'is_available', 'featured']
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+VARIATION_CATEGORIES = {value for value, _ in variation_category_choice}
+
+# Skipped rows listed one by one at the end of the run, the others are only counted
+MAX_REPORTED = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(path):
+    # variations: "color:Red|size:M", gallery: "store/products/a.jpg|store/products/b.jpg".
+    # A file without the variations or gallery column leaves them as they are.
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            row['line'] = reader.line_num
+            if 'variations' in row:
+                row['variations'] = [item.split(':', 1) for item in (row['variations'] or '').split('|')
+                                     if ':' in item]
+            if 'gallery' in row:
+                row['gallery'] = [image for image in (row['gallery'] or '').split('|') if image]
+            yield row
+
+
+def read_jsonl(path):
+    # variations: [{"category": "color", "value": "Red"}], gallery: ["store/products/a.jpg"].
+    # A row without the variations or gallery key leaves them as they are.
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield {'line': number, 'error': 'invalid JSON: %s' % e}
+                continue
+            if not isinstance(row, dict):
+                yield {'line': number, 'error': 'not a JSON object'}
+                continue
+            row['line'] = number
+            if 'variations' in row:
+                try:
+                    row['variations'] = [(item['category'], item['value']) for item in row['variations'] or []]
+                except (KeyError, TypeError):
+                    row['error'] = 'variations must be a list of {"category": ..., "value": ...}'
+            yield row
+
+
+def _bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _count(row, name):
+    # A whole number of 0 or more, as a JSON number or a CSV string
+    value = row.get(name)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    raise RowError('%s must be a whole number of 0 or more' % name)
+
+
+def _text(row, name, max_length=None, required=False):
+    value = row.get(name)
+    if value is None or value == '':
+        if required:
+            raise RowError('%s is required' % name)
+        return ''
+    if not isinstance(value, str):
+        raise RowError('%s must be a string' % name)
+    if max_length is not None and len(value) > max_length:
+        raise RowError('%s is longer than %d characters' % (name, max_length))
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Stream products, variations and gallery images from a CSV or JSONL file and upsert them by slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format, guessed from the extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError('%s is not a file' % path)
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        rows = read_jsonl(path) if file_format == 'jsonl' else read_csv(path)
+        batch_size = options['batch_size']
+
+        # Categories are few, resolve their slugs from memory instead of a join per row
+        self.category_ids = dict(Category.objects.values_list('slug', 'id'))
+        self.touched_categories = set()
+        self.stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0,
+                      'variations': 0, 'variations disabled': 0, 'gallery': 0, 'gallery removed': 0}
+        # (line, slug, reason) of every row that was not imported
+        self.skipped = []
+
+        started = time.monotonic()
+        total = 0
+        while True:
+            # Only one batch is held in memory at a time
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            self.import_rows(batch)
+            total += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write('%d rows, %.0f rows/sec' % (total, total / elapsed if elapsed else total))
+
+        # Bulk writes skip the model signals, expire the derived caches once at the end
+        catalog_changed()
+        for category_id in self.touched_categories:
+            category_cards_changed(category_id)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %d rows in %.1fs (%.0f rows/sec): %s' % (
+                total, elapsed, total / elapsed if elapsed else total,
+                ', '.join('%d %s' % (count, name) for name, count in self.stats.items()))))
+        if self.skipped:
+            self.stderr.write('Skipped %d rows:' % len(self.skipped))
+            for line, slug, reason in self.skipped[:MAX_REPORTED]:
+                self.stderr.write('  line %s (%s): %s' % (line, slug or '-', reason))
+            if len(self.skipped) > MAX_REPORTED:
+                self.stderr.write('  ... and %d more' % (len(self.skipped) - MAX_REPORTED))
+
+    def skip(self, row, reason):
+        self.stats['skipped'] += 1
+        self.skipped.append((row.get('line'), row.get('slug'), reason))
+
+    def import_rows(self, batch):
+        # The whole batch in one transaction; when the database still refuses it (a product
+        # name taken meanwhile, a value too long for the column...) every row is tried on its
+        # own so one bad row only loses itself
+        stats = dict(self.stats)
+        skipped = len(self.skipped)
+        try:
+            with transaction.atomic():
+                self.import_batch(batch)
+            return
+        except DatabaseError:
+            self.stats = stats
+            del self.skipped[skipped:]
+        for row in batch:
+            stats = dict(self.stats)
+            try:
+                with transaction.atomic():
+                    self.import_batch([row])
+            except DatabaseError as e:
+                self.stats = stats
+                self.skip(row, str(e))
+
+    def clean_row(self, row):
+        # Returns (slug, product values, variations, gallery), variations and gallery are None
+        # when the row does not list them. Raises RowError.
+        if row.get('error'):
+            raise RowError(row['error'])
+        slug = row.get('slug')
+        if not isinstance(slug, str) or not slug or len(slug) > 200:
+            raise RowError('slug is required')
+        try:
+            validate_slug(slug)
+        except ValidationError:
+            raise RowError('invalid slug')
+        category_id = self.category_ids.get(row.get('category'))
+        if category_id is None:
+            raise RowError('unknown category %r' % row.get('category'))
+        values = {
+            'product_name': _text(row, 'product_name', 200, required=True),
+            'description': _text(row, 'description'),
+            'price': _count(row, 'price'),
+            'images': _text(row, 'images', 100),
+            'stock': _count(row, 'stock'),
+            'is_available': _bool(row.get('is_available'), True),
+            'featured': _bool(row.get('featured'), False),
+            'category_id': category_id,
+        }
+        variations = gallery = None
+        if 'variations' in row:
+            variations = []
+            for category, value in row['variations']:
+                if not isinstance(category, str) or not isinstance(value, str) or len(value.strip()) > 100:
+                    raise RowError('variation category and value must be strings')
+                category, value = category.strip().lower(), value.strip()
+                if category in VARIATION_CATEGORIES and value:
+                    variations.append((category, value))
+        if 'gallery' in row:
+            gallery = row['gallery'] or []
+            if not isinstance(gallery, list) or not all(isinstance(image, str) and len(image) <= 255
+                                                        for image in gallery):
+                raise RowError('gallery must be a list of image paths')
+        return slug, values, variations, gallery
+
+    def import_batch(self, batch):
+        cleaned = {}
+        for row in batch:
+            try:
+                slug, values, variations, gallery = self.clean_row(row)
+            except RowError as e:
+                self.skip(row, str(e))
+                continue
+            # A slug repeated in the file keeps its last row
+            cleaned[slug] = (row, values, variations, gallery)
+
+        # product_name is unique too: a name used by another slug, in the batch or in the
+        # catalog, would make the whole batch fail
+        names = {}
+        for slug, (row, values, _, _) in list(cleaned.items()):
+            if values['product_name'] in names:
+                self.skip(row, 'product_name also used by %s' % names[values['product_name']])
+                del cleaned[slug]
+            else:
+                names[values['product_name']] = slug
+        taken = Product.objects.filter(product_name__in=list(names)).exclude(
+            slug__in=list(cleaned)).values_list('product_name', 'slug')
+        for name, other_slug in taken:
+            row = cleaned.pop(names[name])[0]
+            self.skip(row, 'product_name already used by %s' % other_slug)
+
+        # Upsert the products: one query to find the existing slugs, one bulk insert, one bulk update
+        existing = Product.objects.in_bulk(list(cleaned), field_name='slug')
+        today = timezone.localdate()
+        to_create, to_update = [], []
+        for slug, (_, values, _, _) in cleaned.items():
+            product = existing.get(slug)
+            if product is None:
+                to_create.append(Product(slug=slug, **values))
+                continue
+            if all(getattr(product, name) == value for name, value in values.items()):
+                self.stats['unchanged'] += 1
+                continue
+            self.touched_categories.add(product.category_id)
+            for name, value in values.items():
+                setattr(product, name, value)
+            # bulk_update does not fill auto_now fields
+            product.modified_date = today
+            to_update.append(product)
+        Product.objects.bulk_create(to_create)
+        Product.objects.bulk_update(to_update, PRODUCT_FIELDS + ['category_id', 'modified_date'])
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        self.touched_categories.update(product.category_id for product in to_create + to_update)
+
+        # Read the ids back by slug, not every backend returns them from bulk_create
+        products = Product.objects.in_bulk(list(cleaned), field_name='slug')
+        changed = {product.slug for product in to_create + to_update}
+        index_products([products[slug] for slug in changed])
+        self.sync_variations({products[slug].id: variations for slug, (_, _, variations, _) in cleaned.items()
+                              if variations is not None})
+        self.sync_gallery({products[slug].id: gallery for slug, (_, _, _, gallery) in cleaned.items()
+                           if gallery is not None})
+
+    def sync_variations(self, listed):
+        # Make the active variations of every product match its row, matching is case-insensitive
+        # like add_cart. Variations missing from the feed are disabled, not deleted: cart lines
+        # and past order lines still point to them.
+        existing = {}
+        for variation in Variation.objects.filter(product_id__in=list(listed)).only(
+                'id', 'product_id', 'variation_category', 'variation_value', 'is_active'):
+            key = (variation.product_id, variation.variation_category.lower(), variation.variation_value.lower())
+            existing.setdefault(key, []).append(variation)
+        wanted, new_variations = set(), []
+        for product_id, variations in listed.items():
+            for category, value in variations:
+                key = (product_id, category, value.lower())
+                if key in wanted:
+                    continue
+                wanted.add(key)
+                if key not in existing:
+                    new_variations.append(Variation(
+                        product_id=product_id, variation_category=category, variation_value=value))
+        enable = [variation for key, variations in existing.items() if key in wanted
+                  for variation in variations if not variation.is_active]
+        disable = [variation for key, variations in existing.items() if key not in wanted
+                   for variation in variations if variation.is_active]
+        Variation.objects.bulk_create(new_variations)
+        Variation.objects.filter(id__in=[variation.id for variation in enable]).update(is_active=True)
+        Variation.objects.filter(id__in=[variation.id for variation in disable]).update(is_active=False)
+        # bulk writes skip the signals that expire the cached variation matrix
+        for product_id in {variation.product_id for variation in new_variations + enable + disable}:
+            variations_changed(product_id)
+        self.stats['variations'] += len(new_variations) + len(enable)
+        self.stats['variations disabled'] += len(disable)
+
+    def sync_gallery(self, listed):
+        # Gallery images not in the row are removed, the missing ones added
+        existing = ProductGallery.objects.filter(product_id__in=list(listed)).values_list('id', 'product_id', 'image')
+        wanted = {(product_id, image) for product_id, gallery in listed.items() for image in gallery}
+        present, removed = set(), []
+        for image_id, product_id, image in existing:
+            if (product_id, image) in wanted and (product_id, image) not in present:
+                present.add((product_id, image))
+            else:
+                removed.append(image_id)
+        ProductGallery.objects.filter(id__in=removed).delete()
+        new_images = [ProductGallery(product_id=product_id, image=image)
+                      for product_id, image in wanted - present]
+        ProductGallery.objects.bulk_create(new_images)
+        self.stats['gallery'] += len(new_images)
+        self.stats['gallery removed'] += len(removed)
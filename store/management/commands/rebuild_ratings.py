@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import RATING_FIELDS, Product, ReviewRating, rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored rating average, review count and star histogram of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of products written per UPDATE batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # One grouped query computes the aggregates of every reviewed product
+        rows = ReviewRating.objects.filter(status=True).values(
+            'product').annotate(**rating_aggregates()).order_by()
+        aggregates_by_product = {row['product']: row for row in rows}
+
+        empty = {name: 0 for name in RATING_FIELDS}
+        changed = []
+        for product in Product.objects.only('id', *RATING_FIELDS).iterator(chunk_size=batch_size):
+            before = [getattr(product, name) for name in RATING_FIELDS]
+            product.apply_rating_aggregates(
+                aggregates_by_product.get(product.id, empty))
+            if before != [getattr(product, name) for name in RATING_FIELDS]:
+                changed.append(product)
+
+        with transaction.atomic():
+            Product.objects.bulk_update(
+                changed, RATING_FIELDS, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt ratings, %d products updated' % len(changed)))
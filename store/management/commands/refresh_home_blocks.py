@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.home import build_home_blocks
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top-rated, featured and category blocks of the home page'
+
+    def handle(self, *args, **options):
+        blocks = build_home_blocks()
+        self.stdout.write(self.style.SUCCESS(
+            'Home blocks refreshed: %d top rated, %d featured, %d categories' % (
+                len(blocks['top_rated']), len(blocks['featured']), len(blocks['category_tiles']))))
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:40
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ReviewRating = apps.get_model('store', 'ReviewRating')
+    aggregates = {'average': Avg('rating'), 'count': Count('id')}
+    for star in range(1, 6):
+        bucket = Q(rating__lte=star)
+        if star > 1:
+            bucket &= Q(rating__gt=star - 1)
+        aggregates['star_%d' % star] = Count('id', filter=bucket)
+    rows = ReviewRating.objects.filter(status=True).values(
+        'product').annotate(**aggregates).order_by()
+    for row in rows:
+        Product.objects.filter(pk=row['product']).update(
+            rating_average=float(row['average'] or 0),
+            review_count=row['count'],
+            **{'rating_count_%d' % star: row['star_%d' % star] for star in range(1, 6)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_alter_productgallery_options_product_featured'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    # The FTS5 index is SQLite only, other backends use the icontains fallback in store/search.py
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5("
+            "product_name, description, tokenize='unicode61 remove_diacritics 2')")
+    except OperationalError:
+        # SQLite was built without FTS5
+        return
+    schema_editor.execute(
+        "INSERT INTO store_product_fts (rowid, product_name, description) "
+        "SELECT id, product_name, description FROM store_product")
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_product_rating_average_product_rating_count_1_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
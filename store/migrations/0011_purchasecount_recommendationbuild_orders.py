@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:38
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def flag_counted_lines(apps, schema_editor):
+    # The order lines up to the old watermark are in the pair counts already: flag
+    # them, and store the order counts the builds used to recompute every time
+    RecommendationBuild = apps.get_model('store', 'RecommendationBuild')
+    PurchaseCount = apps.get_model('store', 'PurchaseCount')
+    OrderProduct = apps.get_model('orders', 'OrderProduct')
+    state = RecommendationBuild.objects.order_by('-id').first()
+    if state is None or not state.last_order_product_id:
+        return
+    counted = OrderProduct.objects.filter(ordered=True, id__lte=state.last_order_product_id)
+    counted.update(co_purchase_counted=True)
+    PurchaseCount.objects.bulk_create([
+        PurchaseCount(product_id=product_id, orders=orders)
+        for product_id, orders in counted.values('product_id').annotate(
+            orders=Count('order_id', distinct=True)).values_list('product_id', 'orders')
+    ], batch_size=500)
+    state.orders = counted.values('order_id').distinct().count()
+    state.save(update_fields=['orders'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_orderproduct_co_purchase_counted'),
+        ('store', '0010_recommendationbuild_relatedproduct_copurchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseCount',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='store.product')),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recommendationbuild',
+            name='orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(flag_counted_lines, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='recommendationbuild',
+            name='last_order_product_id',
+        ),
+    ]
@@ -1,11 +1,12 @@
 # Importing Django's model module to create database models.
 from django.db import models
 from django.urls import reverse
-from django.db.models import Avg, Count
+from django.db.models import Avg, Count, Q
 
 # Importing the Category model to establish a relationship with the Product model.
 from accounts.models import Account
 from category.models import Category
+from store.renditions import rendition_file
 
 
 # Defining the Product model (database table) by inheriting from models.Model.
@@ -48,6 +49,18 @@ class Product(models.Model):
 
     featured = models.BooleanField(default=False)  # Add this field
 
+    # Denormalized review aggregates, kept up to date by the ReviewRating signals
+    # so product cards can draw the stars without running an Avg() query.
+    # Rebuild them in bulk with `python manage.py rebuild_ratings`.
+    rating_average = models.FloatField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    # Star histogram, a rating counts towards the bucket of its rounded up value (4.5 -> 5 stars)
+    rating_count_1 = models.PositiveIntegerField(default=0)
+    rating_count_2 = models.PositiveIntegerField(default=0)
+    rating_count_3 = models.PositiveIntegerField(default=0)
+    rating_count_4 = models.PositiveIntegerField(default=0)
+    rating_count_5 = models.PositiveIntegerField(default=0)
+
     # This is the function for products goto single page
     # reverse method first argument is product_detail its url name
     # first argument is self.category.slug category field slug field and next category slug field
@@ -61,14 +74,50 @@ class Product(models.Model):
         return self.product_name
 
     def averageReview(self):
-        # aggregate: A method provided by Django's QuerySet API that allows you to compute summary values (like sums, averages, counts) over a queryset.
-        # Avg: This is an aggregation function provided by Django's ORM to compute the average value of a specified field across a queryset.
-        reviews = ReviewRating.objects.filter(
-            product=self, status=True).aggregate(average=Avg('rating'))
-        avg = 0
-        if reviews['average'] is not None:
-            avg = float(reviews['average'])
-        return avg
+        # Read the stored average, no query is needed here
+        return self.rating_average
+
+    def rating_histogram(self):
+        # Review counts for 1 to 5 stars, in that order
+        return [self.rating_count_1, self.rating_count_2, self.rating_count_3,
+                self.rating_count_4, self.rating_count_5]
+
+    def apply_rating_aggregates(self, aggregates):
+        # Copy the values computed by rating_aggregates() onto this product
+        self.rating_average = float(aggregates['rating_average'] or 0)
+        self.review_count = aggregates['review_count']
+        for star in range(1, 6):
+            name = 'rating_count_%d' % star
+            setattr(self, name, aggregates[name])
+
+    def update_rating(self):
+        # Recompute the review aggregates of this product with one aggregate query
+        aggregates = ReviewRating.objects.filter(
+            product_id=self.pk, status=True).aggregate(**rating_aggregates())
+        self.apply_rating_aggregates(aggregates)
+        Product.objects.filter(pk=self.pk).update(
+            **{name: getattr(self, name) for name in RATING_FIELDS})
+
+
+# Names of the Product fields that hold the denormalized review aggregates
+RATING_FIELDS = ['rating_average', 'review_count', 'rating_count_1', 'rating_count_2',
+                 'rating_count_3', 'rating_count_4', 'rating_count_5']
+
+
+def rating_aggregates():
+    # aggregate: A method provided by Django's QuerySet API that allows you to compute summary values (like sums, averages, counts) over a queryset.
+    # Avg: This is an aggregation function provided by Django's ORM to compute the average value of a specified field across a queryset.
+    # The same expressions work with aggregate() for one product and with values('product').annotate() for all of them.
+    aggregates = {
+        'rating_average': Avg('rating'),
+        'review_count': Count('id'),
+    }
+    for star in range(1, 6):
+        bucket = Q(rating__lte=star)
+        if star > 1:
+            bucket &= Q(rating__gt=star - 1)
+        aggregates['rating_count_%d' % star] = Count('id', filter=bucket)
+    return aggregates
 
 # Custom Manager class to handle variations
 
@@ -119,6 +168,8 @@ class Variation(models.Model):
         return self.variation_value  # Returns a string representation of the variation_value
 
 
+# The stored aggregates of the reviewed product are refreshed by the post_save and
+# post_delete receivers in store/signals.py, which also run for queryset and cascade deletes
 class ReviewRating(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     user = models.ForeignKey(Account, on_delete=models.CASCADE)
@@ -134,6 +185,7 @@ class ReviewRating(models.Model):
         return self.subject
 
 
+
 class ProductGallery(models.Model):
     product = models.ForeignKey(
         Product, default=None, on_delete=models.CASCADE)
@@ -142,6 +194,48 @@ class ProductGallery(models.Model):
     def __str__(self):
         return self.product.product_name
 
+    # Small rendition of the image, used by the admin inline preview
+    @property
+    def thumbnail(self):
+        return rendition_file(self.image, 160)
+
     class Meta:
         verbose_name = 'productgallery'
         verbose_name_plural = 'product gallery'
+
+
+class CoPurchase(models.Model):
+    # Number of orders that contained both products, stored once per pair with product_id < other_id.
+    # Filled by `python manage.py build_recommendations`.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+
+class PurchaseCount(models.Model):
+    # Number of orders that contained the product, the denominator of the pair scores.
+    # Filled by `python manage.py build_recommendations` with the pair counts.
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+
+
+class RelatedProduct(models.Model):
+    # Top neighbours of a product ("frequently bought together"), best score first
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['product', '-score'])]
+
+    def __str__(self):
+        return '%s -> %s' % (self.product_id, self.related_id)
+
+
+class RecommendationBuild(models.Model):
+    # Orders counted so far, the order lines themselves are flagged with co_purchase_counted
+    orders = models.PositiveIntegerField(default=0)
+    built_at = models.DateTimeField(auto_now=True)
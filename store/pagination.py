@@ -0,0 +1,201 @@
+import base64
+import heapq
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(key, backwards=False):
+    # Opaque token for the client, it only has to hand it back to us
+    payload = json.dumps({'k': list(key), 'b': backwards}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _is_scalar(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def decode_cursor(token):
+    # Returns (key, backwards), or (None, False) for a missing or broken token.
+    # The token comes from the client: the key is only known to be a non-empty list of
+    # strings and numbers here, the fetch function checks it has the shape of its keys.
+    if not token:
+        return None, False
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = payload['k']
+        if not isinstance(key, list) or not key or not all(_is_scalar(value) for value in key):
+            return None, False
+        return tuple(key), bool(payload['b'])
+    except (ValueError, KeyError, TypeError):
+        return None, False
+
+
+class CursorPage:
+    """One page of a keyset paginated listing.
+
+    Iterating it yields the items, `next_cursor` / `previous_cursor` are the
+    tokens to request the neighbouring pages (None at either end).
+    """
+
+    def __init__(self, items, next_cursor, previous_cursor, count=None):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Total number of results when the caller could get it cheaply, otherwise None
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset (cursor) paginator.
+
+    `fetch(after, limit, backwards)` must return up to `limit` (key, item)
+    pairs sorted by key, starting right after the key `after` (None for the
+    first page), or right before it walking down when `backwards` is true.
+    Keys must be unique tuples of JSON serializable values, so every page
+    costs the same whatever its depth.
+
+    `valid_key(key)` tells if a key read from a cursor has the shape of the
+    fetch keys (length and types); by default the fetch function's own
+    `valid_key` attribute is used. A cursor failing it shows the first page.
+    """
+
+    def __init__(self, fetch, per_page, count=None, valid_key=None):
+        self.fetch = fetch
+        self.per_page = per_page
+        self.count = count
+        self.valid_key = valid_key or getattr(fetch, 'valid_key', None)
+
+    def page(self, cursor=None):
+        after, backwards = decode_cursor(cursor)
+        if after is not None and self.valid_key is not None and not self.valid_key(after):
+            # A tampered or outdated cursor
+            after = None
+        if after is None:
+            backwards = False
+        rows = list(self.fetch(after, self.per_page + 1, backwards))
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        # Walking forward, the extra row tells if there is a next page and any cursor means
+        # there is a previous one; walking backwards it is the other way round
+        has_next = backwards or more
+        has_previous = more if backwards else after is not None
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(rows[-1][0])
+        if rows and has_previous:
+            previous_cursor = encode_cursor(rows[0][0], backwards=True)
+        count = self.count() if callable(self.count) else self.count
+        return CursorPage([item for _, item in rows], next_cursor, previous_cursor, count)
+
+
+def sorted_fetcher(keyed_items):
+    """Fetch function over in-memory (key, item) pairs, in any order.
+
+    Only the page is sorted, so a page costs O(n log page size).
+    """
+    def fetch(after, limit, backwards):
+        if backwards:
+            candidates = (row for row in keyed_items if row[0] < after)
+            return heapq.nlargest(limit, candidates, key=lambda row: row[0])
+        if after is not None:
+            candidates = (row for row in keyed_items if row[0] > after)
+        else:
+            candidates = keyed_items
+        return heapq.nsmallest(limit, candidates, key=lambda row: row[0])
+
+    def valid_key(key):
+        # Same length as the item keys, and numbers or strings where they have them
+        if not keyed_items:
+            return True
+        sample = keyed_items[0][0]
+        return len(key) == len(sample) and all(
+            is_number(value) if is_number(expected) else type(value) is type(expected)
+            for value, expected in zip(key, sample))
+
+    fetch.valid_key = valid_key
+    return fetch
+
+
+def _json_value(value):
+    # Dates and datetimes travel as ISO strings, the ORM parses them back in the lookups
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def queryset_fetcher(queryset, ordering):
+    """Fetch function over a queryset ordered by `ordering`, e.g. ['-created_at', '-id'].
+
+    The last field must be unique (usually the primary key). A page is one
+    indexed range query with a LIMIT and no OFFSET.
+    """
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def after_filter(key, backwards):
+        # (a, b) > (x, y) expanded to a > x OR (a = x AND b > y), flipped for descending fields
+        condition = Q()
+        for position, (name, descending) in enumerate(fields):
+            forward = descending == backwards
+            lookup = '%s__%s' % (name, 'gt' if forward else 'lt')
+            equal = {fields[i][0]: key[i] for i in range(position)}
+            condition |= Q(**equal, **{lookup: key[position]})
+        return condition
+
+    def fetch(after, limit, backwards):
+        rows = queryset
+        if after is not None:
+            rows = rows.filter(after_filter(after, backwards))
+        if backwards:
+            rows = rows.order_by(*[name if descending else '-' + name for name, descending in fields])
+        else:
+            rows = rows.order_by(*ordering)
+        return [(tuple(_json_value(getattr(obj, name)) for name, _ in fields), obj)
+                for obj in rows[:limit]]
+
+    def valid_key(key):
+        # One value per ordering field, each one accepted by its model field
+        if len(key) != len(fields):
+            return False
+        for (name, _), value in zip(fields, key):
+            try:
+                queryset.model._meta.get_field(name).to_python(value)
+            except FieldDoesNotExist:
+                continue
+            except (ValidationError, TypeError, ValueError):
+                return False
+        return True
+
+    fetch.valid_key = valid_key
+    return fetch
+
+
+def page_url(request, cursor):
+    # Current URL with its filters kept and the cursor replaced, None when there is no such page
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return '?' + params.urlencode()
@@ -0,0 +1,214 @@
+import heapq
+import math
+from collections import Counter
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import Q
+
+from orders.models import OrderProduct
+from store.models import CoPurchase, Product, PurchaseCount, RecommendationBuild, RelatedProduct
+
+# Neighbours kept per product
+TOP_K = 8
+
+# A pair bought together fewer times than this is treated as noise
+MIN_ORDERS = 2
+
+# Rows fetched per round trip when streaming order lines, and ids per IN (...) query
+CHUNK_SIZE = 5000
+ID_BATCH = 500
+
+SCORERS = ('cosine', 'lift')
+
+
+def _batches(items, size=ID_BATCH):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def count_pairs():
+    """Count the product pairs bought in the same order, for the paid order lines not counted yet.
+
+    The lines are found by their co_purchase_counted flag rather than an id
+    watermark: ids are handed out before commit, so a line can show up after
+    a higher id was already read. All the lines of an order are written by
+    one transaction, an order is read whole or not at all. The lines are read
+    through a server-side cursor sorted by order, so only one basket and the
+    counters are in memory. Returns (Counter {(product_id, other_id): orders}
+    with product_id < other_id, Counter {product_id: orders}, ids of the
+    orders read).
+    """
+    pairs, products, order_ids = Counter(), Counter(), []
+    rows = (OrderProduct.objects.filter(ordered=True, co_purchase_counted=False)
+            .order_by('order_id', 'product_id')
+            .values_list('order_id', 'product_id'))
+    current_order, basket = None, set()
+    for order_id, product_id in rows.iterator(chunk_size=CHUNK_SIZE):
+        if order_id != current_order:
+            # The same product twice in an order (other variations) counts once
+            pairs.update(combinations(sorted(basket), 2))
+            products.update(basket)
+            current_order, basket = order_id, set()
+            order_ids.append(order_id)
+        basket.add(product_id)
+    pairs.update(combinations(sorted(basket), 2))
+    products.update(basket)
+    return pairs, products, order_ids
+
+
+def save_pairs(pairs):
+    # Add the new counts to the stored ones
+    existing = {}
+    for product_ids in _batches({a for a, _ in pairs}):
+        for row in CoPurchase.objects.filter(product_id__in=product_ids):
+            if (row.product_id, row.other_id) in pairs:
+                existing[row.product_id, row.other_id] = row
+    to_create, to_update = [], []
+    for (a, b), orders in pairs.items():
+        row = existing.get((a, b))
+        if row is None:
+            to_create.append(CoPurchase(product_id=a, other_id=b, orders=orders))
+        else:
+            row.orders += orders
+            to_update.append(row)
+    CoPurchase.objects.bulk_create(to_create, batch_size=ID_BATCH)
+    CoPurchase.objects.bulk_update(to_update, ['orders'], batch_size=ID_BATCH)
+
+
+def save_order_counts(products):
+    # Same for the number of orders of every product
+    existing = {}
+    for product_ids in _batches(products):
+        existing.update(PurchaseCount.objects.in_bulk(product_ids))
+    to_create, to_update = [], []
+    for product_id, orders in products.items():
+        row = existing.get(product_id)
+        if row is None:
+            to_create.append(PurchaseCount(product_id=product_id, orders=orders))
+        else:
+            row.orders += orders
+            to_update.append(row)
+    PurchaseCount.objects.bulk_create(to_create, batch_size=ID_BATCH)
+    PurchaseCount.objects.bulk_update(to_update, ['orders'], batch_size=ID_BATCH)
+
+
+def order_counts(product_ids):
+    # Number of paid orders containing each of product_ids, from the stored counts
+    per_product = {}
+    for batch in _batches(product_ids):
+        per_product.update(PurchaseCount.objects.filter(product_id__in=batch).values_list('product_id', 'orders'))
+    return per_product
+
+
+def neighbours_of(product_ids, min_orders=MIN_ORDERS):
+    # Products ranked with one of product_ids among their candidates
+    neighbours = set()
+    for batch in _batches(product_ids):
+        rows = (CoPurchase.objects.filter(orders__gte=min_orders)
+                .filter(Q(product_id__in=batch) | Q(other_id__in=batch))
+                .values_list('product_id', 'other_id'))
+        for a, b in rows:
+            neighbours.add(a)
+            neighbours.add(b)
+    return neighbours
+
+
+def score(together, orders_a, orders_b, total, scorer):
+    if scorer == 'lift':
+        # How much more often the pair is bought together than by chance
+        return together * total / (orders_a * orders_b)
+    return together / math.sqrt(orders_a * orders_b)
+
+
+def rank_neighbours(product_ids, total, scorer='cosine', top_k=TOP_K, min_orders=MIN_ORDERS):
+    """Replace the RelatedProduct rows of product_ids with their top_k neighbours.
+
+    Reads the stored pair and order counts of a batch of products at a time,
+    so a nightly rebuild and a small incremental run go through the same code.
+    total is the number of orders counted.
+    """
+    ranked = 0
+    for batch in _batches(product_ids):
+        wanted = set(batch)
+        neighbours = {product_id: [] for product_id in batch}
+        rows = list(CoPurchase.objects.filter(orders__gte=min_orders)
+                    .filter(Q(product_id__in=batch) | Q(other_id__in=batch))
+                    .values_list('product_id', 'other_id', 'orders'))
+        involved = {a for a, _, _ in rows} | {b for _, b, _ in rows}
+        per_product = order_counts(involved)
+        available = set(Product.objects.filter(id__in=involved, is_available=True).values_list('id', flat=True))
+        for a, b, together in rows:
+            value = score(together, per_product.get(a, together), per_product.get(b, together), total, scorer)
+            if a in wanted and b in available:
+                neighbours[a].append((value, b))
+            if b in wanted and a in available:
+                neighbours[b].append((value, a))
+        related = [
+            RelatedProduct(product_id=product_id, related_id=other_id, score=value)
+            for product_id, candidates in neighbours.items()
+            for value, other_id in heapq.nlargest(top_k, candidates)
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=batch).delete()
+            RelatedProduct.objects.bulk_create(related, batch_size=ID_BATCH)
+        ranked += len(related)
+    return ranked
+
+
+def build(full=False, scorer='cosine', top_k=TOP_K, min_orders=MIN_ORDERS):
+    """Count the order lines added since the last build and re-rank the products whose scores moved.
+
+    A new order changes the order count of its products, which is in the
+    score of every pair they are part of: the products of the new orders
+    are re-ranked along with their neighbours. With lift the total number of
+    orders scales every score alike, which leaves the rankings as they are.
+    With full=True the stored counts are dropped and every order is read
+    again. Returns (products re-ranked, neighbour rows written).
+    """
+    state = RecommendationBuild.objects.order_by('-id').first() or RecommendationBuild()
+    if full:
+        with transaction.atomic():
+            CoPurchase.objects.all().delete()
+            PurchaseCount.objects.all().delete()
+            RelatedProduct.objects.all().delete()
+            OrderProduct.objects.filter(co_purchase_counted=True).update(co_purchase_counted=False)
+            state.orders = 0
+            state.save()
+    pairs, products, order_ids = count_pairs()
+    with transaction.atomic():
+        save_pairs(pairs)
+        save_order_counts(products)
+        # Flag the lines read, not every uncounted line: an order committed since is for the next build
+        for batch in _batches(order_ids):
+            OrderProduct.objects.filter(order_id__in=batch).update(co_purchase_counted=True)
+        state.orders += len(order_ids)
+        state.save()
+    if full:
+        touched = set(Product.objects.values_list('id', flat=True))
+    else:
+        touched = set(products) | neighbours_of(products, min_orders)
+    return len(touched), rank_neighbours(sorted(touched), state.orders, scorer, top_k, min_orders)
+
+
+def related_products(product_ids, limit=4):
+    """Products most often bought with product_ids (and not one of them), best score first.
+
+    One indexed query on RelatedProduct, the products and their category
+    come from the same join.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    rows = (RelatedProduct.objects.filter(product_id__in=product_ids, related__is_available=True)
+            .exclude(related_id__in=product_ids)
+            .select_related('related__category').order_by('-score'))
+    products, seen = [], set()
+    for row in rows[:limit * len(product_ids)]:
+        if row.related_id not in seen:
+            seen.add(row.related_id)
+            products.append(row.related)
+            if len(products) == limit:
+                break
+    return products
@@ -0,0 +1,122 @@
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import ImageFieldFile
+from PIL import Image, UnidentifiedImageError
+
+# Widths generated for every product and gallery image, a rendition is never wider than its original
+RENDITION_WIDTHS = (160, 320, 640, 1024)
+
+# format name -> (Pillow format, file extension, save options)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Renditions are stored next to the uploads, under MEDIA_ROOT/renditions/<width>/
+RENDITION_DIR = 'renditions'
+
+
+# A missing or broken original is only tried again after this many seconds
+FAILURE_TIMEOUT = 60 * 60
+
+# Cached in place of the renditions of an image that could not be read
+FAILED = 'failed'
+
+
+def rendition_name(name, width, fmt):
+    # The original extension is kept: a.jpg and a.png of the same folder get their own renditions
+    return '%s/%d/%s.%s' % (RENDITION_DIR, width, name, RENDITION_FORMATS[fmt][1])
+
+
+def _cache_key(name):
+    return 'store:renditions:v2:%s:%s' % ('-'.join(map(str, RENDITION_WIDTHS)), name)
+
+
+def _write(storage, name, image, fmt):
+    pil_format, _, options = RENDITION_FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    # Another worker may have written it first, keep that one
+    if not storage.exists(name):
+        storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _generate(field_file):
+    # Write the missing renditions of one image, returns {format: [(name, width)]}
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+    renditions = {fmt: [] for fmt in RENDITION_FORMATS}
+    for width in RENDITION_WIDTHS:
+        if width >= original.width:
+            break
+        height = max(1, round(original.height * width / original.width))
+        resized = None
+        for fmt in RENDITION_FORMATS:
+            name = rendition_name(field_file.name, width, fmt)
+            if not storage.exists(name):
+                if resized is None:
+                    resized = original.resize((width, height), Image.LANCZOS)
+                _write(storage, name, resized, fmt)
+            renditions[fmt].append((name, width))
+    return {'width': original.width, 'renditions': renditions}
+
+
+def renditions_for(field_file):
+    """Return {'width': original width, 'renditions': {format: [(name, width)]}} or None.
+
+    The result is kept in the cache so a listing only pays one cache read
+    per image; the first call for an image creates the files on disk.
+    None means the original is missing or not an image, which is cached
+    too so the pages showing it do not open the file again every time.
+    """
+    if not field_file:
+        return None
+    key = _cache_key(field_file.name)
+    info = cache.get(key)
+    if info is None:
+        try:
+            info = _generate(field_file)
+        except (OSError, UnidentifiedImageError, ValueError):
+            cache.set(key, FAILED, FAILURE_TIMEOUT)
+            return None
+        cache.set(key, info, timeout=None)
+    if info == FAILED:
+        return None
+    return info
+
+
+def srcset(field_file, fmt):
+    info = renditions_for(field_file)
+    if not info or not info['renditions'][fmt]:
+        return ''
+    storage = field_file.storage
+    candidates = ['%s %dw' % (storage.url(name), width) for name, width in info['renditions'][fmt]]
+    # The original stays the largest candidate, for screens wider than every rendition
+    candidates.append('%s %dw' % (field_file.url, info['width']))
+    return ', '.join(candidates)
+
+
+def rendition_url(field_file, width, fmt='webp'):
+    # URL of the smallest rendition at least `width` wide, the original when there is none
+    info = renditions_for(field_file)
+    if info:
+        for name, rendition_width in info['renditions'][fmt]:
+            if rendition_width >= width:
+                return field_file.storage.url(name)
+    return field_file.url if field_file else ''
+
+
+def rendition_file(field_file, width, fmt='jpeg'):
+    # Same as rendition_url but as a FieldFile, for code that expects one (admin_thumbnails)
+    info = renditions_for(field_file)
+    if info:
+        for name, rendition_width in info['renditions'][fmt]:
+            if rendition_width >= width:
+                return ImageFieldFile(field_file.instance, field_file.field, name)
+    return field_file
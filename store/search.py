@@ -0,0 +1,125 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from store.models import Product
+from store.pagination import CursorPaginator, is_number, queryset_fetcher
+
+# SQLite FTS5 table holding the searchable text of every product, the rowid is the product id.
+# It is created by migration 0009 and kept in sync by the signals in store/signals.py.
+FTS_TABLE = 'store_product_fts'
+
+# bm25() weights of the indexed columns, a hit in the name ranks above a hit in the description
+FTS_WEIGHTS = (10.0, 1.0)
+
+_fts_ready = None
+
+
+def fts_enabled():
+    # The table only exists on SQLite builds with FTS5, look it up once per process
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = (connection.vendor == 'sqlite'
+                      and FTS_TABLE in connection.introspection.table_names())
+    return _fts_ready
+
+
+def match_expression(keyword):
+    # Turn the user keyword into a safe FTS5 query, every word must match
+    # and the last one is a prefix so results show up while the user is typing
+    terms = re.findall(r'\w+', (keyword or '').lower())
+    if not terms:
+        return None
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def index_product(product):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [product.pk])
+        cursor.execute(
+            'INSERT INTO %s (rowid, product_name, description) VALUES (%%s, %%s, %%s)' % FTS_TABLE,
+            [product.pk, product.product_name, product.description])
+
+
+def index_products(products):
+    # Bulk version of index_product for imports, which bypass the model signals
+    if not fts_enabled() or not products:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE,
+                           [[product.pk] for product in products])
+        cursor.executemany(
+            'INSERT INTO %s (rowid, product_name, description) VALUES (%%s, %%s, %%s)' % FTS_TABLE,
+            [[product.pk, product.product_name, product.description] for product in products])
+
+
+def unindex_product(product_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [product_id])
+
+
+class SearchResults:
+    """BM25 ranked search results read page by page through a keyset cursor.
+
+    The key of a row is (bm25 score, -product id), so the next page is the
+    rows ranked right after the last one shown and no OFFSET is needed.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE),
+                [self.expression])
+            return cursor.fetchone()[0]
+
+    def valid_key(self, key):
+        # (bm25 score, -product id)
+        return len(key) == 2 and is_number(key[0]) and isinstance(key[1], int)
+
+    def fetch(self, after, limit, backwards):
+        where, params = '', []
+        if after is not None:
+            score, negative_id = after
+            if backwards:
+                where = 'WHERE score < %s OR (score = %s AND id > %s)'
+            else:
+                where = 'WHERE score > %s OR (score = %s AND id < %s)'
+            params = [score, score, -negative_id]
+        order = 'score DESC, id ASC' if backwards else 'score ASC, id DESC'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, score FROM (SELECT rowid AS id, bm25(%s, %%s, %%s) AS score '
+                'FROM %s WHERE %s MATCH %%s) %s ORDER BY %s LIMIT %%s'
+                % (FTS_TABLE, FTS_TABLE, FTS_TABLE, where, order),
+                [*FTS_WEIGHTS, self.expression, *params, limit])
+            rows = cursor.fetchall()
+        products = Product.objects.select_related('category').in_bulk([pk for pk, _ in rows])
+        return [((score, -pk), products[pk]) for pk, score in rows if pk in products]
+
+
+def search_paginator(keyword, per_page):
+    """Return a CursorPaginator over the products matching `keyword`, best match first.
+
+    A missing or empty keyword gives an empty paginator without touching the
+    database. When the FTS5 index is not available (other database
+    backends) it falls back to the old icontains filter.
+    """
+    expression = match_expression(keyword)
+    if expression is None:
+        return CursorPaginator(lambda after, limit, backwards: [], per_page, count=0)
+    if fts_enabled():
+        results = SearchResults(expression)
+        return CursorPaginator(results.fetch, per_page, count=results.count, valid_key=results.valid_key)
+    products = Product.objects.select_related('category').filter(
+        Q(description__icontains=keyword) | Q(product_name__icontains=keyword))
+    return CursorPaginator(queryset_fetcher(products, ['-created_date', '-id']), per_page, count=products.count)
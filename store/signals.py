@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from category.models import Category
+from store.cards import category_cards_changed, product_card_changed
+from store.facets import catalog_changed, product_changed
+from store.home import home_blocks_changed
+from store.models import Product, ProductGallery, ReviewRating, Variation
+from store.renditions import renditions_for
+from store.search import index_product, unindex_product
+from store.variations import variations_changed
+
+# Product columns that only the product page and the feed show
+STOCK_FIELDS = {'stock', 'modified_date'}
+
+
+# Keep the full-text search index, the facet index and the card cache in sync with the catalog
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    index_product(instance)
+    # Neither the facet index nor the cards show the stock, a stock-only save leaves them as they are
+    stock_only = update_fields is not None and set(update_fields) <= STOCK_FIELDS
+    product_changed(instance.pk, facets=not stock_only)
+    if not stock_only:
+        product_card_changed(instance.pk)
+    # Create the image renditions right after the upload instead of on the first page view
+    transaction.on_commit(lambda: renditions_for(instance.images))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    unindex_product(instance.pk)
+    product_changed(instance.pk)
+    product_card_changed(instance.pk)
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def variation_changed(sender, instance, **kwargs):
+    product_changed(instance.product_id)
+    variations_changed(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    catalog_changed()
+    category_cards_changed(instance.pk)
+    home_blocks_changed()
+
+
+# Refresh the review aggregates stored on the product, and its card which shows the stars.
+# post_delete is also sent for queryset deletes and cascades, Model.delete() is not called then.
+@receiver(post_save, sender=ReviewRating)
+@receiver(post_delete, sender=ReviewRating)
+def review_changed(sender, instance, **kwargs):
+    Product(pk=instance.product_id).update_rating()
+    product_card_changed(instance.product_id)
+
+
+@receiver(post_save, sender=ProductGallery)
+def gallery_image_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: renditions_for(instance.image))
@@ -0,0 +1,24 @@
+from django import template
+
+from store import renditions
+
+register = template.Library()
+
+
+# {% picture product.images sizes="(max-width: 768px) 50vw, 25vw" alt=product.product_name %}
+# renders a <picture> with WebP and JPEG srcsets, the browser downloads only the width it needs
+@register.inclusion_tag('includes/picture.html')
+def picture(field_file, sizes='100vw', alt='', width=640):
+    return {
+        'src': renditions.rendition_url(field_file, width, 'jpeg'),
+        'webp_srcset': renditions.srcset(field_file, 'webp'),
+        'jpeg_srcset': renditions.srcset(field_file, 'jpeg'),
+        'sizes': sizes,
+        'alt': alt,
+    }
+
+
+# {% rendition_url cart_item.product.images 160 %} for small fixed-size thumbnails
+@register.simple_tag
+def rendition_url(field_file, width, fmt='webp'):
+    return renditions.rendition_url(field_file, width, fmt)
@@ -1,3 +1,618 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.models import F
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from accounts.models import Account
+from category.menu import MENU_LOG
+from category.models import Category
+from orders.models import Order, OrderProduct
+from orders.numbers import allocate_order_number
+from store.bulk import set_available
+from store.cards import render_product_cards
+from store.checks import shared_cache_check
+from store.facets import CATALOG_LOG, FACET_LOG, PRICE_BUCKETS, FacetIndex, catalog_changed, facet_index
+from store.models import CoPurchase, Product, ProductGallery, RelatedProduct, ReviewRating, Variation
+from store.recommendations import build
+from store.renditions import renditions_for
+from store.search import fts_enabled, match_expression, search_paginator
+from store.versions import ChangeLog
+from store.pagination import CursorPaginator, queryset_fetcher, sorted_fetcher
+from store.variations import variation_matrix
+
+
+def make_product(category, slug, **values):
+    fields = {'product_name': slug, 'description': '', 'price': 100, 'images': 'photos/products/a.jpg',
+              'stock': 10, 'category': category}
+    fields.update(values)
+    return Product.objects.create(slug=slug, **fields)
+
+
+def make_order(user, products, **values):
+    # A paid order with one line per product
+    fields = {'first_name': 'Test', 'last_name': 'User', 'phone': '555', 'email': user.email,
+              'address_line_1': 'Street 1', 'country': 'IN', 'state': 'KA', 'city': 'Bengaluru',
+              'order_total': sum(product.price for product in products), 'tax': 0, 'is_ordered': True}
+    fields.update(values)
+    order = Order.objects.create(user=user, order_number=allocate_order_number(), **fields)
+    OrderProduct.objects.bulk_create([
+        OrderProduct(order=order, user=user, product=product, quantity=1, product_price=product.price)
+        for product in products])
+    return order
+
+
+def isolate_change_logs(test_case):
+    # A change log directory of its own: the in-memory menu and facet index are rebuilt from
+    # this test's rows, and the callbacks run by the test do not write into the project
+    directory = tempfile.TemporaryDirectory()
+    test_case.addCleanup(directory.cleanup)
+    test_case.enterContext(override_settings(CHANGE_LOG_DIR=directory.name))
+    for log in (MENU_LOG, FACET_LOG, CATALOG_LOG):
+        log.append(log.RESET)
+
+
+def make_user(email, password='secret'):
+    user = Account.objects.create_user(
+        first_name='Test', last_name='User', username=email.split('@')[0], email=email, password=password)
+    user.is_active = True
+    user.save()
+    return user
+
+
+class ReviewAggregatesTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.product = make_product(self.category, 'blue-shirt')
+        self.user = make_user('reviewer@example.com')
+
+    def review(self, rating, user=None):
+        return ReviewRating.objects.create(product=self.product, user=user or self.user, rating=rating)
+
+    def assertAggregates(self, average, count):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_average, average)
+        self.assertEqual(self.product.review_count, count)
+
+    def test_save_and_delete_update_the_product(self):
+        first = self.review(4)
+        self.review(2)
+        self.assertAggregates(3, 2)
+        self.assertEqual(self.product.rating_count_4, 1)
+        first.delete()
+        self.assertAggregates(2, 1)
+
+    def test_queryset_delete_updates_the_product(self):
+        self.review(4)
+        self.review(5)
+        ReviewRating.objects.filter(product=self.product).delete()
+        self.assertAggregates(0, 0)
+        self.assertEqual(self.product.rating_count_5, 0)
+
+    def test_cascade_delete_of_the_author_updates_the_product(self):
+        other = make_user('other@example.com')
+        self.review(4)
+        self.review(1, user=other)
+        other.delete()
+        self.assertAggregates(4, 1)
+
+
+class FacetIndexPriceTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.prices = {}
+        for number, price in enumerate([0, 10, 49, 50, 99, 100, 150, 199, 200, 999, 1500, 2000, 5000]):
+            product = make_product(category, 'shirt-%d' % number, price=price)
+            self.prices[product.id] = price
+        make_product(category, 'hidden', price=60, is_available=False)
+        self.index = FacetIndex()
+        self.index.rebuild()
+
+    def expected(self, low, high):
+        return sorted(pk for pk, price in self.prices.items() if low <= price <= high)
+
+    def test_price_ranges_match_whole_and_partial_buckets(self):
+        for low, high in [(0, 49), (50, 99), (40, 160), (0, 10000), (150, 150), (1999, 2001), (3000, 9000)]:
+            self.assertEqual(self.index.query(price_range=(low, high)).ids, self.expected(low, high))
+
+    def test_price_counts_and_refresh(self):
+        counts = [count for _, _, count in self.index.query().price_counts]
+        self.assertEqual(counts, [3, 2, 3, 1, 1, 0, 1, 2])
+        self.assertEqual(len(counts), len(PRICE_BUCKETS))
+        product_id = min(self.prices)
+        Product.objects.filter(pk=product_id).update(price=120)
+        self.index.refresh_product(product_id)
+        self.assertIn(product_id, self.index.query(price_range=(100, 199)).ids)
+        self.assertNotIn(product_id, self.index.query(price_range=(0, 49)).ids)
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        self.log = ChangeLog('test')
+
+    def test_lines_since_the_last_read(self):
+        position, lines = self.log.read(None)
+        self.assertIsNone(lines)
+        self.log.append(1, 2)
+        position, lines = self.log.read(position)
+        # The first line creates the file, a new generation: reload
+        self.assertIsNone(lines)
+        self.log.append(3)
+        self.log.append(4)
+        position, lines = self.log.read(position)
+        self.assertEqual(lines, ['3', '4'])
+        self.assertEqual(self.log.read(position), (position, []))
+        self.log.append(ChangeLog.RESET)
+        position, lines = self.log.read(position)
+        self.assertIsNone(lines)
+
+    def test_new_file_is_a_new_generation(self):
+        self.log.append(1)
+        position, _ = self.log.read(None)
+        # Same name, inode possibly reused and same size: only the generation tells them apart
+        os.remove(self.log.path)
+        self.log.append(1)
+        self.assertIsNone(self.log.read(position)[1])
+        with mock.patch('store.versions.MAX_LOG_SIZE', 100):
+            position, _ = self.log.read(None)
+            for number in range(30):
+                self.log.append(number)
+            self.assertIsNone(self.log.read(position)[1])
+        self.assertLess(os.path.getsize(self.log.path), 100)
+
+
+class FacetChangeLogTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = make_product(category, 'shirt', price=20)
+        self.hat = make_product(category, 'hat', price=300)
+        self.index = facet_index()
+
+    def cheap(self):
+        return facet_index().query(price_range=(0, 49)).ids
+
+    def test_changes_are_patched_in(self):
+        self.assertEqual(self.cheap(), [self.shirt.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hat.price = 40
+            self.hat.save()
+        # the two queries of the changed product, no rebuild
+        with self.assertNumQueries(2):
+            self.assertEqual(self.cheap(), [self.shirt.id, self.hat.id])
+        with self.assertNumQueries(0):
+            facet_index()
+
+    def test_changes_logged_by_another_worker(self):
+        self.assertEqual(self.cheap(), [self.shirt.id])
+        Product.objects.filter(pk=self.shirt.pk).update(price=100)
+        FACET_LOG.append(self.shirt.pk)
+        self.assertEqual(self.cheap(), [])
+        Product.objects.filter(pk=self.hat.pk).update(price=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_changed()
+        self.assertEqual(self.cheap(), [self.hat.id])
+
+    def test_stock_only_writes_skip_the_index(self):
+        facet_index()
+        facets, catalog = FACET_LOG.position(), CATALOG_LOG.position()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.stock = 3
+            self.shirt.save(update_fields=['stock'])
+        self.assertEqual(FACET_LOG.position(), facets)
+        self.assertNotEqual(CATALOG_LOG.position(), catalog)
+
+
+def raw_cursor(payload):
+    # A cursor as a client could forge it
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+class TamperedCursorTests(TestCase):
+    bad_cursors = [
+        {'k': [1], 'b': False},
+        {'k': ['a', 'b'], 'b': False},
+        {'k': [[1], {}], 'b': True},
+        {'k': 'abc', 'b': False},
+        {'k': [], 'b': False},
+        {'k': [True, 1], 'b': False},
+    ]
+
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        for number in range(3):
+            make_product(category, 'shirt-%d' % number, price=100 + number)
+
+    def test_views_show_the_first_page(self):
+        for payload in self.bad_cursors:
+            cursor = raw_cursor(payload)
+            for url in ['/store/?sort=newest', '/store/?sort=price', '/store/?sort=price_desc',
+                        '/store/search/?keyword=shirt']:
+                response = self.client.get('%s&cursor=%s' % (url, cursor))
+                self.assertEqual(response.status_code, 200, (url, payload))
+                self.assertEqual(len(response.context['products']), 3, (url, payload))
+
+    def test_order_history_ignores_a_short_key(self):
+        user = make_user('buyer@example.com')
+        self.client.force_login(user)
+        for payload in self.bad_cursors + [{'k': ['not a date', 1], 'b': False}]:
+            response = self.client.get('/accounts/my_orders/', {'cursor': raw_cursor(payload)})
+            self.assertEqual(response.status_code, 200, payload)
+
+    def test_valid_keys(self):
+        fetch = sorted_fetcher([((100, 1), 'a'), ((101, 2), 'b')])
+        self.assertTrue(fetch.valid_key((100.5, 1)))
+        self.assertFalse(fetch.valid_key(('a', 1)))
+        fetch = queryset_fetcher(Product.objects.all(), ['-created_date', '-id'])
+        self.assertTrue(fetch.valid_key(('2026-10-18', 3)))
+        self.assertFalse(fetch.valid_key(('yesterday', 3)))
+        self.assertFalse(fetch.valid_key((3,)))
+        page = CursorPaginator(fetch, 2).page(raw_cursor({'k': ['x', 'y'], 'b': True}))
+        self.assertEqual(len(page), 2)
+        self.assertFalse(page.has_previous())
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.product = make_product(self.category, 'blue-shirt', price=100)
+
+    def card(self):
+        # A fresh row each time, like another request (or another worker) would read it
+        product = Product.objects.get(pk=self.product.pk)
+        return render_product_cards([product], 'includes/store_product_card.html')[0]
+
+    def test_price_change_renders_a_new_card(self):
+        self.assertIn('>100<', self.card())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 80
+            self.product.save()
+        self.assertIn('>80<', self.card())
+
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual(shared_cache_check(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([warning.id for warning in shared_cache_check(None)], ['store.W001'])
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        Category.objects.create(category_name='Shirts', slug='shirts')
+
+    def import_lines(self, lines, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write(''.join(line + '\n' for line in lines))
+        self.addCleanup(os.remove, f.name)
+        stderr = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', f.name, stdout=io.StringIO(), stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def row(self, slug='blue-shirt', **values):
+        row = {'slug': slug, 'category': 'shirts', 'product_name': slug.replace('-', ' ').capitalize(),
+               'price': 100, 'stock': 5, 'variations': [{'category': 'color', 'value': 'Blue'}]}
+        row.update(values)
+        return json.dumps(row)
+
+    def run_import(self, **values):
+        self.import_lines([self.row(**values)])
+        return Product.objects.get(slug='blue-shirt')
+
+    def test_update_sets_modified_date_and_expires_variations(self):
+        product = self.run_import()
+        Product.objects.filter(pk=product.pk).update(modified_date=datetime.date(2020, 1, 1))
+        self.assertEqual([v['variation_value'] for v in variation_matrix(product.id)['color']], ['Blue'])
+        product = self.run_import(price=90, variations=[{'category': 'color', 'value': 'Red'}])
+        self.assertEqual(product.price, 90)
+        self.assertNotEqual(product.modified_date, datetime.date(2020, 1, 1))
+        # Blue is no longer in the feed: disabled, not deleted, past order lines still point to it
+        self.assertEqual([v['variation_value'] for v in variation_matrix(product.id)['color']], ['Red'])
+        self.assertFalse(Variation.objects.get(product=product, variation_value='Blue').is_active)
+        product = self.run_import(variations=[{'category': 'color', 'value': 'blue'}])
+        self.assertEqual([v['variation_value'] for v in variation_matrix(product.id)['color']], ['Blue'])
+
+    def test_gallery_mirrors_the_feed(self):
+        product = self.run_import(gallery=['store/products/a.jpg', 'store/products/b.jpg'])
+        self.run_import(gallery=['store/products/b.jpg', 'store/products/c.jpg'])
+        self.assertEqual(sorted(ProductGallery.objects.filter(product=product).values_list('image', flat=True)),
+                         ['store/products/b.jpg', 'store/products/c.jpg'])
+        # A row without the key leaves the gallery and the variations alone
+        self.import_lines([json.dumps({'slug': 'blue-shirt', 'category': 'shirts', 'product_name': 'Blue shirt',
+                                       'price': 100, 'stock': 5})])
+        self.assertEqual(ProductGallery.objects.filter(product=product).count(), 2)
+        self.assertTrue(Variation.objects.get(product=product).is_active)
+
+    def test_bad_rows_are_skipped_and_reported(self):
+        Product.objects.create(slug='old-shirt', product_name='Taken', price=1, stock=1,
+                               category=Category.objects.get())
+        stderr = self.import_lines([
+            self.row('shirt-1'),
+            '{"slug": "broken",',
+            '[1, 2]',
+            self.row('shirt-2', price=-1),
+            self.row('shirt-3', product_name='Taken'),
+            self.row('shirt-4', product_name='Taken'),
+            self.row('shirt-5', category='hats'),
+            self.row('shirt-6', images='x' * 101),
+            self.row('shirt-7'),
+        ], batch_size=4)
+        # The other rows, in the batches before and after the bad ones, are imported
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['old-shirt', 'shirt-1', 'shirt-7'])
+        self.assertIn('Skipped 7 rows', stderr)
+        for line in range(2, 9):
+            self.assertIn('line %d ' % line, stderr)
+        self.assertIn('invalid JSON', stderr)
+        self.assertIn('product_name already used by old-shirt', stderr)
+        self.assertIn('product_name also used by shirt-3', stderr)
+
+    def test_database_error_only_loses_its_row(self):
+        # The batch is refused by the database, its rows are retried one by one
+        stderr = self.import_lines([self.row('shirt-1'), self.row('shirt-2'), self.row('shirt-3')])
+        self.assertEqual(stderr, '')
+        original = Product.objects.bulk_create
+
+        def bulk_create(objs, *args, **kwargs):
+            if any(product.slug == 'shirt-5' for product in objs):
+                raise IntegrityError('refused')
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(Product.objects, 'bulk_create', bulk_create):
+            stderr = self.import_lines([self.row('shirt-4'), self.row('shirt-5'), self.row('shirt-6')])
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertFalse(Product.objects.filter(slug='shirt-5').exists())
+        self.assertIn('line 2 (shirt-5): refused', stderr)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.a, self.b, self.c, self.d = [make_product(category, slug) for slug in 'abcd']
+        self.user = make_user('buyer@example.com')
+
+    def related(self):
+        return {(row.product_id, row.related_id): round(row.score, 6) for row in RelatedProduct.objects.all()}
+
+    def test_incremental_builds_match_a_full_build(self):
+        for products in [(self.a, self.b), (self.a, self.b), (self.b, self.c), (self.b, self.c)]:
+            make_order(self.user, products)
+        build()
+        self.assertEqual(set(self.related()), {(self.a.id, self.b.id), (self.b.id, self.a.id),
+                                               (self.b.id, self.c.id), (self.c.id, self.b.id)})
+        # New orders of b alone change the score of a and c too, though they are not in them
+        make_order(self.user, [self.b])
+        make_order(self.user, [self.b, self.d])
+        products, _ = build()
+        # b and d, plus the neighbours of b
+        self.assertEqual(products, 4)
+        incremental = self.related()
+        build(full=True)
+        self.assertEqual(incremental, self.related())
+        self.assertAlmostEqual(incremental[self.a.id, self.b.id], 2 / (2 * 6) ** 0.5, places=6)
+
+    def test_lines_committed_out_of_id_order_are_counted(self):
+        make_order(self.user, [self.a, self.b])
+        build()
+        # A checkout that got its ids before the build read higher ones, and committed after it
+        late = make_order(self.user, [self.a, self.b])
+        OrderProduct.objects.filter(order=late).update(id=-F('id'))
+        build()
+        self.assertEqual(list(CoPurchase.objects.values_list('orders', flat=True)), [2])
+        self.assertEqual(set(self.related()), {(self.a.id, self.b.id), (self.b.id, self.a.id)})
+        self.assertFalse(OrderProduct.objects.filter(co_purchase_counted=False).exists())
+
+
+class ProductUpdateApiTests(TestCase):
+    url = '/store/api/product_updates/'
+
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = make_product(category, 'shirt', price=100, stock=10)
+        self.hat = make_product(category, 'hat', price=50, stock=3)
+        self.user = make_user('erp@example.com')
+        self.user.is_admin = True
+        self.user.save()
+        # The ERP never has a CSRF token
+        self.client = self.client_class(enforce_csrf_checks=True)
+
+    def post(self, body, email='erp@example.com', password='secret'):
+        credentials = base64.b64encode(('%s:%s' % (email, password)).encode()).decode()
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, body if isinstance(body, str) else json.dumps(body),
+                                    content_type='application/json', HTTP_AUTHORIZATION='Basic ' + credentials)
+
+    def values(self):
+        return {slug: (price, stock) for slug, price, stock in Product.objects.values_list('slug', 'price', 'stock')}
+
+    def test_authentication(self):
+        self.assertEqual(self.post({'products': []}, password='wrong').status_code, 401)
+        self.assertEqual(self.client.post(self.url, '{}', content_type='application/json').status_code, 401)
+        make_user('staff@example.com')
+        self.assertEqual(self.post({'products': []}, email='staff@example.com').status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_values_and_deltas(self):
+        response = self.post({'products': [
+            {'sku': 'shirt', 'price': 90, 'stock': 10},
+            {'sku': 'hat', 'stock_delta': -2},
+            {'sku': 'scarf', 'stock': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 2, 'unchanged': 0, 'unknown': ['scarf']})
+        self.assertEqual(self.values(), {'shirt': (90, 10), 'hat': (50, 1)})
+        # A sale between the ERP's read and its sync is not overwritten by a delta
+        Product.objects.filter(slug='hat').update(stock=F('stock') - 1)
+        self.assertEqual(self.post({'products': [{'sku': 'hat', 'stock_delta': 5}]}).json()['updated'], 1)
+        self.assertEqual(self.values()['hat'], (50, 5))
+        self.assertEqual(self.post({'products': [{'sku': 'shirt', 'price': 90}]}).json(),
+                         {'updated': 0, 'unchanged': 1, 'unknown': []})
+
+    def test_invalid_rows_write_nothing(self):
+        for body, error in [
+            ('not json', 'invalid JSON'),
+            ({'rows': []}, 'expected {"products": [...]}'),
+            ({'products': [{'sku': 'shirt', 'price': 1}, {'sku': 'hat', 'stock': -1}]},
+             'row 1: stock must be an integer of 0 or more'),
+            ({'products': [{'sku': 'hat', 'stock': 1, 'stock_delta': 1}]}, 'row 0: give either stock or stock_delta'),
+            ({'products': [{'sku': 'shirt', 'price': 1}, {'sku': 'hat', 'stock_delta': -4}]},
+             'hat: stock_delta -4 would leave a stock of -1'),
+        ]:
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()['error'], error)
+        self.assertEqual(self.values(), {'shirt': (100, 10), 'hat': (50, 3)})
+
+
+class ProductAdminActionTests(TestCase):
+    url = '/admin/store/product/'
+
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.products = [make_product(category, slug, price=price) for slug, price in [('shirt', 100), ('hat', 50)]]
+        admin = Account.objects.create_superuser('Admin', 'User', 'admin@example.com', 'admin', 'secret')
+        self.client.force_login(admin)
+
+    def action(self, action, **values):
+        data = {'action': action, '_selected_action': [product.pk for product in self.products], **values}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data, follow=True)
+        self.assertEqual(response.status_code, 200)
+        return [str(message) for message in response.context['messages']]
+
+    def test_actions(self):
+        self.assertEqual(self.action('change_price_action', percent=10),
+                         ['Changed the price of 2 products by 10%.'])
+        self.assertEqual(sorted(Product.objects.values_list('price', flat=True)), [55, 110])
+        self.assertEqual(self.action('set_stock_action', stock=4), ['Set the stock of 2 products to 4.'])
+        self.assertEqual(self.action('make_unavailable_action'), ['2 products are now unavailable.'])
+        self.assertEqual(set(Product.objects.values_list('stock', 'is_available')), {(4, False)})
+
+    def test_missing_or_out_of_range_value(self):
+        self.assertEqual(self.action('set_stock_action'), ['Enter a stock next to the action.'])
+        self.assertEqual(self.action('change_price_action', percent=-100), ['percent must be at least -99'])
+        self.assertEqual(self.action('set_stock_action', stock=-1), ['stock can not be negative'])
+        self.assertEqual(sorted(Product.objects.values_list('price', 'stock')), [(50, 10), (100, 10)])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        isolate_change_logs(self)
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = make_product(self.category, 'blue-shirt', product_name='Blue shirt',
+                                  description='Soft cotton tee')
+        make_product(self.category, 'red-cap', product_name='Red cap', description='A shirt to match')
+
+    def search(self, keyword):
+        return [product.slug for product in search_paginator(keyword, 10).page(None)]
+
+    def test_index_follows_save_and_delete(self):
+        self.assertTrue(fts_enabled())
+        # A hit in the name ranks above a hit in the description
+        self.assertEqual(self.search('shirt'), ['blue-shirt', 'red-cap'])
+        self.assertEqual(self.search('cott'), ['blue-shirt'])
+        self.shirt.product_name = 'Blue polo'
+        self.shirt.description = 'Linen'
+        self.shirt.save()
+        self.assertEqual(self.search('cotton'), [])
+        self.assertEqual(self.search('polo'), ['blue-shirt'])
+        self.shirt.delete()
+        self.assertEqual(self.search('polo'), [])
+        Product.objects.filter(slug='red-cap').delete()
+        self.assertEqual(self.search('cap'), [])
+
+    def test_keyword_is_escaped(self):
+        self.assertEqual(match_expression('Blue "shirt'), '"blue" "shirt"*')
+        self.assertEqual(match_expression('red OR name:cap*'), '"red" "or" "name" "cap"*')
+        self.assertEqual(match_expression('NEAR(blue shirt)'), '"near" "blue" "shirt"*')
+        self.assertIsNone(match_expression('"*:()^-'))
+        self.assertIsNone(match_expression(None))
+        # FTS5 query syntax typed by a user is searched as words, never an error
+        for keyword in ['"', 'shirt OR', 'AND', 'product_name:blue', '(', '*', 'a - b', "'; DROP TABLE x"]:
+            response = self.client.get('/store/search/', {'keyword': keyword})
+            self.assertEqual(response.status_code, 200, keyword)
+        self.assertEqual(self.search('product_name:blue'), [])
+        self.assertEqual(self.search('blue (shirt'), ['blue-shirt'])
+
+    def test_icontains_fallback(self):
+        with mock.patch('store.search.fts_enabled', return_value=False):
+            # Any part of a word matches, newest first
+            self.assertEqual(self.search('hir'), ['red-cap', 'blue-shirt'])
+            self.assertEqual(self.search('COTTON'), ['blue-shirt'])
+            self.assertEqual(self.search(''), [])
+            self.assertEqual(self.client.get('/store/search/', {'keyword': 'cap'}).context['product_count'], 1)
+
+
+class CatalogFeedTests(TestCase):
+    url = '/store/feed/csv/'
+
+    def setUp(self):
+        isolate_change_logs(self)
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.products = [make_product(category, 'shirt-%d' % number) for number in range(2)]
+
+    def assertNotModified(self, etag, expected=True):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304 if expected else 200)
+        return response
+
+    def test_etag_follows_deletes_and_bulk_writes(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotModified(etag)
+        self.products[0].delete()
+        etag = self.assertNotModified(etag, False)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            set_available(Product.objects.all(), False)
+        self.assertNotModified(etag, False)
+
+    def test_head_is_allowed(self):
+        response = self.client.head(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.media = directory.name
+
+    def image(self, name, color):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', (400, 200), color).save(path)
+        return Product(images=name).images
+
+    def test_same_name_with_another_extension(self):
+        jpeg = renditions_for(self.image('photos/a.jpg', (255, 0, 0)))['renditions']['webp']
+        png = renditions_for(self.image('photos/a.png', (0, 0, 255)))['renditions']['webp']
+        self.assertEqual([width for _, width in png], [160, 320])
+        self.assertNotEqual(jpeg, png)
+        with Image.open(os.path.join(self.media, png[0][0])) as rendition:
+            red, _, blue = rendition.convert('RGB').getpixel((0, 0))
+        # The blue png, not the red jpeg written first under the same base name
+        self.assertGreater(blue, 200)
+        self.assertLess(red, 50)
+
+    def test_missing_original_is_remembered(self):
+        field_file = Product(images='photos/missing.jpg').images
+        self.assertIsNone(renditions_for(field_file))
+        # Not opened again while the failure is cached
+        self.image('photos/missing.jpg', (0, 255, 0))
+        self.assertIsNone(renditions_for(field_file))
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.store, name='store'),
@@ -10,5 +10,7 @@ urlpatterns = [
          views.product_detail, name='product_detail'),
     path('search/', views.search, name='search'),
     path('submit_review/<int:product_id>/',
-         views.submit_review, name='submit_review')
+         views.submit_review, name='submit_review'),
+    path('feed/<str:feed_format>/', views.catalog_feed, name='catalog_feed'),
+    path('api/product_updates/', api.product_updates, name='product_updates'),
 ]
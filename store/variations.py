@@ -0,0 +1,60 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+
+from store.models import Variation, variation_category_choice
+
+# Cached per product until one of its variations changes
+VARIATION_TIMEOUT = 60 * 60 * 24
+
+
+def _cache_key(product_id):
+    return 'store:variations:%d' % product_id
+
+
+def variation_matrix(product_id):
+    """Return the active variations of a product, loaded with one query and cached.
+
+    {'color': [{'id': 3, 'variation_value': 'Red'}, ...], 'size': [...],
+     'lookup': {('color', 'red'): 3, ...}}
+
+    The lists feed the selectors of the product page and `lookup` resolves
+    submitted values without touching the database.
+    """
+    key = _cache_key(product_id)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = {category: [] for category, _ in variation_category_choice}
+        matrix['lookup'] = {}
+        rows = Variation.objects.filter(product_id=product_id, is_active=True).order_by('id').values_list(
+            'id', 'variation_category', 'variation_value')
+        for variation_id, category, value in rows:
+            matrix[category].append({'id': variation_id, 'variation_value': value})
+            # Same rule as the old variation_category__iexact / variation_value__iexact lookup, first match wins
+            matrix['lookup'].setdefault((category.lower(), value.lower()), variation_id)
+        cache.set(key, matrix, VARIATION_TIMEOUT)
+    return matrix
+
+
+def resolve_variations(product_id, data):
+    # Sorted ids of the variations picked in a submitted form, fields that are not
+    # variations (csrfmiddlewaretoken, quantity...) are ignored
+    lookup = variation_matrix(product_id)['lookup']
+    ids = []
+    for key, value in data.items():
+        variation_id = lookup.get((key.lower(), str(value).lower()))
+        if variation_id is not None:
+            ids.append(variation_id)
+    return sorted(ids)
+
+
+def variation_signature(variation_ids):
+    # Canonical key of a set of variations, stored on CartItem and OrderProduct so a
+    # line is matched with an indexed lookup instead of comparing the M2M rows
+    canonical = ','.join(str(variation_id) for variation_id in sorted(set(variation_ids)))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def variations_changed(product_id):
+    transaction.on_commit(lambda: cache.delete(_cache_key(product_id)))
@@ -0,0 +1,146 @@
+import os
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# A change log is started over past this size
+MAX_LOG_SIZE = 1024 * 1024
+
+
+def new_version():
+    # Versions are only compared for equality. A random token is never reused, and two
+    # workers bumping at the same time can not lose a change the way a read-modify-write
+    # increment can (cache.incr is a get and a set on the database cache)
+    return uuid.uuid4().hex
+
+
+def get_versions(keys):
+    """Return {key: version} for the version keys, read in one round trip.
+
+    A missing key (never bumped, or evicted) gets a new token, so it never
+    matches a version something was cached under before.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = new_version()
+            # add() keeps the token of a worker that got there first
+            cache.add(key, version, timeout=None)
+            versions[key] = cache.get(key, version)
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def versions_changed(*keys):
+    # After commit, so no worker caches the old rows under the new version
+    transaction.on_commit(lambda: cache.set_many({key: new_version() for key in keys}, timeout=None))
+
+
+class LogPosition(namedtuple('LogPosition', 'generation offset stat')):
+    """Where a reader of a ChangeLog is: the file generation, the offset read
+    up to, and the stat() of the file at that point for the quick check."""
+
+
+class ChangeLog:
+    """Append-only file of changes, for data every worker keeps a copy of in memory.
+
+    Writers append one line per change after their transaction commits.
+    A reader remembers the position it read up to and compares it with a
+    stat() of the file on every request, so checking costs no query and no
+    cache round trip; only the lines appended since are read. The file lives
+    in settings.CHANGE_LOG_DIR, which every worker must share.
+
+    Every file starts with a random generation line: a rotated log, or one
+    created again after being deleted, can get the inode and the size of an
+    old one back, never its generation.
+    """
+
+    # A reset marker line: the readers reload everything
+    RESET = '*'
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def path(self):
+        return os.path.join(settings.CHANGE_LOG_DIR, '%s.log' % self.name)
+
+    def _new_file(self, replace):
+        # The generation line is written before the file appears under its name
+        os.makedirs(settings.CHANGE_LOG_DIR, exist_ok=True)
+        tmp = '%s.%s' % (self.path, new_version())
+        with open(tmp, 'wb') as f:
+            f.write(b'#%s\n' % new_version().encode())
+        if replace:
+            os.replace(tmp, self.path)
+            return
+        try:
+            # link() fails when another worker created the file first, keep theirs
+            os.link(tmp, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+
+    def append(self, *lines):
+        if not os.path.exists(self.path):
+            self._new_file(replace=False)
+        data = ''.join('%s\n' % line for line in lines).encode()
+        # One write() on a file opened for appending: lines of concurrent writers never interleave
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            size = f.tell()
+        if size > MAX_LOG_SIZE:
+            # Readers see another generation and reload everything, the old lines are not needed
+            self._new_file(replace=True)
+
+    def changed(self, *lines):
+        # After commit, so a reader that sees the line also sees the data
+        transaction.on_commit(lambda: self.append(*lines))
+
+    def _stat(self):
+        path = self.path
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return path, None
+        return path, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def read(self, since):
+        """Return (position, lines appended after the position `since`).
+
+        lines is None when the reader has to reload everything: first call,
+        another generation of the file, or a reset line. The position is
+        taken before the lines are returned, so a reload started after this
+        call sees every change the position covers.
+        """
+        stat = self._stat()
+        if since is not None and stat == since.stat:
+            return since, []
+        try:
+            with open(self.path, 'rb') as f:
+                generation = f.readline()
+                if since is None or generation != since.generation:
+                    return LogPosition(generation, os.fstat(f.fileno()).st_size, stat), None
+                f.seek(since.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return LogPosition(None, 0, stat), None
+        # A line still being written is read on the next call
+        data = data[:data.rfind(b'\n') + 1]
+        position = LogPosition(generation, since.offset + len(data), stat)
+        lines = data.decode().split()
+        if self.RESET in lines:
+            return position, None
+        return position, lines
+
+    def position(self):
+        # Moves after every append, for validators such as an ETag
+        position, _ = self.read(None)
+        return position.generation, position.offset
@@ -1,17 +1,22 @@
 # Imports for fetching objects and rendering templates
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect, render
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
 from django.contrib import messages
+from django.views.decorators.http import condition, require_safe
 
 from carts.models import CartItem
-from carts.views import _cart_id
-from category.models import Category  # Importing Category model
+from category.menu import category_menu
 from orders.models import OrderProduct
+from store.cards import render_product_cards
+from store.facets import facet_index
+from store.feeds import FEED_CONTENT_TYPES, FEED_WRITERS, feed_etag, feed_rows
 from store.forms import ReviewForm
 # Importing Product model
-from store.models import Product, ProductGallery, ReviewRating, Variation
+from store.models import Product, ProductGallery, ReviewRating
+from store.pagination import CursorPaginator, page_url, sorted_fetcher
+from store.recommendations import related_products
+from store.search import search_paginator
+from store.variations import variation_matrix
 
 
 # def store(request, category_slug=None):  # View function, accepts request and optional category_slug
@@ -84,43 +89,73 @@ from store.models import Product, ProductGallery, ReviewRating, Variation
 #     return render(request, 'store/store.html', context)
 
 
-def store(request, category_slug=None):
-    categories = Category.objects.all()
-    products = Product.objects.filter(is_available=True)
+# Sort orders of the store listing, see FacetIndex.sort_keys
+SORT_OPTIONS = {
+    'newest': 'Newest',
+    'price': 'Price: low to high',
+    'price_desc': 'Price: high to low',
+}
+
+
+def _sort_links(request, current):
+    # (label, url, active) for each sort order, changing the order starts again from the first page
+    links = []
+    for sort, label in SORT_OPTIONS.items():
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        params['sort'] = sort
+        links.append((label, '?' + params.urlencode(), sort == current))
+    return links
+
 
-    # If a category_slug is provided, filter products by that category
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
+def _price_range(min_price, max_price):
+    # Both bounds are needed, values that are not numbers are ignored
+    try:
+        return int(min_price), int(max_price)
+    except (TypeError, ValueError):
+        return None
+
+
+def store(request, category_slug=None):
+    # Same per-process list as the navbar menu, checked with a stat() of its change log
+    categories = category_menu()
 
     # Get selected categories and sizes from the request
     selected_categories = request.GET.getlist('categories')
     sizes = request.GET.getlist('sizes')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
-    dbsizes = Variation.objects.filter(
-        variation_category='size', is_active=True)
 
-    # Filter products based on selected categories
-    if selected_categories:
-        products = products.filter(category__slug__in=selected_categories)
-
-    # Apply size filter if sizes are selected
-    if sizes:
-        products = products.filter(variation__variation_value__in=sizes)
-
-    # Apply price range filter if specified
-    if min_price and max_price:
-        products = products.filter(price__gte=min_price, price__lte=max_price)
-
-    # Paginator code
-    paginator = Paginator(products, 6)
-    page = request.GET.get('page')
-    paged_products = paginator.get_page(page)
+    # The facet index answers the filters and the sidebar counts in one pass, see store/facets.py
+    index = facet_index()
+    facets = index.query(
+        category_slug=category_slug,
+        categories=selected_categories,
+        sizes=sizes,
+        price_range=_price_range(min_price, max_price),
+    )
+
+    # Keyset pagination over the matching ids, deep pages cost the same as the first one
+    sort = request.GET.get('sort', 'newest')
+    if sort not in SORT_OPTIONS:
+        sort = 'newest'
+    paginator = CursorPaginator(sorted_fetcher(index.sort_keys(facets.ids, sort)), 6, count=len(facets.ids))
+    paged_products = paginator.page(request.GET.get('cursor'))
+    # Only the products of the current page are loaded
+    products = Product.objects.select_related('category').in_bulk(paged_products.object_list)
+    paged_products.object_list = [products[pk] for pk in paged_products.object_list if pk in products]
 
     context = {
         'products': paged_products,
-        'product_count': products.count(),
-        'dbsizes': dbsizes,
+        # cached HTML of the product cards, see store/cards.py
+        'product_cards': render_product_cards(paged_products, 'includes/store_product_card.html'),
+        'product_count': paged_products.count,
+        'next_url': page_url(request, paged_products.next_cursor),
+        'previous_url': page_url(request, paged_products.previous_cursor),
+        'sort_links': _sort_links(request, sort),
+        'category_facets': [(category, facets.category_counts.get(category.slug, 0)) for category in categories],
+        'size_facets': list(facets.size_counts.items()),
+        'price_facets': facets.price_counts,
         'categories': categories,
         'selected_categories': selected_categories,
         'sizes': sizes,
@@ -137,9 +172,11 @@ def product_detail(request, category_slug, product_slug):
         # next argument slug means Prodcut model slug field matching recieved product_slug as url request
         single_product = Product.objects.get(
             category__slug=category_slug, slug=product_slug)
-        # Here checking that this product is already in cartitems
-        in_cart = CartItem.objects.filter(
-            cart__cart_id=_cart_id(request), product=single_product).exists()
+        # Here checking that this product is already in cartitems,
+        # a visitor without a session has no cart so no session is created for them
+        session_key = request.session.session_key
+        in_cart = bool(session_key) and CartItem.objects.filter(
+            cart__cart_id=session_key, product=single_product).exists()
     except Exception as e:
         raise e
 
@@ -153,9 +190,9 @@ def product_detail(request, category_slug, product_slug):
     else:
         orderproduct = None
 
-    # Get the reviews
+    # Get the reviews, the author is loaded with the same query for the review list
     reviews = ReviewRating.objects.filter(
-        product_id=single_product.id, status=True)
+        product_id=single_product.id, status=True).select_related('user')
 
     # Get the product Gallery
     product_gallery = ProductGallery.objects.filter(
@@ -163,25 +200,36 @@ def product_detail(request, category_slug, product_slug):
 
     context = {
         'single_product': single_product,
+        # cached color and size options, see store/variations.py
+        'variations': variation_matrix(single_product.id),
         'in_cart': in_cart,
         'orderproduct': orderproduct,
         'reviews': reviews,
-        'reviews_count': reviews.count(),
+        # stored on the product row, kept in sync by the ReviewRating signals
+        'reviews_count': single_product.review_count,
         'product_gallery': product_gallery,
+        # "frequently bought together", precomputed by build_recommendations
+        'related_cards': render_product_cards(
+            related_products([single_product.id]), 'includes/product_card.html'),
     }
 
     return render(request, 'store/product_detail.html', context)
 
 
 def search(request):
-    if 'keyword' in request.GET:  # first we checking if there is any keyword
-        keyword = request.GET['keyword']  # then taking that keyword
-        if keyword:
-            products = Product.objects.order_by(
-                '-created_date').filter(Q(description__icontains=keyword) | Q(product_name__icontains=keyword))
+    # A missing or empty keyword gives an empty result without querying the products
+    keyword = request.GET.get('keyword', '').strip()
+
+    # Ranked results are read one page at a time through an opaque cursor
+    paged_products = search_paginator(keyword, 6).page(request.GET.get('cursor'))
+
     context = {
-        'products': products,
-        'product_count': products.count(),  # using product count function we get count
+        'products': paged_products,
+        'product_cards': render_product_cards(paged_products, 'includes/store_product_card.html'),
+        'product_count': paged_products.count,
+        'next_url': page_url(request, paged_products.next_cursor),
+        'previous_url': page_url(request, paged_products.previous_cursor),
+        'keyword': keyword,
     }
     return render(request, 'store/store.html', context)
 
@@ -219,3 +267,17 @@ def submit_review(request, product_id):
                 messages.success(
                     request, 'Thank you! Your review has been submitted')
                 return redirect(url)
+
+
+# Product feed for marketplaces and ad platforms, streamed straight from the database cursor.
+# The condition decorator answers If-None-Match with a 304 when the catalog did not change.
+@require_safe
+@condition(etag_func=lambda request, feed_format: feed_etag())
+def catalog_feed(request, feed_format):
+    if feed_format not in FEED_WRITERS:
+        raise Http404
+    rows = feed_rows(request.build_absolute_uri('/'))
+    response = StreamingHttpResponse(
+        FEED_WRITERS[feed_format](rows), content_type=FEED_CONTENT_TYPES[feed_format])
+    response['Content-Disposition'] = 'inline; filename="catalog.%s"' % feed_format
+    return response
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from taskqueue.queue import claim, heartbeat, requeue_stale, run
+
+
+def _run_in_thread(task_row):
+    # Every thread has its own database connection, close it when the task is done
+    try:
+        return run(task_row)
+    finally:
+        connection.close()
+
+
+class Heartbeat(threading.Thread):
+    """Refreshes the claims of the tasks being run every `interval` seconds.
+
+    Without it a task running longer than --stale-after, an email to a slow
+    SMTP server, would be queued again by another worker and sent twice.
+    """
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        # Claim tokens of the batch being run
+        self.tokens = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            tokens = self.tokens
+            if not tokens:
+                continue
+            try:
+                heartbeat(tokens)
+            except DatabaseError:
+                # Tried again at the next beat, well before the tasks are stale
+                pass
+            finally:
+                connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run the queued background tasks (emails...) with a pool of threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Tasks run at the same time')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Seconds without a heartbeat after which a running task of a dead worker '
+                                 'is queued again')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the tasks that are due and exit')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        counts = {}
+        # Several beats per --stale-after, a late one does not make the tasks stale
+        beat = Heartbeat(options['stale_after'] / 4)
+        beat.start()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            while True:
+                close_old_connections()
+                requeue_stale(options['stale_after'])
+                batch = claim(threads * 2)
+                beat.tokens = sorted({task_row.claimed_by for task_row in batch})
+                for task_row, status in zip(batch, pool.map(_run_in_thread, batch)):
+                    counts[status] = counts.get(status, 0) + 1
+                    self.stdout.write('%s %s' % (task_row, status))
+                beat.tokens = []
+                if not batch:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+        beat.stopped.set()
+        self.stdout.write(self.style.SUCCESS('Worker stopped: %s' % (
+            ', '.join('%d %s' % (count, status) for status, count in sorted(counts.items())) or 'no tasks')))
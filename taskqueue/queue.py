@@ -0,0 +1,91 @@
+import datetime
+import traceback
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+# Seconds before the first retry, doubled after every failed attempt up to MAX_BACKOFF
+BASE_BACKOFF = 30
+MAX_BACKOFF = 60 * 60
+
+
+def task(func=None, max_attempts=5):
+    """Mark a function as runnable by the worker and give it a .delay(**kwargs).
+
+    The arguments are stored as JSON in the Task row, so they must be plain
+    values (strings, numbers, lists, dicts), never model instances.
+    """
+    def decorate(func):
+        name = '%s.%s' % (func.__module__, func.__name__)
+        func.is_task = True
+        func.delay = lambda **kwargs: enqueue(name, kwargs, max_attempts=max_attempts)
+        return func
+    if func is not None:
+        return decorate(func)
+    return decorate
+
+
+def enqueue(name, payload, run_at=None, max_attempts=5):
+    # Inside a transaction the row, and so the task, only exists once the transaction commits
+    return Task.objects.create(
+        name=name, payload=payload, run_at=run_at or timezone.now(), max_attempts=max_attempts)
+
+
+def claim(limit):
+    """Mark up to `limit` due tasks as running for this worker and return them.
+
+    The conditional UPDATE is the lock: two workers can select the same ids
+    but only one of them switches a row from queued to running.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = list(Task.objects.filter(status=Task.QUEUED, run_at__lte=now)
+               .order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+    if not due:
+        return []
+    Task.objects.filter(id__in=due, status=Task.QUEUED).update(
+        status=Task.RUNNING, claimed_by=token, claimed_at=now)
+    return list(Task.objects.filter(claimed_by=token, status=Task.RUNNING).order_by('run_at', 'id'))
+
+
+def backoff(attempts):
+    return min(BASE_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def run(task_row):
+    # Run one claimed task and record the outcome, returns the new status
+    task_row.attempts += 1
+    try:
+        func = import_string(task_row.name)
+        if not getattr(func, 'is_task', False):
+            raise ImportError('%s is not a task' % task_row.name)
+        with transaction.atomic():
+            func(**task_row.payload)
+    except Exception:
+        task_row.last_error = traceback.format_exc()
+        if task_row.attempts >= task_row.max_attempts:
+            task_row.status = Task.FAILED
+        else:
+            task_row.status = Task.QUEUED
+            task_row.run_at = timezone.now() + datetime.timedelta(seconds=backoff(task_row.attempts))
+    else:
+        task_row.status = Task.DONE
+        task_row.last_error = ''
+    task_row.save(update_fields=['attempts', 'status', 'run_at', 'last_error', 'updated_at'])
+    return task_row.status
+
+
+def heartbeat(tokens):
+    # The worker that made these claims is alive: move claimed_at forward so
+    # requeue_stale leaves its tasks alone however long they run
+    return Task.objects.filter(claimed_by__in=tokens, status=Task.RUNNING).update(claimed_at=timezone.now())
+
+
+def requeue_stale(seconds):
+    # Tasks claimed by a worker that died, its heartbeat stopped, are given back to the queue
+    cutoff = timezone.now() - datetime.timedelta(seconds=seconds)
+    return Task.objects.filter(status=Task.RUNNING, claimed_at__lt=cutoff).update(status=Task.QUEUED)
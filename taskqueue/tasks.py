@@ -0,0 +1,11 @@
+from django.core.mail import EmailMessage
+
+from .queue import task
+
+
+@task(max_attempts=8)
+def send_email(subject, body, to, content_subtype='plain'):
+    # A failure raises, the worker retries it later with a growing delay
+    message = EmailMessage(subject, body, to=to)
+    message.content_subtype = content_subtype
+    message.send()
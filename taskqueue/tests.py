@@ -0,0 +1,76 @@
+import datetime
+import io
+import time
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from taskqueue.models import Task
+from taskqueue.management.commands.run_worker import Heartbeat
+from taskqueue.queue import claim, enqueue, requeue_stale
+from taskqueue.tasks import send_email
+
+
+class RunWorkerTests(TransactionTestCase):
+    # The worker runs the tasks in threads with their own connections, so the
+    # rows must be committed: no TestCase transaction around the test
+
+    def run_worker(self):
+        out = io.StringIO()
+        call_command('run_worker', '--once', '--threads', '2', stdout=out)
+        return out.getvalue()
+
+    def test_queued_email_is_sent(self):
+        send_email.delay(subject='Thank You for Your order', body='<p>Order 42</p>', to=['buyer@example.com'],
+                         content_subtype='html')
+        self.assertEqual(mail.outbox, [])
+
+        self.assertIn('1 done', self.run_worker())
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual((message.subject, message.to, message.body, message.content_subtype),
+                         ('Thank You for Your order', ['buyer@example.com'], '<p>Order 42</p>', 'html'))
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+        # Nothing is due any more, a second run sends nothing
+        self.assertIn('no tasks', self.run_worker())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_task_is_retried_later(self):
+        enqueue('taskqueue.tasks.missing', {})
+        self.run_worker()
+        task_row = Task.objects.get()
+        self.assertEqual((task_row.status, task_row.attempts), (Task.QUEUED, 1))
+        self.assertIn('ImportError', task_row.last_error)
+        self.assertGreater(task_row.run_at, timezone.now())
+
+
+class StaleTaskTests(TransactionTestCase):
+    def claim_long_ago(self):
+        send_email.delay(subject='Order', body='Order 42', to=['buyer@example.com'])
+        task_row, = claim(1)
+        Task.objects.update(claimed_at=timezone.now() - datetime.timedelta(minutes=20))
+        return task_row
+
+    def test_task_of_a_dead_worker_is_queued_again(self):
+        self.claim_long_ago()
+        self.assertEqual(requeue_stale(600), 1)
+        self.assertEqual(Task.objects.get().status, Task.QUEUED)
+
+    def test_long_running_task_keeps_its_claim(self):
+        task_row = self.claim_long_ago()
+        beat = Heartbeat(0.01)
+        beat.tokens = [task_row.claimed_by]
+        beat.start()
+        try:
+            deadline = time.monotonic() + 5
+            while Task.objects.get().claimed_at < timezone.now() - datetime.timedelta(minutes=1):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        finally:
+            beat.stopped.set()
+            beat.join()
+        self.assertEqual(requeue_stale(600), 0)
+        self.assertEqual(Task.objects.get().status, Task.RUNNING)